@@ -1,3 +1,4 @@
+import itertools
 import json
 import logging
 import os
@@ -5,7 +6,9 @@ import re
 
 import pandas as pd
 import requests
+from api.spreadsheets import SpreadsheetReader
 from django.apps import apps
+from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -147,77 +150,82 @@ def process_excel_with_ai(file_path, model_name):
         dict: Результат обработки
     """
     try:
-        # Читаем Excel файл
-        df = pd.read_excel(file_path)
-
-        # Анализируем структуру
-        analysis_result = analyze_data_with_ai(df, model_name)
-
-        if analysis_result["status"] == "error":
-            return analysis_result
-
-        # Получаем модель Django
-        model = apps.get_model("api", model_name)
-
-        # Обрабатываем каждую строку
-        processed_count = 0
-        updated_count = 0
-        created_count = 0
-        errors = []
-
-        for index, row in df.iterrows():
-            try:
-                data = {}
-                for col, field in analysis_result["result"]["mappings"].items():
-                    if col in row and pd.notna(row[col]):
-                        data[field] = row[col]
-
-                instance = None
-                if "id" in data:
-                    instance = model.objects.filter(id=data["id"]).first()
-
-                if instance:
-                    for field, value in data.items():
-                        setattr(instance, field, value)
-                    instance.save()
-                    updated_count += 1
-                else:
-                    instance = model.objects.create(**data)
-                    created_count += 1
-
-                # --- Новый блок: обработка контактов ---
-                contact_model = None
-                try:
-                    contact_model = apps.get_model("api", f"{model_name}Contact")
-                except Exception:
-                    pass
-                if contact_model:
-                    # Явно перебираем все колонки с 'контакт' в названии
-                    for col in row.index:
-                        if "контакт" in col.lower() and pd.notna(row[col]):
-                            logging.info(f"[IMPORT] Парсим контакты из колонки '{col}': {row[col]}")
-                            contacts = parse_contacts(row[col])
-                            for contact in contacts:
-                                logging.info(f"[IMPORT] Сохраняем контакт: {contact}")
-                                contact_model.objects.create(
-                                    **{f"{model_name.lower()}_id": instance.id},
-                                    contact_type=contact["type"],
-                                    value=contact["value"],
-                                )
-                # --- Новый блок: обработка менеджера ---
-                manager_col = None
-                for col in row.index:
-                    if "менеджер" in col.lower():
-                        manager_col = col
-                        break
-                if manager_col and pd.notna(row[manager_col]):
-                    if hasattr(instance, "manager_name"):
-                        instance.manager_name = row[manager_col]
-                        instance.save()
-
-                processed_count += 1
-            except Exception as e:
-                errors.append(f"Ошибка в строке {index + 2}: {str(e)}")
+        # Читаем файл потоково, пачками строк: в памяти только текущая пачка
+        with open(file_path, "rb") as file, SpreadsheetReader(file, file_path) as reader:
+            batches = reader.iter_batches(settings.IMPORT_JOB_CHUNK_ROWS)
+            first = next(batches, None)
+            sample = first.frame if first is not None else pd.DataFrame(columns=reader.header)
+
+            # Анализируем структуру по первой пачке, не дожидаясь чтения всего файла
+            analysis_result = analyze_data_with_ai(sample.infer_objects(), model_name)
+
+            if analysis_result["status"] == "error":
+                return analysis_result
+
+            # Получаем модель Django
+            model = apps.get_model("api", model_name)
+
+            # Обрабатываем каждую строку
+            processed_count = 0
+            updated_count = 0
+            created_count = 0
+            errors = []
+
+            for batch in itertools.chain([first] if first is not None else [], batches):
+                # Индекс пачки - номер строки в файле
+                for index, row in batch.frame.iterrows():
+                    try:
+                        data = {}
+                        for col, field in analysis_result["result"]["mappings"].items():
+                            if col in row and pd.notna(row[col]):
+                                data[field] = row[col]
+
+                        instance = None
+                        if "id" in data:
+                            instance = model.objects.filter(id=data["id"]).first()
+
+                        if instance:
+                            for field, value in data.items():
+                                setattr(instance, field, value)
+                            instance.save()
+                            updated_count += 1
+                        else:
+                            instance = model.objects.create(**data)
+                            created_count += 1
+
+                        # --- Новый блок: обработка контактов ---
+                        contact_model = None
+                        try:
+                            contact_model = apps.get_model("api", f"{model_name}Contact")
+                        except Exception:
+                            pass
+                        if contact_model:
+                            # Явно перебираем все колонки с 'контакт' в названии
+                            for col in row.index:
+                                if "контакт" in col.lower() and pd.notna(row[col]):
+                                    logging.info(f"[IMPORT] Парсим контакты из колонки '{col}': {row[col]}")
+                                    contacts = parse_contacts(row[col])
+                                    for contact in contacts:
+                                        logging.info(f"[IMPORT] Сохраняем контакт: {contact}")
+                                        contact_model.objects.create(
+                                            **{f"{model_name.lower()}_id": instance.id},
+                                            contact_type=contact["type"],
+                                            value=contact["value"],
+                                        )
+                        # --- Новый блок: обработка менеджера ---
+                        manager_col = None
+                        for col in row.index:
+                            if "менеджер" in col.lower():
+                                manager_col = col
+                                break
+                        if manager_col and pd.notna(row[manager_col]):
+                            if hasattr(instance, "manager_name"):
+                                instance.manager_name = row[manager_col]
+                                instance.save()
+
+                        processed_count += 1
+                    except Exception as e:
+                        errors.append(f"Ошибка в строке {index}: {str(e)}")
 
         return {
             "status": "success",
@@ -8,6 +8,7 @@ from .models import (
     ClientContact,
     CustomUser,
     Document,
+    ExchangeRate,
     Invoice,
     Notification,
     Order,
@@ -104,4 +105,11 @@ class UserActionLogAdmin(admin.ModelAdmin):
     search_fields = ("user__email", "action", "model_name")
 
 
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ("date", "currency", "rate")
+    list_filter = ("currency",)
+    date_hierarchy = "date"
+
+
 admin.site.register(Vehicle)
@@ -6,5 +6,5 @@ class ApiConfig(AppConfig):
     name = "api"
 
     def ready(self):
-        # Импортируем модели здесь, чтобы зарегистрировать сигналы
-        pass
+        # Импортируем модуль сигналов, чтобы зарегистрировать обработчики
+        from . import signals  # noqa: F401
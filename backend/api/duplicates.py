@@ -0,0 +1,169 @@
+"""Поиск дубликатов клиентов и перевозчиков.
+
+DuplicateIndex строится один раз (два запроса: записи и их контакты) и держит
+в памяти словари по точным ключам - УНП/УНН/ОКПО, нормализованное
+наименование, телефоны и email контактов. Проверка строки импорта - несколько
+поисков в словаре вместо запросов к БД на каждую строку.
+
+Похожие наименования (опечатки вида "Белтранслогистик" / "Белтранслогистк")
+сравниваются нечетко, но только внутри блока - записей с теми же первыми
+NAME_BLOCK_LENGTH символами нормализованного наименования, поэтому опечатка
+в начале названия не находится. Блок хранится отсортированным, и каждое
+наименование сравнивается только с NAME_WINDOW соседями по алфавиту: на
+распространенном начале ("транс...") блок может содержать тысячи записей,
+а попарное сравнение всех со всеми было бы квадратичным.
+"""
+
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+# Поля с регистрационными кодами, если они есть у модели
+CODE_FIELDS = ("unp", "unn", "okpo")
+NAME_BLOCK_LENGTH = 3
+NAME_WINDOW = 50  # Со сколькими соседями по алфавиту внутри блока сравнивается наименование
+
+MATCH_REASONS = {
+    "unp": "УНП",
+    "unn": "УНН",
+    "okpo": "ОКПО",
+    "phone": "телефон",
+    "email": "email",
+    "name": "наименование",
+    "similar": "похожее наименование",
+}
+
+# Организационно-правовые формы не отличают одну компанию от другой
+LEGAL_FORMS = set("ооо оао зао одо ао пао уп чуп чтуп чп ип тоо llc ltd inc gmbh sp z o".split())
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+
+def normalize_company_name(name: Optional[str]) -> str:
+    """Наименование для сравнения: нижний регистр, без кавычек, знаков и формы собственности."""
+    words = NON_WORD_RE.sub(" ", (name or "").lower().replace("ё", "е")).split()
+    return " ".join(word for word in words if word not in LEGAL_FORMS)
+
+
+def names_similar(first: str, second: str) -> bool:
+    threshold = settings.DUPLICATE_NAME_SIMILARITY
+    matcher = SequenceMatcher(None, first, second)
+    # quick_ratio - верхняя оценка ratio, дешевле полного сравнения
+    return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def _block_name(item: Tuple[str, Hashable]) -> str:
+    return item[0]
+
+
+class DuplicateIndex:
+    """Индекс записей по ключам, по которым две записи считаются одной компанией.
+
+    Ссылка на запись (ref) - ее id, либо любое другое значение для записей,
+    которых еще нет в БД (например, ("row", N) для строки файла импорта).
+    """
+
+    def __init__(self, code_fields: Iterable[str] = ()):
+        self.code_fields = list(code_fields)
+        self.keys: Dict[Tuple[str, str], List[Hashable]] = defaultdict(list)
+        self.blocks: Dict[str, List[Tuple[str, Hashable]]] = defaultdict(list)
+        self.names: Dict[Hashable, str] = {}
+
+    @classmethod
+    def build(cls, spec) -> "DuplicateIndex":
+        """Индекс всех записей модели импорта ``spec`` и их контактов."""
+        model_fields = {field.name for field in spec.model._meta.fields}
+        index = cls(field for field in CODE_FIELDS if field in model_fields)
+        records = spec.model.objects.values_list("pk", "company_name", *index.code_fields)
+        for pk, name, *codes in records.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            index.add(pk, name, dict(zip(index.code_fields, codes)))
+        contacts = spec.contact_model.objects.values_list(f"{spec.contact_fk}_id", "phone", "email")
+        for ref, phone, email in contacts.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            index.add_contacts(ref, [phone], [email])
+        return index
+
+    def _exact_keys(self, codes: Optional[Dict] = None, phones: Iterable = (), emails: Iterable = ()):
+        for field in self.code_fields:
+            value = str((codes or {}).get(field) or "").strip()
+            if value:
+                yield field, value
+        for phone in phones:
+            if phone:
+                yield "phone", phone
+        for email in emails:
+            if email:
+                yield "email", email.strip().lower()
+
+    def add(self, ref: Hashable, name: Optional[str], codes: Optional[Dict] = None, phones=(), emails=()) -> None:
+        self.names[ref] = name or ""
+        for key in self._exact_keys(codes, phones, emails):
+            self.keys[key].append(ref)
+        normalized = normalize_company_name(name)
+        if normalized:
+            self.keys["name", normalized].append(ref)
+            insort(self.blocks[normalized[:NAME_BLOCK_LENGTH]], (normalized, ref), key=_block_name)
+
+    def add_contacts(self, ref: Hashable, phones=(), emails=()) -> None:
+        for key in self._exact_keys(phones=phones, emails=emails):
+            self.keys[key].append(ref)
+
+    def knows(self, phones=(), emails=()) -> bool:
+        return any(key in self.keys for key in self._exact_keys(phones=phones, emails=emails))
+
+    def match(
+        self, name: Optional[str], codes: Optional[Dict] = None, phones=(), emails=()
+    ) -> Optional[Tuple[Hashable, str]]:
+        """Первая найденная запись-дубликат и причина совпадения, либо None."""
+        for key in self._exact_keys(codes, phones, emails):
+            if key in self.keys:
+                return self.keys[key][0], MATCH_REASONS[key[0]]
+        normalized = normalize_company_name(name)
+        if not normalized:
+            return None
+        if ("name", normalized) in self.keys:
+            return self.keys["name", normalized][0], MATCH_REASONS["name"]
+        block = self.blocks.get(normalized[:NAME_BLOCK_LENGTH], [])
+        position = bisect_left(block, normalized, key=_block_name)
+        for candidate, ref in block[max(position - NAME_WINDOW, 0) : position + NAME_WINDOW]:
+            if names_similar(normalized, candidate):
+                return ref, MATCH_REASONS["similar"]
+        return None
+
+    def possible_duplicates(self) -> List[Dict]:
+        """Группы записей, которые похожи на одну компанию, с причинами совпадения."""
+        parent = {ref: ref for ref in self.names}
+
+        def find(ref):
+            while parent[ref] != ref:
+                parent[ref] = parent[parent[ref]]
+                ref = parent[ref]
+            return ref
+
+        links = []
+        for (kind, _value), refs in self.keys.items():
+            links.extend((refs[0], ref, MATCH_REASONS[kind]) for ref in refs[1:] if ref != refs[0])
+        for block in self.blocks.values():
+            for position, (name, ref) in enumerate(block):
+                for other_name, other in block[position + 1 : position + 1 + NAME_WINDOW]:
+                    if name != other_name and names_similar(name, other_name):
+                        links.append((ref, other, MATCH_REASONS["similar"]))
+        for first, second, _reason in links:
+            parent[find(first)] = find(second)
+
+        groups = defaultdict(set)
+        reasons = defaultdict(set)
+        for first, second, reason in links:
+            root = find(first)
+            groups[root].update((first, second))
+            reasons[root].add(reason)
+        return [
+            {
+                "ids": sorted(refs),
+                "names": [self.names[ref] for ref in sorted(refs)],
+                "reasons": sorted(reasons[root]),
+            }
+            for root, refs in groups.items()
+        ]
@@ -1,22 +1,45 @@
 # flake8: noqa: E722  # Разрешаем bare except в этом модуле временно
 
+import base64
 import email
 import imaplib
 import logging
+import os
 import re  # Для очистки имен папок
 import smtplib
 import socket  # Для обработки ошибок подключения
 import ssl
+import tempfile
+import threading
+import time
+import uuid
 from datetime import datetime
 from email.header import decode_header, make_header
-from email.message import EmailMessage
+from email.message import MIMEPart
+from email.policy import SMTP
+from email.utils import formatdate, getaddresses, make_msgid, parsedate_to_datetime
 from typing import Dict, List, Optional, Tuple
 
+from django.conf import settings
 from django.utils import timezone  # noqa: F401 Импортируем timezone
-from imapclient import IMAPClient  # noqa: F401 Добавляем импорт IMAPClient
+from imapclient import IMAPClient, imap_utf7  # noqa: F401 Добавляем импорт IMAPClient
+from imapclient.response_parser import parse_fetch_response
 
 from .encryption_utils import decrypt_data
-from .models import UserProfile
+from .mail_pool import SMTP_OK, IMAPConnectionPool, SMTPConnectionPool
+from .mail_sync import (
+    DEFAULT_ORDERING,
+    enable_condstore,
+    get_state,
+    has_capability,
+    is_fresh,
+    list_cached_messages,
+    remove_cached_messages,
+    sync_mailbox,
+    uid_sequence_sets,
+    update_cached_flags,
+)
+from .models import Document, UserProfile
 
 logger = logging.getLogger(__name__)
 
@@ -47,8 +70,48 @@ GMAIL_MAILBOXES = {
     "All Mail": "[Gmail]/Вся почта",
 }
 
+# Таймауты сетевых операций IMAP и SMTP (секунды)
+IMAP_TIMEOUT = 30
+SMTP_TIMEOUT = 30
+
+# Потоковая сборка письма: вложения кодируются в base64 частями, кратными строке base64 (57 байт -> 76 символов)
+BASE64_LINE_BYTES = 57
+ATTACHMENT_CHUNK_SIZE = BASE64_LINE_BYTES * 1024
+SMTP_SEND_CHUNK_SIZE = 64 * 1024
+SMTP_WILL_FORWARD = 251
+SMTP_START_INPUT = 354
+
+# Для списка писем тянем только флаги, размер и нужные заголовки, без тела письма
+LIST_HEADER_FIELDS = "SUBJECT FROM TO DATE"
+LIST_FETCH_ITEMS = f"(UID FLAGS INTERNALDATE RFC822.SIZE BODY.PEEK[HEADER.FIELDS ({LIST_HEADER_FIELDS})])"
+
 # Попробуем определить атрибуты и разделитель
-MAILBOX_LIST_REGEX = re.compile(r'\\((?P<flags>.*?)\\) \"(?P<delimiter>.*)\" \"?(?P<name>[^"]+)\"?')
+MAILBOX_LIST_REGEX = re.compile(r'\((?P<flags>.*?)\) (?:"(?P<delimiter>[^"]*)"|NIL) "?(?P<name>[^"]+)"?')
+# Имена, которые при SELECT нужно брать в кавычки
+MAILBOX_QUOTE_REGEX = re.compile(r'[\s"\\(){%*\]]')
+
+# Атрибуты LIST для папок специального назначения (RFC 6154) и соответствующие им имена папок
+SPECIAL_USE_FLAGS = ("\\sent", "\\trash", "\\drafts", "\\junk", "\\archive", "\\all", "\\flagged")
+SPECIAL_USE_BY_NAME = {
+    "sent": "\\sent",
+    "sent mail": "\\sent",
+    "отправленные": "\\sent",
+    "trash": "\\trash",
+    "корзина": "\\trash",
+    "drafts": "\\drafts",
+    "черновики": "\\drafts",
+    "junk": "\\junk",
+    "spam": "\\junk",
+    "спам": "\\junk",
+    "archive": "\\archive",
+    "all mail": "\\all",
+}
+
+# Кэши в памяти процесса: расшифрованные учетные данные (по user.pk) и список папок (по email пользователя).
+# Значение - (момент истечения по time.monotonic(), данные)
+_credentials_cache: Dict[int, Tuple[float, Dict[str, str]]] = {}
+_mailbox_cache: Dict[str, Tuple[float, List[Dict]]] = {}
+_cache_lock = threading.Lock()
 
 
 # Пользовательское исключение для ошибок почты
@@ -61,7 +124,37 @@ class EmailError(Exception):
 
 
 def _get_user_credentials(user) -> Optional[Tuple[Dict[str, str], Optional[Tuple[str, str]]]]:
-    """Получает и расшифровывает учетные данные. Возвращает (credentials, error)."""
+    """Получает и расшифровывает учетные данные. Возвращает (credentials, error).
+
+    Успешный результат кэшируется в памяти процесса на MAIL_CREDENTIALS_CACHE_TTL
+    секунд, чтобы не читать профиль и не расшифровывать пароли на каждый запрос.
+    При сохранении настроек почты кэш сбрасывается (invalidate_mail_caches).
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _credentials_cache.get(user.pk)
+    if cached and cached[0] > now:
+        return dict(cached[1]), None
+
+    credentials, error = _load_user_credentials(user)
+    ttl = getattr(settings, "MAIL_CREDENTIALS_CACHE_TTL", 60)
+    if credentials and ttl > 0:
+        with _cache_lock:
+            _credentials_cache[user.pk] = (now + ttl, dict(credentials))
+    return credentials, error
+
+
+def invalidate_mail_caches(user) -> None:
+    """Сбрасывает кэш учетных данных и списка папок пользователя в текущем процессе.
+
+    Другие процессы увидят новые настройки по истечении TTL.
+    """
+    with _cache_lock:
+        _credentials_cache.pop(user.pk, None)
+        _mailbox_cache.pop(user.email, None)
+
+
+def _load_user_credentials(user) -> Tuple[Optional[Dict[str, str]], Optional[Tuple[str, str]]]:
     try:
         profile = UserProfile.objects.get(user=user)
         if not profile.email_integration_enabled:
@@ -105,7 +198,8 @@ def _get_user_credentials(user) -> Optional[Tuple[Dict[str, str], Optional[Tuple
                 )
 
         # Возвращаем словарь и None для ошибки
-        return required_fields, None
+        credentials = dict(required_fields, imap_use_ssl=profile.imap_use_ssl)
+        return credentials, None
 
     except UserProfile.DoesNotExist:
         msg = f"Профиль пользователя не найден для {user.email}"
@@ -127,6 +221,43 @@ def _decode_email_header(header_value: str) -> str:
         return header_value
 
 
+def _format_email_date(date_header: Optional[str], internal_date=None) -> str:
+    """Приводит дату письма к ISO формату (заголовок Date, затем INTERNALDATE)."""
+    if date_header:
+        try:
+            return parsedate_to_datetime(date_header).isoformat()
+        except (TypeError, ValueError, IndexError):
+            pass
+    if isinstance(internal_date, bytes):
+        try:
+            return datetime.strptime(internal_date.decode(), "%d-%b-%Y %H:%M:%S %z").isoformat()
+        except ValueError:
+            pass
+    return datetime.now().isoformat()
+
+
+def _build_email_summary(uid: int, fetch_item: Dict) -> Dict:
+    """Собирает краткое описание письма (без тела) из ответа пакетного UID FETCH."""
+    header_bytes = b""
+    for key, value in fetch_item.items():
+        if isinstance(key, bytes) and key.startswith(b"BODY[HEADER"):
+            header_bytes = value or b""
+            break
+    headers = email.message_from_bytes(header_bytes)
+    flags = [flag.decode() if isinstance(flag, bytes) else str(flag) for flag in fetch_item.get(b"FLAGS", ())]
+
+    return {
+        "id": str(uid),
+        "subject": _decode_email_header(headers.get("Subject", "")),
+        "from": _decode_email_header(headers.get("From", "")),
+        "to": _decode_email_header(headers.get("To", "")),
+        "date": _format_email_date(headers.get("Date"), fetch_item.get(b"INTERNALDATE")),
+        "is_read": "\\Seen" in flags,
+        "flags": flags,
+        "size": fetch_item.get(b"RFC822.SIZE"),
+    }
+
+
 def _select_mailbox(mail, mailbox_name: str, user_email: str) -> Tuple[Optional[str], Optional[Tuple[str, str]]]:
     """Выбирает почтовый ящик, возвращает (selected_mailbox_name, error)."""
     if not mailbox_name:
@@ -134,6 +265,21 @@ def _select_mailbox(mail, mailbox_name: str, user_email: str) -> Tuple[Optional[
 
     logger.info(f"Начало выбора папки '{mailbox_name}' для {user_email}")
 
+    # Имя на сервере ищем по кэшированному списку папок (включая SPECIAL-USE), чтобы обойтись одним SELECT
+    if mailbox_name.upper() != "INBOX":
+        resolved_name = _resolve_mailbox_name(_get_mailbox_tree(mail, user_email), mailbox_name)
+        if resolved_name:
+            try:
+                typ, data = mail.select(_quote_mailbox(resolved_name))
+                if typ == "OK":
+                    logger.info(f"Выбрана папка {resolved_name}")
+                    return resolved_name, None
+            except imaplib.IMAP4.error as e:
+                logger.debug(f"Не удалось выбрать папку '{resolved_name}': {e}")
+            # Список папок мог устареть - перебираем варианты имени как раньше
+            with _cache_lock:
+                _mailbox_cache.pop(user_email, None)
+
     # Сначала пробуем стандартное имя
     try:
         logger.debug(f"Попытка выбора папки '{mailbox_name}' для {user_email}")
@@ -184,44 +330,34 @@ def _select_mailbox(mail, mailbox_name: str, user_email: str) -> Tuple[Optional[
     return None, (ERR_TYPE_MAILBOX, error_msg)
 
 
-def fetch_emails(user_email, mailbox="INBOX", limit=25, offset=0):
+def fetch_emails(user_email, mailbox="INBOX", limit=25, offset=0, ordering=DEFAULT_ORDERING, refresh=False):
+    imap_server = None
+    credentials = None
+    session_broken = False
     try:
         # Получаем профиль пользователя
-        profile = UserProfile.objects.get(user__email=user_email)
+        profile = UserProfile.objects.select_related("user").get(user__email=user_email)
 
         # Проверяем, включена ли интеграция с почтой
         if not profile.email_integration_enabled:
             raise EmailError(ERR_TYPE_CONFIG, "Интеграция с почтой не включена")
 
-        # Получаем настройки IMAP
-        imap_host = profile.imap_host
-        imap_port = profile.imap_port
-        imap_user = profile.imap_user
-        imap_password = decrypt_data(profile.imap_password_encrypted) if profile.imap_password_encrypted else None
-        imap_use_ssl = profile.imap_use_ssl
-
-        if not all([imap_host, imap_port, imap_user, imap_password]):
-            raise EmailError(ERR_TYPE_CONFIG, "Неполная конфигурация IMAP")
-
-        # Подключаемся к IMAP серверу
-        logger.info(f"Подключение к IMAP серверу {imap_host}:{imap_port}")
-        imap_server = imaplib.IMAP4_SSL(imap_host, imap_port) if imap_use_ssl else imaplib.IMAP4(imap_host, imap_port)
+        # Папка недавно синхронизирована - отвечаем из локального кэша, не обращаясь к серверу
+        state = get_state(profile, mailbox)
+        if not refresh and is_fresh(state):
+            logger.info(f"Письма {mailbox} для {user_email} отданы из локального кэша")
+            return list_cached_messages(state, limit, offset, ordering)
 
-        # Аутентифицируемся
-        try:
-            imap_server.login(imap_user, imap_password)
-            logger.info(f"Успешная аутентификация для {user_email}")
-        except imaplib.IMAP4.error as e:
-            logger.error(f"Ошибка аутентификации IMAP для {user_email}: {str(e)}")
-            raise EmailError(ERR_TYPE_AUTHENTICATION, f"Ошибка аутентификации: {str(e)}")
+        # Учетные данные из кэша процесса, как в остальных точках входа почты
+        credentials, error = _get_user_credentials(profile.user)
+        if error:
+            raise EmailError(*error)
 
-        # Получаем список доступных папок
-        try:
-            folders = [folder.decode() for folder in imap_server.list()[1]]
-            logger.info(f"Доступные папки для {user_email}: {folders}")
-        except Exception as e:
-            logger.error(f"Ошибка получения списка папок для {user_email}: {str(e)}")
-            raise EmailError(ERR_TYPE_OPERATION, f"Ошибка получения списка папок: {str(e)}")
+        # Берем залогиненную сессию из пула (или подключаемся заново)
+        imap_server, error = imap_pool.acquire(credentials)
+        if error:
+            logger.error(f"Ошибка подключения IMAP для {user_email}: {error[1]}")
+            raise EmailError(*error)
 
         # Определяем правильное название папки
         mailbox_variants = []
@@ -272,131 +408,25 @@ def fetch_emails(user_email, mailbox="INBOX", limit=25, offset=0):
         if not selected_mailbox:
             raise EmailError(ERR_TYPE_MAILBOX, f"Не удалось выбрать папку {mailbox}")
 
-        # Получаем список писем
+        # Догружаем изменения в локальный кэш и отдаем страницу из него
         try:
-            status, messages = imap_server.search(None, "ALL")
-            if status != "OK":
-                raise EmailError(ERR_TYPE_OPERATION, "Ошибка поиска писем")
-
-            # Получаем список ID писем
-            email_ids = messages[0].split()
-            total_emails = len(email_ids)
-            logger.info(f"Найдено {total_emails} писем в папке {selected_mailbox}")
-
-            # Применяем пагинацию
-            start_idx = max(0, total_emails - offset - limit)
-            end_idx = max(0, total_emails - offset)
-            email_ids = email_ids[start_idx:end_idx]
-            logger.info(f"Запрашиваем {len(email_ids)} писем (offset={offset}, limit={limit})")
-
-            # Получаем письма
-            emails = []
-            for email_id in email_ids:
-                try:
-                    # Преобразуем email_id в строку, если это байты
-                    email_id_str = email_id.decode() if isinstance(email_id, bytes) else str(email_id)
-
-                    status, msg_data = imap_server.fetch(email_id, "(RFC822)")
-                    if status != "OK":
-                        continue
-
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
-
-                    # Получаем заголовки
-                    subject = decode_header(msg.get("Subject", ""))[0]
-                    subject = subject[0].decode(subject[1] or "utf-8") if isinstance(subject[0], bytes) else subject[0]
-
-                    from_addr = decode_header(msg.get("From", ""))[0]
-                    from_addr = (
-                        from_addr[0].decode(from_addr[1] or "utf-8")
-                        if isinstance(from_addr[0], bytes)
-                        else from_addr[0]
-                    )
-
-                    date = msg.get("Date", "")
-                    try:
-                        date = datetime.strptime(date, "%a, %d %b %Y %H:%M:%S %z").isoformat()
-                    except:
-                        date = datetime.now().isoformat()
-
-                    # Получаем тело письма
-                    body = ""
-                    is_html = False
-                    if msg.is_multipart():
-                        for part in msg.walk():
-                            content_type = part.get_content_type()
-                            if content_type == "text/html":
-                                try:
-                                    body = part.get_payload(decode=True).decode()
-                                    is_html = True
-                                    break
-                                except:
-                                    try:
-                                        body = part.get_payload(decode=True).decode("utf-8", errors="ignore")
-                                        is_html = True
-                                        break
-                                    except:
-                                        continue
-                            elif content_type == "text/plain" and not body:
-                                try:
-                                    body = part.get_payload(decode=True).decode()
-                                except:
-                                    try:
-                                        body = part.get_payload(decode=True).decode("utf-8", errors="ignore")
-                                    except:
-                                        continue
-                    else:
-                        content_type = msg.get_content_type()
-                        if content_type == "text/html":
-                            try:
-                                body = msg.get_payload(decode=True).decode()
-                                is_html = True
-                            except:
-                                try:
-                                    body = msg.get_payload(decode=True).decode("utf-8", errors="ignore")
-                                    is_html = True
-                                except:
-                                    pass
-                        else:
-                            try:
-                                body = msg.get_payload(decode=True).decode()
-                            except:
-                                try:
-                                    body = msg.get_payload(decode=True).decode("utf-8", errors="ignore")
-                                except:
-                                    pass
-
-                    emails.append(
-                        {
-                            "id": email_id_str,
-                            "subject": subject,
-                            "from": from_addr,
-                            "date": date,
-                            "body": body,
-                            "is_html": is_html,
-                            "mailbox": selected_mailbox,
-                        }
-                    )
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке письма {email_id}: {str(e)}")
-                    continue
-
-            logger.info(f"Успешно получено {len(emails)} писем для {user_email}, mailbox: {selected_mailbox}")
-            return {"emails": emails, "total": total_emails, "mailbox": selected_mailbox}
+            state = sync_mailbox(imap_server, profile, mailbox, selected_mailbox, force=refresh)
+            result = list_cached_messages(state, limit, offset, ordering)
+            logger.info(f"Успешно получено {len(result['emails'])} писем для {user_email}, mailbox: {selected_mailbox}")
+            return result
 
         except Exception as e:
             logger.error(f"Неожиданная ошибка при получении писем для {user_email}: {str(e)}")
             raise EmailError(ERR_TYPE_OPERATION, f"Ошибка получения писем: {str(e)}")
 
     except Exception as e:
+        # Ошибки выбора папки и конфигурации не портят сессию, остальные - повод переподключиться
+        session_broken = not (isinstance(e, EmailError) and e.err_type in (ERR_TYPE_MAILBOX, ERR_TYPE_CONFIG))
         logger.error(f"Неожиданная ошибка при получении писем для {user_email}: {str(e)}")
         raise EmailError(ERR_TYPE_UNKNOWN, f"Неожиданная ошибка: {str(e)}")
     finally:
-        try:
-            imap_server.logout()
-        except:
-            pass
+        if imap_server is not None:
+            imap_pool.release(credentials, imap_server, discard=session_broken)
 
 
 def _connect_and_login(credentials: Dict[str, str]) -> Tuple[Optional[imaplib.IMAP4_SSL], Optional[Tuple[str, str]]]:
@@ -405,8 +435,13 @@ def _connect_and_login(credentials: Dict[str, str]) -> Tuple[Optional[imaplib.IM
         logger.info(
             f"Подключение к IMAP {credentials['imap_host']}:{credentials['imap_port']} для {credentials['imap_user']}"
         )
-        context = ssl.create_default_context()
-        mail = imaplib.IMAP4_SSL(credentials["imap_host"], credentials["imap_port"], ssl_context=context)
+        if credentials.get("imap_use_ssl", True):
+            context = ssl.create_default_context()
+            mail = imaplib.IMAP4_SSL(
+                credentials["imap_host"], int(credentials["imap_port"]), ssl_context=context, timeout=IMAP_TIMEOUT
+            )
+        else:
+            mail = imaplib.IMAP4(credentials["imap_host"], int(credentials["imap_port"]), timeout=IMAP_TIMEOUT)
         typ, login_response = mail.login(credentials["imap_user"], credentials["imap_password"])
         if typ != "OK":
             # IMAP4.error обычно не срабатывает на неудачный логин, проверяем ответ
@@ -418,6 +453,8 @@ def _connect_and_login(credentials: Dict[str, str]) -> Tuple[Optional[imaplib.IM
                 pass
             return None, (ERR_TYPE_AUTHENTICATION, msg)
         logger.info(f"Успешный вход IMAP для {credentials['imap_user']}")
+        # CONDSTORE позволяет синхронизировать только изменившиеся флаги (см. mail_sync)
+        enable_condstore(mail)
         return mail, None
     except (
         imaplib.IMAP4.error,
@@ -440,180 +477,219 @@ def _connect_and_login(credentials: Dict[str, str]) -> Tuple[Optional[imaplib.IM
         return None, (ERR_TYPE_UNKNOWN, msg)
 
 
+imap_pool = IMAPConnectionPool(connect=_connect_and_login, timeout_error_type=ERR_TYPE_CONNECTION)
+
+
+def get_imap_pool_stats() -> Dict[str, int]:
+    """Счетчики пула IMAP сессий текущего процесса."""
+    return imap_pool.stats()
+
+
+def fetch_email_message(user, uid: str, mailbox: str = "INBOX") -> Tuple[Optional[Dict], Optional[Tuple[str, str]]]:
+    """Загружает полное письмо по UID (тело и вложения). Возвращает (message, error).
+
+    Письмо запрашивается через BODY[], поэтому сервер помечает его прочитанным.
+    """
+    credentials, error = _get_user_credentials(user)
+    if error:
+        return None, error
+
+    mail, error = imap_pool.acquire(credentials)
+    if error:
+        return None, error
+
+    session_broken = False
+    try:
+        selected_mailbox, error_info = _select_mailbox(mail, mailbox, user.email)
+        if not selected_mailbox:
+            return None, error_info
+
+        typ, fetch_data = mail.uid("FETCH", str(uid), "(UID FLAGS BODY[])")
+        if typ != "OK":
+            msg = f"Ошибка IMAP при получении письма {uid} ({user.email})"
+            logger.error(msg)
+            return None, (ERR_TYPE_OPERATION, msg)
+
+        parsed = parse_fetch_response(fetch_data, normalise_times=False, uid_is_key=True)
+        fetch_item = parsed.get(int(uid))
+        if not fetch_item or fetch_item.get(b"BODY[]") is None:
+            msg = f"Письмо {uid} не найдено в папке {mailbox}"
+            logger.warning(msg)
+            return None, (ERR_TYPE_MAILBOX, msg)
+
+        email_obj = email.message_from_bytes(fetch_item[b"BODY[]"])
+        content = _extract_email_body(email_obj)
+        flags = [flag.decode() if isinstance(flag, bytes) else str(flag) for flag in fetch_item.get(b"FLAGS", ())]
+        if "\\Seen" not in flags:
+            flags.append("\\Seen")
+
+        message = {
+            "id": str(uid),
+            "subject": _decode_email_header(email_obj.get("Subject", "")),
+            "from": _decode_email_header(email_obj.get("From", "")),
+            "to": _decode_email_header(email_obj.get("To", "")),
+            "cc": _decode_email_header(email_obj.get("Cc", "")),
+            "date": _format_email_date(email_obj.get("Date")),
+            "body": content["html"] or content["plain"],
+            "is_html": bool(content["html"]),
+            "body_plain": content["plain"],
+            "body_html": content["html"],
+            "attachments": content["attachments"],
+            "is_read": True,
+            "flags": flags,
+            "mailbox": selected_mailbox,
+        }
+        # BODY[] помечает письмо прочитанным - отражаем это в локальном кэше
+        update_cached_flags(user.profile, selected_mailbox, [uid], ["\\Seen"], True)
+        return message, None
+
+    except Exception as e:
+        session_broken = True
+        msg = f"Неизвестная ошибка при получении письма {uid} для {user.email}: {e}"
+        logger.error(msg, exc_info=True)
+        return None, (ERR_TYPE_UNKNOWN, msg)
+    finally:
+        imap_pool.release(credentials, mail, discard=session_broken)
+
+
 def set_email_flags(
     user, email_ids: List[str], flags: List[str], mailbox: str = "INBOX", add: bool = True
 ) -> Tuple[bool, Optional[Tuple[str, str]]]:
-    """Устанавливает флаги. Возвращает (success, error)."""
+    """Устанавливает флаги. Возвращает (success, error).
+
+    UID сжимаются в наборы диапазонов, поэтому массовая пометка - это один
+    UID STORE (или несколько, если набор слишком длинный), а не команда на письмо.
+    """
+    if not email_ids:
+        return True, None
     credentials, error = _get_user_credentials(user)
     if error:
         return False, error
 
-    mail = None
-    try:
-        mail, error = _connect_and_login(credentials)
-        if error:
-            return False, error
+    mail, error = imap_pool.acquire(credentials)
+    if error:
+        return False, error
 
+    session_broken = False
+    try:
         # Используем новую функцию выбора ящика
         success, error_info = _select_mailbox(mail, mailbox, user.email)
         if not success:
-            if mail:
-                mail.logout()
             return False, error_info
 
-        ids_string = ",".join(email_ids)
         flags_string = "(" + " ".join(flags) + ")"
         command = "+FLAGS.SILENT" if add else "-FLAGS.SILENT"
 
-        typ, response = mail.store(ids_string, command, flags_string)
+        # Один UID STORE на набор вида "1:50,72,90:120" вместо перечисления каждого UID
+        for uid_set in uid_sequence_sets(email_ids):
+            typ, response = mail.uid("STORE", uid_set, command, flags_string)
+            if typ != "OK":
+                error_message = "Unknown error"
+                try:
+                    error_message = response[0].decode()
+                except:
+                    pass
+                msg = f"Ошибка IMAP при установке флагов для {uid_set} ({user.email}): {error_message}"
+                logger.error(msg)
+                return False, (ERR_TYPE_OPERATION, msg)
 
-        if typ == "OK":
-            if mail:
-                mail.logout()
-            return True, None
-        else:
-            error_message = "Unknown error"
-            try:
-                error_message = response[0].decode()
-            except:
-                pass
-            msg = f"Ошибка IMAP при установке флагов для {ids_string} ({user.email}): {error_message}"
-            logger.error(msg)
-            if mail:
-                mail.logout()
-            return False, (ERR_TYPE_OPERATION, msg)
+        update_cached_flags(user.profile, mailbox, email_ids, flags, add)
+        return True, None
 
     except Exception as e:
+        session_broken = True
         msg = f"Неизвестная ошибка при установке флагов для {user.email}: {e}"
         logger.error(msg, exc_info=True)
-        if mail:
-            try:
-                mail.logout()
-            except Exception:
-                pass
         return False, (ERR_TYPE_UNKNOWN, msg)
+    finally:
+        imap_pool.release(credentials, mail, discard=session_broken)
 
 
 def delete_email(user, email_ids: List[str], mailbox: str = "INBOX") -> Tuple[bool, Optional[Tuple[str, str]]]:
     """Удаляет письма (помечает \\Deleted и делает expunge). Возвращает (success, error)."""
     # TODO: Реализовать перемещение в Корзину вместо expunge
+    if not email_ids:
+        return True, None
     credentials, error = _get_user_credentials(user)
     if error:
         return False, error
 
-    mail = None
-    try:
-        mail, error = _connect_and_login(credentials)
-        if error:
-            return False, error
+    mail, error = imap_pool.acquire(credentials)
+    if error:
+        return False, error
 
+    session_broken = False
+    try:
         # Используем новую функцию выбора ящика
         success, error_info = _select_mailbox(mail, mailbox, user.email)
         if not success:
-            if mail:
-                mail.logout()
             return False, error_info
 
-        ids_string = ",".join(email_ids)
-        logger.info(f"Пометка писем {ids_string} как удаленных в {mailbox} для {user.email}")
-        typ, response = mail.store(ids_string, "+FLAGS.SILENT", "(\\Deleted)")  # Добавляем .SILENT
-
-        if typ != "OK":
-            error_message = "Unknown error"
-            try:
-                error_message = response[0].decode()
-            except:
-                pass
-            msg = f"Ошибка IMAP при пометке писем {ids_string} как удаленные ({user.email}): {error_message}"
-            logger.error(msg)
-            if mail:
-                mail.logout()
-            return False, (ERR_TYPE_OPERATION, msg)
-
-        logger.info(f"Выполнение EXPUNGE в {mailbox} для {user.email}")
-        typ_expunge, response_expunge = mail.expunge()
+        uid_sets = uid_sequence_sets(email_ids)
+        logger.info(f"Пометка писем {','.join(uid_sets)} как удаленных в {mailbox} для {user.email}")
+        for uid_set in uid_sets:
+            typ, response = mail.uid("STORE", uid_set, "+FLAGS.SILENT", "(\\Deleted)")
+            if typ != "OK":
+                error_message = "Unknown error"
+                try:
+                    error_message = response[0].decode()
+                except:
+                    pass
+                msg = f"Ошибка IMAP при пометке писем {uid_set} как удаленные ({user.email}): {error_message}"
+                logger.error(msg)
+                return False, (ERR_TYPE_OPERATION, msg)
+
+        # UID EXPUNGE (UIDPLUS) удаляет только выбранные письма, а не все помеченные \Deleted в папке
+        if has_capability(mail, "UIDPLUS"):
+            logger.info(f"Выполнение UID EXPUNGE в {mailbox} для {user.email}")
+            expunge_results = [mail.uid("EXPUNGE", uid_set) for uid_set in uid_sets]
+        else:
+            logger.info(f"Выполнение EXPUNGE в {mailbox} для {user.email}")
+            expunge_results = [mail.expunge()]
 
-        if typ_expunge != "OK":
-            error_message = "Unknown error"
-            try:
-                error_message = response_expunge[0].decode()
-            except:
-                pass
-            msg = f"Ошибка IMAP при выполнении EXPUNGE для {mailbox} ({user.email}): {error_message}"
-            logger.warning(msg)  # Логируем как warning, т.к. пометка могла пройти успешно
-            # Все равно считаем условно успешным, если пометка прошла
+        for typ_expunge, response_expunge in expunge_results:
+            if typ_expunge != "OK":
+                error_message = "Unknown error"
+                try:
+                    error_message = response_expunge[0].decode()
+                except:
+                    pass
+                msg = f"Ошибка IMAP при выполнении EXPUNGE для {mailbox} ({user.email}): {error_message}"
+                logger.warning(msg)  # Логируем как warning, т.к. пометка могла пройти успешно
+                # Все равно считаем условно успешным, если пометка прошла
 
-        if mail:
-            mail.logout()
+        remove_cached_messages(user.profile, mailbox, email_ids)
         return True, None
 
     except Exception as e:
+        session_broken = True
         msg = f"Неизвестная ошибка при удалении писем для {user.email}: {e}"
         logger.error(msg, exc_info=True)
-        if mail:
-            try:
-                mail.logout()
-            except Exception:
-                pass
         return False, (ERR_TYPE_UNKNOWN, msg)
+    finally:
+        imap_pool.release(credentials, mail, discard=session_broken)
 
 
-def send_email(
-    user, to: str, subject: str, body: str, documents: List[int] = None
-) -> Tuple[bool, Optional[Tuple[str, str]]]:
-    """Отправляет письмо через SMTP и сохраняет копию в папку Sent через IMAP."""
-    credentials, error = _get_user_credentials(user)
-    if error:
-        return False, error
-
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = credentials["smtp_user"]
-    msg["To"] = to
-
-    # Устанавливаем HTML-контент
-    msg.add_alternative(body, subtype="html")
-
-    # Добавляем прикрепленные документы
-    if documents:
-        from documents.models import Document
-
-        for doc_id in documents:
-            try:
-                doc = Document.objects.get(id=doc_id)
-                with open(doc.file.path, "rb") as f:
-                    msg.add_attachment(f.read(), maintype="application", subtype="octet-stream", filename=doc.name)
-            except Document.DoesNotExist:
-                logger.warning(f"Документ с ID {doc_id} не найден")
-            except Exception as e:
-                logger.error(f"Ошибка при прикреплении документа {doc_id}: {e}")
-
-    error_info = None
-    success = False
-    smtp_server = None  # Для закрытия соединения в finally
-
+def _smtp_connect(credentials: Dict[str, str]) -> Tuple[Optional[smtplib.SMTP], Optional[Tuple[str, str]]]:
+    """Подключается к SMTP и логинится. Возвращает (connection, error)."""
+    host = credentials.get("smtp_host", "?")
+    smtp_server = None
     try:
-        # --- SMTP Отправка ---
-        logger.info(
-            f"Подключение к SMTP {credentials['smtp_host']}:{credentials['smtp_port']} для {credentials['smtp_user']}"
-        )
+        logger.info(f"Подключение к SMTP {host}:{credentials['smtp_port']} для {credentials['smtp_user']}")
         context = ssl.create_default_context()
         port = int(credentials["smtp_port"])
-        host = credentials["smtp_host"]
         smtp_user = credentials["smtp_user"]
         smtp_password = credentials["smtp_password"]
 
         if port == 465:
-            smtp_server = smtplib.SMTP_SSL(host, port, context=context)
+            smtp_server = smtplib.SMTP_SSL(host, port, context=context, timeout=SMTP_TIMEOUT)
             smtp_server.login(smtp_user, smtp_password)
-            smtp_server.send_message(msg)
         elif port == 587:
-            smtp_server = smtplib.SMTP(host, port)
+            smtp_server = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
             smtp_server.starttls(context=context)
             smtp_server.login(smtp_user, smtp_password)
-            smtp_server.send_message(msg)
         else:  # Пробуем без явного шифрования
-            smtp_server = smtplib.SMTP(host, port)
+            smtp_server = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
             try:  # Попытка STARTTLS
                 smtp_server.starttls(context=context)
                 smtp_server.login(smtp_user, smtp_password)
@@ -621,258 +697,555 @@ def send_email(
                 try:  # Попытка логина без STARTTLS
                     smtp_server.login(smtp_user, smtp_password)
                 except smtplib.SMTPNotSupportedError:
-                    err_msg = f"SMTP сервер {host}:{port} не поддерживает STARTTLS или вход без шифрования."
-                    logger.error(err_msg)
-                    # Закрываем соединение перед выходом
-                    try:
-                        smtp_server.quit()
-                    except Exception:
-                        pass
-                    return False, (ERR_TYPE_CONNECTION, err_msg)
-            smtp_server.send_message(msg)
+                    msg = f"SMTP сервер {host}:{port} не поддерживает STARTTLS или вход без шифрования."
+                    logger.error(msg)
+                    _close_smtp(smtp_server)
+                    return None, (ERR_TYPE_CONNECTION, msg)
+        logger.info(f"Успешный вход SMTP для {smtp_user}")
+        return smtp_server, None
+    except smtplib.SMTPAuthenticationError as e:
+        msg = f"Ошибка аутентификации SMTP для {credentials.get('smtp_user', '?')}: {e}"
+        logger.error(msg)
+        error_info = (ERR_TYPE_AUTHENTICATION, msg)
+    except ssl.SSLError as e:
+        msg = f"Ошибка SSL при подключении к SMTP для {credentials.get('smtp_user', '?')}: {e}"
+        logger.error(msg)
+        error_info = (ERR_TYPE_CONNECTION, msg)
+    except (socket.gaierror, socket.timeout, ConnectionRefusedError, OSError) as e:
+        msg = f"Ошибка подключения к SMTP серверу {host} для {credentials.get('smtp_user', '?')}: {e}"
+        logger.error(msg)
+        error_info = (ERR_TYPE_CONNECTION, msg)
+    except Exception as e:
+        msg = f"Неизвестная ошибка при подключении/логине SMTP для {credentials.get('smtp_user', '?')}: {e}"
+        logger.error(msg, exc_info=True)
+        error_info = (ERR_TYPE_UNKNOWN, msg)
+    _close_smtp(smtp_server)
+    return None, error_info
+
 
-        logger.info(f"Письмо от {smtp_user} к {to} успешно отправлено через SMTP.")
-        success = True  # Отправка SMTP прошла успешно
-        # Закрываем SMTP соединение после отправки
+def _close_smtp(smtp_server) -> None:
+    if smtp_server is None:
+        return
+    try:
+        smtp_server.quit()
+    except Exception:
         try:
-            smtp_server.quit()
+            smtp_server.close()
         except Exception:
             pass
-        smtp_server = None
 
-    except smtplib.SMTPAuthenticationError as e:
-        m = f"Ошибка аутентификации SMTP для {user.email}: {e}"
-        logger.error(m)
-        error_info = (ERR_TYPE_AUTHENTICATION, m)
-    except (socket.gaierror, socket.timeout, ConnectionRefusedError, OSError) as e:
-        m = f"Ошибка подключения к SMTP серверу {credentials.get('smtp_host', '?')} для {user.email}: {e}"
-        logger.error(m)
-        error_info = (ERR_TYPE_CONNECTION, m)
-    except ssl.SSLError as e:
-        m = f"Ошибка SSL при подключении к SMTP для {user.email}: {e}"
-        logger.error(m)
-        error_info = (ERR_TYPE_CONNECTION, m)
-    except smtplib.SMTPException as e:
-        m = f"Общая ошибка SMTP для {user.email}: {e}"
-        logger.error(m)
-        error_info = (ERR_TYPE_OPERATION, m)
-    except Exception as e:
-        m = f"Неизвестная ошибка при отправке письма (SMTP) для {user.email}: {e}"
-        logger.error(m, exc_info=True)
-        error_info = (ERR_TYPE_UNKNOWN, m)
-    finally:
-        # Гарантированно закрываем SMTP соединение, если оно еще открыто
-        if smtp_server:
-            try:
-                smtp_server.quit()
-            except Exception:
-                pass
 
-    # --- IMAP Сохранение в Отправленные (если SMTP прошло успешно) ---
-    if success:  # 'success' здесь означает успех SMTP
-        imap_mail = None
+smtp_pool = SMTPConnectionPool(connect=_smtp_connect, timeout_error_type=ERR_TYPE_CONNECTION)
+
+
+def get_smtp_pool_stats() -> Dict[str, int]:
+    """Счетчики пула SMTP сессий текущего процесса."""
+    return smtp_pool.stats()
+
+
+def _smtp_send_spooled(smtp_server, from_addr: str, recipients: List[str], spool) -> Dict:
+    """Передает письмо из временного файла командой DATA, не загружая его в память целиком.
+
+    Повторяет smtplib.SMTP.sendmail: при отказе сервера транзакция сбрасывается
+    командой RSET и выбрасывается то же исключение. Возвращает отклоненных получателей.
+    """
+    smtp_server.ehlo_or_helo_if_needed()
+    code, response = smtp_server.mail(from_addr)
+    if code != SMTP_OK:
+        smtp_server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, from_addr)
+    refused = {}
+    for recipient in recipients:
+        code, response = smtp_server.rcpt(recipient)
+        if code not in (SMTP_OK, SMTP_WILL_FORWARD):
+            refused[recipient] = (code, response)
+    if len(refused) == len(recipients):
+        smtp_server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    code, response = smtp_server.docmd("data")
+    if code != SMTP_START_INPUT:
+        smtp_server.rset()
+        raise smtplib.SMTPDataError(code, response)
+
+    spool.seek(0)
+    buffer, buffered = [], 0
+    for line in spool:
+        # RFC 5321, 4.5.2: точка в начале строки удваивается
+        stuffed = b"." + line if line.startswith(b".") else line
+        buffer.append(stuffed)
+        buffered += len(stuffed)
+        if buffered >= SMTP_SEND_CHUNK_SIZE:
+            smtp_server.send(b"".join(buffer))
+            buffer, buffered = [], 0
+    buffer.append(b".\r\n")
+    smtp_server.send(b"".join(buffer))
+    code, response = smtp_server.getreply()
+    if code != SMTP_OK:
+        smtp_server.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+def _smtp_send(credentials: Dict[str, str], spool, recipients: List[str]) -> Tuple[bool, Optional[Tuple[str, str]]]:
+    """Отправляет письмо через сессию из пула SMTP. Возвращает (success, error).
+
+    Если сервер закрыл простаивавшую сессию, письмо один раз повторяется на новой.
+    """
+    smtp_user = credentials.get("smtp_user", "?")
+    for attempt in range(2):
+        smtp_server, error = smtp_pool.acquire(credentials)
+        if error:
+            return False, error
+        session_broken = True
         try:
-            # Подключаемся к IMAP для сохранения копии
-            logger.debug(f"Попытка подключения к IMAP для сохранения копии письма от {user.email}")
-            imap_mail, imap_error = _connect_and_login(credentials)
-            if imap_error:
-                # Не считаем критической ошибкой, если не удалось сохранить копию
-                logger.warning(
-                    f"Не удалось подключиться к IMAP для сохранения копии отправленного письма ({user.email}): {imap_error}"
-                )
-                # Возвращаем успех SMTP и исходную ошибку SMTP (если была), иначе None
-                return success, error_info
+            refused = _smtp_send_spooled(smtp_server, credentials["smtp_user"], recipients, spool)
+            session_broken = False
+            if refused:
+                logger.warning(f"SMTP сервер отклонил часть получателей письма от {smtp_user}: {refused}")
+            return True, None
+        except smtplib.SMTPServerDisconnected as e:
+            if attempt == 0:
+                logger.info(f"SMTP сессия {smtp_user} закрыта сервером ({e}), повтор на новой сессии")
+                continue
+            m = f"SMTP сервер {credentials.get('smtp_host', '?')} разорвал соединение для {smtp_user}: {e}"
+            logger.error(m)
+            return False, (ERR_TYPE_CONNECTION, m)
+        except smtplib.SMTPAuthenticationError as e:
+            m = f"Ошибка аутентификации SMTP для {smtp_user}: {e}"
+            logger.error(m)
+            return False, (ERR_TYPE_AUTHENTICATION, m)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+            # Транзакция уже сброшена командой RSET, сессия пригодна для следующего письма
+            session_broken = False
+            m = f"SMTP сервер отклонил письмо от {smtp_user}: {e}"
+            logger.error(m)
+            return False, (ERR_TYPE_OPERATION, m)
+        except smtplib.SMTPException as e:
+            m = f"Общая ошибка SMTP для {smtp_user}: {e}"
+            logger.error(m)
+            return False, (ERR_TYPE_OPERATION, m)
+        except (socket.gaierror, socket.timeout, ConnectionRefusedError, OSError) as e:
+            m = f"Ошибка подключения к SMTP серверу {credentials.get('smtp_host', '?')} для {smtp_user}: {e}"
+            logger.error(m)
+            return False, (ERR_TYPE_CONNECTION, m)
+        except Exception as e:
+            m = f"Неизвестная ошибка при отправке письма (SMTP) для {smtp_user}: {e}"
+            logger.error(m, exc_info=True)
+            return False, (ERR_TYPE_UNKNOWN, m)
+        finally:
+            smtp_pool.release(credentials, smtp_server, discard=session_broken)
+
 
-            # Пытаемся выбрать папку Sent (с префиксом, если нужно)
-            sent_mailbox_name_to_try = "Sent"  # Стандартное имя для попытки
-            logger.debug(
-                f"Попытка выбора папки '{sent_mailbox_name_to_try}' (или с префиксом) для сохранения копии ({user.email})"
+def _imap_append_spooled(mail, mailbox: str, flags: str, spool) -> Tuple[str, List]:
+    """APPEND письма из временного файла: литерал отправляется на сокет частями.
+
+    imaplib.IMAP4.append принимает только bytes, поэтому команда собирается
+    так же, как это делает imaplib._command, но без копии письма в памяти.
+    """
+    size = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    for typ in ("OK", "NO", "BAD"):
+        mail.untagged_responses.pop(typ, None)
+    tag = mail._new_tag()
+    mail.send(tag + f" APPEND {_quote_mailbox(mailbox)} {flags} {{{size}}}".encode() + b"\r\n")
+    # Ждем приглашения "+" к передаче литерала; NO/BAD вместо него завершает команду
+    while mail._get_response():
+        if mail.tagged_commands[tag]:
+            return mail._command_complete("APPEND", tag)
+    while chunk := spool.read(SMTP_SEND_CHUNK_SIZE):
+        mail.send(chunk)
+    mail.send(b"\r\n")
+    return mail._command_complete("APPEND", tag)
+
+
+def _get_document(doc_id: int, document_cache: Optional[Dict] = None) -> Optional[Document]:
+    """Документ для вложения; при рассылке запрос в БД делается один раз на всю пачку."""
+    if document_cache is not None and doc_id in document_cache:
+        return document_cache[doc_id]
+    try:
+        doc = Document.objects.get(id=doc_id)
+    except Document.DoesNotExist:
+        logger.warning(f"Документ с ID {doc_id} не найден")
+        doc = None
+    if document_cache is not None:
+        document_cache[doc_id] = doc
+    return doc
+
+
+def _write_part_headers(spool, part: MIMEPart) -> None:
+    for name, value in part.items():
+        spool.write(part.policy.fold_binary(name, value))
+    spool.write(b"\r\n")
+
+
+def _write_base64(source, spool) -> None:
+    """Кодирует файл в base64 частями, сохраняя строки по 76 символов."""
+    tail = b""
+    while chunk := source.read(ATTACHMENT_CHUNK_SIZE):
+        data = tail + chunk
+        cut = len(data) - len(data) % BASE64_LINE_BYTES
+        spool.write(base64.encodebytes(data[:cut]).replace(b"\n", b"\r\n"))
+        tail = data[cut:]
+    if tail:
+        spool.write(base64.encodebytes(tail).replace(b"\n", b"\r\n"))
+
+
+def _spool_message(
+    credentials: Dict[str, str], to: str, subject: str, body: str, documents: List[int], document_cache=None
+):
+    """Собирает multipart письмо во временный файл (в памяти до MAIL_SPOOL_MAX_MEMORY байт, дальше на диске).
+
+    Вложения читаются из Document.file и кодируются в base64 частями,
+    поэтому размер вложений не влияет на потребление памяти воркером.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.MAIL_SPOOL_MAX_MEMORY)
+    boundary = f"=_{uuid.uuid4().hex}"
+    from_addr = credentials["smtp_user"]
+
+    headers = MIMEPart(policy=SMTP)
+    headers["Subject"] = subject
+    headers["From"] = from_addr
+    headers["To"] = to
+    headers["Date"] = formatdate(localtime=True)
+    headers["Message-ID"] = make_msgid(domain=from_addr.rpartition("@")[2] or None)
+    headers["MIME-Version"] = "1.0"
+    headers["Content-Type"] = f'multipart/mixed; boundary="{boundary}"'
+    _write_part_headers(spool, headers)
+
+    # HTML-контент
+    html_part = MIMEPart(policy=SMTP)
+    html_part.set_content(body, subtype="html")
+    spool.write(f"--{boundary}\r\n".encode())
+    spool.write(html_part.as_bytes())
+
+    # Прикрепленные документы
+    for doc_id in documents or []:
+        doc = _get_document(doc_id, document_cache)
+        if doc is None:
+            continue
+        attachment = MIMEPart(policy=SMTP)
+        attachment["Content-Type"] = "application/octet-stream"
+        attachment.add_header("Content-Disposition", "attachment", filename=doc.name)
+        attachment["Content-Transfer-Encoding"] = "base64"
+        position = spool.tell()
+        try:
+            with doc.file.open("rb") as source:
+                spool.write(f"\r\n--{boundary}\r\n".encode())
+                _write_part_headers(spool, attachment)
+                _write_base64(source, spool)
+        except Exception as e:
+            # Недописанную часть отбрасываем, письмо уходит без этого вложения
+            spool.seek(position)
+            spool.truncate()
+            logger.error(f"Ошибка при прикреплении документа {doc_id}: {e}")
+
+    spool.write(f"\r\n--{boundary}--\r\n".encode())
+    return spool
+
+
+def send_email(
+    user,
+    to: str,
+    subject: str,
+    body: str,
+    documents: List[int] = None,
+    attachment_cache: Optional[Dict] = None,
+) -> Tuple[bool, Optional[Tuple[str, str]]]:
+    """Отправляет письмо через SMTP и сохраняет копию в папку Sent через IMAP.
+
+    SMTP сессия берется из пула, поэтому серия писем одного отправителя идет
+    через одно соединение без повторного TLS рукопожатия и логина. Письмо
+    собирается во временный файл, из которого читают и SMTP, и IMAP APPEND.
+    ``attachment_cache`` - общий словарь документов для серии писем с одними и теми же вложениями.
+    """
+    credentials, error = _get_user_credentials(user)
+    if error:
+        return False, error
+
+    recipients = [address for _, address in getaddresses([to]) if address]
+    if not recipients:
+        return False, (ERR_TYPE_OPERATION, f"Не указан корректный адрес получателя: {to}")
+
+    spool = _spool_message(credentials, to, subject, body, documents, attachment_cache)
+    try:
+        # --- SMTP Отправка ---
+        success, error_info = _smtp_send(credentials, spool, recipients)
+        if success:
+            logger.info(f"Письмо от {credentials['smtp_user']} к {to} успешно отправлено через SMTP.")
+            # --- IMAP Сохранение в Отправленные (если SMTP прошло успешно) ---
+            _save_to_sent(credentials, user, to, spool)
+    finally:
+        spool.close()
+
+    # Возвращаем результат операции SMTP и ошибку SMTP (если была)
+    return success, error_info
+
+
+def _save_to_sent(credentials: Dict[str, str], user, to: str, spool) -> None:
+    """Сохраняет копию отправленного письма в папку Sent. Ошибки только логируются."""
+    imap_mail = None
+    imap_session_broken = False
+    try:
+        # Берем IMAP сессию из пула для сохранения копии
+        logger.debug(f"Попытка подключения к IMAP для сохранения копии письма от {user.email}")
+        imap_mail, imap_error = imap_pool.acquire(credentials)
+        if imap_error:
+            # Не считаем критической ошибкой, если не удалось сохранить копию
+            logger.warning(
+                f"Не удалось подключиться к IMAP для сохранения копии отправленного письма ({user.email}): {imap_error}"
             )
+            return
 
-            # Используем обновленную _select_mailbox, которая возвращает имя
-            selected_sent_mailbox, select_error = _select_mailbox(imap_mail, sent_mailbox_name_to_try, user.email)
+        # Пытаемся выбрать папку Sent (с префиксом, если нужно)
+        sent_mailbox_name_to_try = "Sent"  # Стандартное имя для попытки
+        logger.debug(
+            f"Попытка выбора папки '{sent_mailbox_name_to_try}' (или с префиксом) для сохранения копии ({user.email})"
+        )
 
-            if not selected_sent_mailbox:
-                # Если выбрать папку Sent (даже с префиксом) не удалось
-                # select_error уже содержит детали ошибки
-                logger.warning(
-                    f"Не удалось выбрать папку '{sent_mailbox_name_to_try}' (или с префиксом) для сохранения копии ({user.email}): {select_error}"
-                )
-                # Не сохраняем, но SMTP мог пройти успешно
-            else:
-                # Папка выбрана (имя в selected_sent_mailbox), сохраняем письмо
-                logger.debug(
-                    f"Папка '{selected_sent_mailbox}' выбрана. Попытка APPEND для сохранения копии ({user.email})"
-                )
-                try:
-                    # Устанавливаем флаг \Seen. Дату не передаем, сервер установит сам.
-                    # msg.as_bytes() - получаем байтовое представление письма
-                    imap_status, append_response = imap_mail.append(
-                        selected_sent_mailbox,  # Используем имя выбранного ящика
-                        "(\\Seen)",
-                        None,  # Передаем None вместо даты
-                        msg.as_bytes(),
-                    )
-                    if imap_status == "OK":
-                        logger.info(
-                            f"Копия письма для {to} успешно сохранена в '{selected_sent_mailbox}' ({user.email})"
-                        )
-                    else:
-                        append_error_msg = "Unknown error"
-                        try:
-                            append_error_msg = append_response[0].decode()
-                        except:
-                            pass
-                        logger.warning(
-                            f"Команда APPEND не удалась для '{selected_sent_mailbox}' ({user.email}): {append_error_msg}"
-                        )
-                except Exception as append_exc:
+        # Используем обновленную _select_mailbox, которая возвращает имя
+        selected_sent_mailbox, select_error = _select_mailbox(imap_mail, sent_mailbox_name_to_try, user.email)
+
+        if not selected_sent_mailbox:
+            # Если выбрать папку Sent (даже с префиксом) не удалось
+            # select_error уже содержит детали ошибки
+            logger.warning(
+                f"Не удалось выбрать папку '{sent_mailbox_name_to_try}' (или с префиксом) для сохранения копии ({user.email}): {select_error}"
+            )
+            # Не сохраняем, но SMTP мог пройти успешно
+        else:
+            # Папка выбрана (имя в selected_sent_mailbox), сохраняем письмо
+            logger.debug(f"Папка '{selected_sent_mailbox}' выбрана. Попытка APPEND для сохранения копии ({user.email})")
+            try:
+                # Устанавливаем флаг \Seen. Дату не передаем, сервер установит сам.
+                # Письмо передается из того же временного файла, что и в SMTP
+                imap_status, append_response = _imap_append_spooled(imap_mail, selected_sent_mailbox, "(\\Seen)", spool)
+                if imap_status == "OK":
+                    logger.info(f"Копия письма для {to} успешно сохранена в '{selected_sent_mailbox}' ({user.email})")
+                else:
+                    append_error_msg = "Unknown error"
+                    try:
+                        append_error_msg = append_response[0].decode()
+                    except:
+                        pass
                     logger.warning(
-                        f"Исключение во время APPEND в '{selected_sent_mailbox}' ({user.email}): {append_exc}",
-                        exc_info=True,
+                        f"Команда APPEND не удалась для '{selected_sent_mailbox}' ({user.email}): {append_error_msg}"
                     )
+            except Exception as append_exc:
+                imap_session_broken = True
+                logger.warning(
+                    f"Исключение во время APPEND в '{selected_sent_mailbox}' ({user.email}): {append_exc}",
+                    exc_info=True,
+                )
 
-            # Закрываем IMAP соединение
-            logger.debug(f"Закрытие IMAP соединения после попытки сохранения копии ({user.email})")
-            if imap_mail:
-                try:
-                    imap_mail.logout()
-                except:
-                    pass
+    except Exception as imap_exc:
+        # Общая ошибка при работе с IMAP для сохранения
+        imap_session_broken = True
+        logger.warning(
+            f"Не удалось сохранить копию отправленного письма ({user.email}) из-за общей ошибки IMAP: {imap_exc}",
+            exc_info=True,
+        )
+    finally:
+        # Возвращаем IMAP сессию в пул
+        imap_pool.release(credentials, imap_mail, discard=imap_session_broken)
 
-        except Exception as imap_exc:
-            # Общая ошибка при работе с IMAP для сохранения
-            logger.warning(
-                f"Не удалось сохранить копию отправленного письма ({user.email}) из-за общей ошибки IMAP: {imap_exc}",
-                exc_info=True,
-            )
-            if imap_mail:
-                try:
-                    imap_mail.logout()
-                except:
-                    pass
 
-    # Возвращаем результат операции SMTP и ошибку SMTP (если была)
-    return success, error_info
+def _parse_mailbox_list(data, user_email: str) -> List[Dict]:
+    """Разбирает ответ LIST в отсортированный список папок с признаками SPECIAL-USE (RFC 6154)."""
+    mailboxes_list = []
+    for line in data:
+        if isinstance(line, bytes):
+            try:
+                line_str = line.decode("utf-8", errors="replace")  # Используем replace для безопасности
+                logger.debug(f"Обработка строки ящика для {user_email}: {line_str!r}")  # Логируем саму строку
+                match = MAILBOX_LIST_REGEX.match(line_str)
+                if match:
+                    group_dict = match.groupdict()
+                    name = group_dict["name"]
+                    flags_str = group_dict["flags"]
+                    delimiter = group_dict["delimiter"]
+                    logger.debug(
+                        f"  -> Распарсено: name='{name}', flags='{flags_str}', delimiter='{delimiter}'"
+                    )  # Лог успешного парсинга
+
+                    # Очищаем имя от префикса INBOX., если он есть
+                    if name.startswith(INBOX_PREFIX):
+                        display_name = name[len(INBOX_PREFIX) :]
+                    else:
+                        display_name = name
+                    # Не-ASCII имена приходят в modified UTF-7 (RFC 3501, 5.1.3)
+                    display_name = imap_utf7.decode(display_name.encode())
+
+                    # Пропускаем системные/нежелательные ящики по флагам или имени
+                    flags = set(flags_str.lower().split())
+                    skip_reason = None
+                    if "\\noselect" in flags:
+                        skip_reason = "'\\noselect' flag"
+                    elif "\\nonexistent" in flags:
+                        skip_reason = "'\\nonexistent' flag"
+                    elif name.lower() in SKIPPED_MAILBOXES:
+                        skip_reason = f"имя '{name.lower()}' в SKIPPED_MAILBOXES"
+
+                    if skip_reason:
+                        logger.debug(f"  -> Пропущен ящик '{name}' из-за: {skip_reason} (флаги: {flags})")
+                        continue
 
+                    mailbox_data = {
+                        "name": name,  # Оригинальное имя для использования в IMAP командах
+                        "display_name": display_name,  # Имя для отображения пользователю
+                        "delimiter": delimiter,
+                        "flags": list(flags),  # Преобразуем обратно в список для JSON-сериализации
+                        "special_use": next((flag for flag in SPECIAL_USE_FLAGS if flag in flags), None),
+                    }
+                    mailboxes_list.append(mailbox_data)
+                    logger.debug(f"  -> Добавлен ящик: {mailbox_data}")  # Лог добавленного ящика
+
+                else:
+                    logger.warning(f"  -> Не удалось распарсить строку списка ящиков для {user_email}: {line_str!r}")
+            except Exception as e:
+                logger.error(
+                    f"Ошибка при обработке строки ящика '{line!r}' для {user_email}: {e}", exc_info=True
+                )  # Лог ошибки обработки строки
+        elif line is not None:
+            logger.warning(f"Получена не байтовая или None строка в списке ящиков для {user_email}: {line!r}")
+
+    logger.info(
+        f"Получен и обработан список из {len(mailboxes_list)} ящиков для {user_email} после фильтрации"
+    )  # Обновленный лог
+
+    # Сортируем: сначала INBOX, потом остальные по display_name
+    def sort_key(mailbox):
+        if mailbox["name"] == "INBOX":
+            return (0, "")  # INBOX всегда первый
+        # Убираем префикс для сортировки, если он есть, чтобы Drafts и INBOX/Drafts были рядом
+        sort_name = mailbox["display_name"].lower()
+        return (1, sort_name)
+
+    mailboxes_list.sort(key=sort_key)
+    logger.debug(f"Отсортированный список ящиков для {user_email}: {mailboxes_list}")  # Лог после сортировки
+
+    # Родительская папка по разделителю иерархии, чтобы клиент мог построить дерево
+    names = {mailbox["name"] for mailbox in mailboxes_list}
+    for mailbox in mailboxes_list:
+        delimiter = mailbox["delimiter"]
+        parent = mailbox["name"].rsplit(delimiter, 1)[0] if delimiter and delimiter in mailbox["name"] else None
+        mailbox["parent"] = parent if parent in names else None
+    return mailboxes_list
+
+
+def _store_mailbox_tree(user_email: str, mailboxes: List[Dict]) -> None:
+    ttl = getattr(settings, "MAIL_MAILBOX_CACHE_TTL", 600)
+    if ttl > 0:
+        with _cache_lock:
+            _mailbox_cache[user_email] = (time.monotonic() + ttl, mailboxes)
+
+
+def _cached_mailbox_tree(user_email: str) -> Optional[List[Dict]]:
+    with _cache_lock:
+        cached = _mailbox_cache.get(user_email)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return None
+
+
+def _get_mailbox_tree(mail, user_email: str) -> List[Dict]:
+    """Список папок из кэша, при его отсутствии - LIST на переданном соединении."""
+    mailboxes = _cached_mailbox_tree(user_email)
+    if mailboxes is not None:
+        return mailboxes
+    try:
+        typ, data = mail.list()
+    except imaplib.IMAP4.error as e:
+        logger.debug(f"Не удалось получить список папок для {user_email}: {e}")
+        return []
+    if typ != "OK":
+        return []
+    mailboxes = _parse_mailbox_list(data, user_email)
+    _store_mailbox_tree(user_email, mailboxes)
+    return mailboxes
+
+
+def _resolve_mailbox_name(mailboxes: List[Dict], mailbox_name: str) -> Optional[str]:
+    """Находит серверное имя папки: точное совпадение, атрибут SPECIAL-USE или вариант с префиксом."""
+    names = {mailbox["name"] for mailbox in mailboxes}
+    if mailbox_name in names:
+        return mailbox_name
+    base_name = mailbox_name.lstrip("/")
+    if base_name.startswith(INBOX_PREFIX):
+        base_name = base_name[len(INBOX_PREFIX) :]
+    special_use = SPECIAL_USE_BY_NAME.get(base_name.lower())
+    if special_use:
+        for mailbox in mailboxes:
+            if mailbox["special_use"] == special_use:
+                return mailbox["name"]
+    for candidate in (base_name, f"{INBOX_PREFIX}{base_name}", f"/{base_name}", GMAIL_MAILBOXES.get(base_name)):
+        if candidate in names:
+            return candidate
+    for mailbox in mailboxes:
+        if mailbox["display_name"].lower() == base_name.lower():
+            return mailbox["name"]
+    return None
+
+
+def _quote_mailbox(name: str) -> str:
+    """Берет имя папки в кавычки, если в нем есть пробелы или спецсимволы IMAP."""
+    if name.startswith('"') or not MAILBOX_QUOTE_REGEX.search(name):
+        return name
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def list_mailboxes(user, refresh: bool = False) -> Tuple[Optional[List[Dict]], Optional[Tuple[str, str]]]:
+    """Подключается к IMAP, получает список почтовых ящиков. Возвращает (mailboxes_list, error).
+
+    Список кэшируется на MAIL_MAILBOX_CACHE_TTL секунд, ``refresh=True`` - запросить заново.
+    """
+    if not refresh:
+        mailboxes_list = _cached_mailbox_tree(user.email)
+        if mailboxes_list is not None:
+            return mailboxes_list, None
 
-def list_mailboxes(user) -> Tuple[Optional[List[Dict]], Optional[Tuple[str, str]]]:
-    """Подключается к IMAP, получает список почтовых ящиков. Возвращает (mailboxes_list, error)."""
     credentials, error = _get_user_credentials(user)
     if error:
         return None, error
 
-    mailboxes_list = []
-    mail = None
-    try:
-        mail, error = _connect_and_login(credentials)
-        if error:
-            return None, error
+    mail, error = imap_pool.acquire(credentials)
+    if error:
+        return None, error
 
+    session_broken = False
+    try:
         # Получаем список всех ящиков
         logger.debug(f"Запрос списка ящиков для {user.email}")  # Добавим лог перед запросом
         typ, data = mail.list()
         if typ != "OK":
             msg = f"Ошибка получения списка ящиков для {user.email}: {data}"
             logger.error(msg)
-            mail.logout()
             return None, (ERR_TYPE_OPERATION, msg)
 
         # Логируем необработанный ответ сервера
         logger.debug(f"Необработанный ответ mail.list() для {user.email}: {data}")
 
-        for line in data:
-            if isinstance(line, bytes):
-                try:
-                    line_str = line.decode("utf-8", errors="replace")  # Используем replace для безопасности
-                    logger.debug(f"Обработка строки ящика для {user.email}: {line_str!r}")  # Логируем саму строку
-                    match = MAILBOX_LIST_REGEX.match(line_str)
-                    if match:
-                        group_dict = match.groupdict()
-                        name = group_dict["name"]
-                        flags_str = group_dict["flags"]
-                        delimiter = group_dict["delimiter"]
-                        logger.debug(
-                            f"  -> Распарсено: name='{name}', flags='{flags_str}', delimiter='{delimiter}'"
-                        )  # Лог успешного парсинга
-
-                        # Очищаем имя от префикса INBOX., если он есть
-                        if name.startswith(INBOX_PREFIX):
-                            display_name = name[len(INBOX_PREFIX) :]
-                        else:
-                            display_name = name
-
-                        # Пропускаем системные/нежелательные ящики по флагам или имени
-                        flags = set(flags_str.lower().split())
-                        skip_reason = None
-                        if "\\noselect" in flags:
-                            skip_reason = "'\\noselect' flag"
-                        elif "\\nonexistent" in flags:
-                            skip_reason = "'\\nonexistent' flag"
-                        elif name.lower() in SKIPPED_MAILBOXES:
-                            skip_reason = f"имя '{name.lower()}' в SKIPPED_MAILBOXES"
-
-                        if skip_reason:
-                            logger.debug(f"  -> Пропущен ящик '{name}' из-за: {skip_reason} (флаги: {flags})")
-                            continue
-
-                        mailbox_data = {
-                            "name": name,  # Оригинальное имя для использования в IMAP командах
-                            "display_name": display_name,  # Имя для отображения пользователю
-                            "delimiter": delimiter,
-                            "flags": list(flags),  # Преобразуем обратно в список для JSON-сериализации
-                        }
-                        mailboxes_list.append(mailbox_data)
-                        logger.debug(f"  -> Добавлен ящик: {mailbox_data}")  # Лог добавленного ящика
-
-                    else:
-                        logger.warning(
-                            f"  -> Не удалось распарсить строку списка ящиков для {user.email}: {line_str!r}"
-                        )
-                except Exception as e:
-                    logger.error(
-                        f"Ошибка при обработке строки ящика '{line!r}' для {user.email}: {e}", exc_info=True
-                    )  # Лог ошибки обработки строки
-            elif line is not None:
-                logger.warning(f"Получена не байтовая или None строка в списке ящиков для {user.email}: {line!r}")
-
-        logger.info(
-            f"Получен и обработан список из {len(mailboxes_list)} ящиков для {user.email} после фильтрации"
-        )  # Обновленный лог
-        if mail:
-            mail.logout()
-
-        # Сортируем: сначала INBOX, потом остальные по display_name
-        def sort_key(mailbox):
-            if mailbox["name"] == "INBOX":
-                return (0, "")  # INBOX всегда первый
-            # Убираем префикс для сортировки, если он есть, чтобы Drafts и INBOX/Drafts были рядом
-            sort_name = mailbox["display_name"].lower()
-            return (1, sort_name)
-
-        mailboxes_list.sort(key=sort_key)
-        logger.debug(f"Отсортированный список ящиков для {user.email}: {mailboxes_list}")  # Лог после сортировки
+        mailboxes_list = _parse_mailbox_list(data, user.email)
+        _store_mailbox_tree(user.email, mailboxes_list)
 
         return mailboxes_list, None  # Успех
 
     except imaplib.IMAP4.error as e:
+        session_broken = True
         msg = f"Операционная ошибка IMAP при получении списка папок для {user.email}: {e}"
         logger.error(msg)
         error_info = (ERR_TYPE_OPERATION, msg)
     except ssl.SSLError as e:
+        session_broken = True
         msg = f"Ошибка SSL при получении списка папок для {user.email}: {e}"
         logger.error(msg)
         error_info = (ERR_TYPE_CONNECTION, msg)
     except Exception as e:
+        session_broken = True
         msg = f"Неизвестная ошибка при получении списка папок для {user.email}: {e}"
         logger.error(msg, exc_info=True)
         error_info = (ERR_TYPE_UNKNOWN, msg)
     finally:
-        if mail:
-            try:
-                mail.logout()
-            except Exception:
-                pass
+        imap_pool.release(credentials, mail, discard=session_broken)
 
     return None, error_info  # Возвращаем ошибку
 
@@ -0,0 +1,176 @@
+"""Выгрузки таблиц в файлы.
+
+Строки читаются из БД через values_list(...) - без создания экземпляров
+моделей, а связанные поля (client__company_name и т.п.) джойнятся в том же
+SQL запросе. Чтение идет частями по EXPORT_CHUNK_SIZE строк с условием по pk
+(keyset), а не одним запросом с iterator(): драйвер MySQL загружает весь
+результат запроса в память клиента до выдачи первой строки. CSV отдается потоком (StreamingHttpResponse),
+а Excel пишется write-only книгой openpyxl во временный файл и отдается через
+FileResponse, поэтому память воркера не зависит от числа строк в выгрузке.
+"""
+
+import csv
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from rest_framework.exceptions import ValidationError
+
+# Колонка выгрузки: ключ для ?columns= -> (заголовок, путь к значению для values_list)
+ExportColumns = Dict[str, Tuple[str, str]]
+
+ORDER_EXPORT_COLUMNS: ExportColumns = {
+    "id": ("ID", "id"),
+    "contract_number": ("Contract Number", "contract_number"),
+    "status": ("Status", "status"),
+    "client": ("Client", "client__company_name"),
+    "carrier": ("Carrier", "carrier__company_name"),
+    "created_by": ("Manager Email", "created_by__email"),
+    "transport_type": ("Transport Type", "transport_type"),
+    "loading_date": ("Loading Date", "loading_date"),
+    "loading_address": ("Loading Address", "loading_address"),
+    "unloading_address": ("Unloading Address", "unloading_address"),
+    "total_price": ("Total Price", "total_price"),
+    "payment_currency": ("Currency", "payment_currency"),
+    "payment_status": ("Payment Status", "payment_status"),
+    "created_at": ("Created At", "created_at"),
+}
+ORDER_EXPORT_DEFAULT_COLUMNS = ["contract_number", "status", "client", "created_by", "total_price"]
+
+CLIENT_EXPORT_COLUMNS: ExportColumns = {
+    "id": ("ID", "id"),
+    "company_name": ("Наименование компании", "company_name"),
+    "business_scope": ("Сфера деятельности", "business_scope"),
+    "address": ("Адрес", "address"),
+    "bank_details": ("Банковские реквизиты", "bank_details"),
+    "unp": ("УНП", "unp"),
+    "unn": ("УНН", "unn"),
+    "okpo": ("ОКПО", "okpo"),
+    "comments": ("Комментарии", "comments"),
+    "created_at": ("Дата создания", "created_at"),
+    "updated_at": ("Дата обновления", "updated_at"),
+}
+
+CARRIER_EXPORT_COLUMNS: ExportColumns = {
+    "id": ("ID", "id"),
+    "company_name": ("Наименование компании", "company_name"),
+    "working_directions": ("Направления работы", "working_directions"),
+    "location": ("Местоположение", "location"),
+    "fleet": ("Парк", "fleet"),
+    "comments": ("Комментарии", "comments"),
+    "known_rates": ("Известные тарифы", "known_rates"),
+    "vehicle_number": ("Количество ТС", "vehicle_number"),
+    "created_at": ("Дата создания", "created_at"),
+    "updated_at": ("Дата обновления", "updated_at"),
+}
+
+# Статистика финансового отчета по дням: ключ daily_stats -> (заголовок, сумма в валюте отчета)
+FINANCE_DAILY_EXPORT_COLUMNS = {
+    "date": ("Дата", False),
+    "orders": ("Заказов", False),
+    "revenue": ("Выручка", True),
+    "average_order_value": ("Средний чек", True),
+    "profit": ("Прибыль", True),
+}
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Сколько CSV строк склеивать в один кусок ответа
+CSV_LINES_PER_CHUNK = 500
+
+
+def select_columns(columns: ExportColumns, requested: Optional[str], default: Sequence[str]) -> List[str]:
+    """Ключи колонок из параметра ?columns=a,b,c (в порядке запроса) или набор по умолчанию."""
+    keys = [key.strip() for key in (requested or "").split(",") if key.strip()] or list(default)
+    unknown = [key for key in keys if key not in columns]
+    if unknown:
+        raise ValidationError({"columns": f"Неизвестные колонки: {', '.join(unknown)}. Доступны: {', '.join(columns)}"})
+    return keys
+
+
+def iter_rows(queryset, columns: ExportColumns, keys: Sequence[str]) -> Iterator[tuple]:
+    """Кортежи значений выбранных колонок, новые записи первыми.
+
+    Каждая часть - отдельный запрос ``pk < последний pk ORDER BY pk DESC LIMIT EXPORT_CHUNK_SIZE``,
+    поэтому в памяти одновременно не больше одной части.
+    """
+    paths = [columns[key][1] for key in keys]
+    queryset = queryset.order_by("-pk")
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__lt=last_pk)
+        rows = list(chunk.values_list("pk", *paths)[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает готовую строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header: Sequence[str], rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= CSV_LINES_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def stream_csv(queryset, columns: ExportColumns, keys: Sequence[str], filename: str) -> StreamingHttpResponse:
+    header = [columns[key][0] for key in keys]
+    response = StreamingHttpResponse(_csv_lines(header, iter_rows(queryset, columns, keys)), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _xlsx_value(value):
+    # Excel не хранит часовой пояс: даты пишутся в локальном времени сервера
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def write_xlsx(header: Sequence[str], rows: Iterable[Sequence], sheet_name: str):
+    """Пишет строки в write-only книгу openpyxl и возвращает временный файл с .xlsx.
+
+    Write-only книга не держит ячейки в памяти, а готовый файл лежит в памяти
+    только до EXPORT_SPOOL_MAX_MEMORY байт, дальше на диске.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_name)
+    sheet.append(list(header))
+    for row in rows:
+        sheet.append([_xlsx_value(value) for value in row])
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_MEMORY)
+    workbook.save(spool)
+    spool.seek(0)
+    return spool
+
+
+def rows_xlsx_response(header: Sequence[str], rows: Iterable[Sequence], sheet_name: str, filename: str) -> FileResponse:
+    """Excel файл из готовых строк (например, строк отчета)."""
+    spool = write_xlsx(header, rows, sheet_name)
+    # FileResponse закроет временный файл, когда ответ будет отправлен
+    return FileResponse(spool, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def xlsx_response(
+    queryset, columns: ExportColumns, keys: Sequence[str], sheet_name: str, filename: str
+) -> FileResponse:
+    header = [columns[key][0] for key in keys]
+    return rows_xlsx_response(header, iter_rows(queryset, columns, keys), sheet_name, filename)
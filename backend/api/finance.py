@@ -0,0 +1,254 @@
+"""Финансовый отчет по заказам.
+
+Отчет за период сравнивается с предыдущим периодом такой же длины. Оба
+периода идут подряд, поэтому все цифры отчета получаются одним запросом:
+суммы по дням за [начало предыдущего периода, конец текущего], а итоги
+периодов - сложением дневных строк. Суммы по дням читаются из таблицы
+DailyFinanceRollup (api/rollups.py), а не из заказов: годовой отчет
+читает несколько строк на день вместо всех заказов за год. Суммы в разных
+валютах переводятся в валюту отчета по курсам (api/fx.py).
+
+Разбивка по клиентам, перевозчикам, типам транспорта и маршрутам считается
+по заказам одним GROUP BY (группа, день, валюты); день и валюты нужны для
+перевода по курсам, после перевода строки складываются по группам.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .finance_cache import GENERATION_KEY, day_key, finance_cache, report_key
+from .fx import convert_totals, normalize_currency
+from .models import DailyFinanceRollup, Order
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+ZERO = Value(0, output_field=MONEY)
+# Прибыль заказа: ставка клиента (или цена заказа) минус ставка перевозчика
+ORDER_PROFIT = ExpressionWrapper(
+    Coalesce(F("client_rate"), F("total_price"), ZERO) - Coalesce(F("carrier_rate"), ZERO), output_field=MONEY
+)
+TOTALS_COLUMNS = ["date", "currency", "carrier_currency", "orders", "revenue", "profit", "carrier_rate_sum"]
+
+# Разбивка отчета: группировка -> поля заказа (первое - ключ группы)
+BREAKDOWN_GROUPS = {
+    "client": ("client_id", "client__company_name"),
+    "carrier": ("carrier_id", "carrier__company_name"),
+    "transport_type": ("transport_type",),
+    "route": ("loading_city", "unloading_city"),
+}
+BREAKDOWN_DEFAULT_LIMIT = 10
+BREAKDOWN_MAX_LIMIT = 100
+NOT_SPECIFIED = "Не указан"
+
+
+def created_between(start: date, end: date) -> Q:
+    """created_at в днях [start, end] как полуоткрытый интервал по самой колонке.
+
+    В отличие от created_at__date__range условие не оборачивает колонку в функцию
+    и использует индекс по created_at.
+    """
+    start = timezone.make_aware(datetime.combine(start, time.min))
+    end = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return Q(created_at__gte=start, created_at__lt=end)
+
+
+def previous_period(start: date, end: date) -> Tuple[date, date]:
+    """Период такой же длины, который заканчивается за день до ``start``."""
+    return start - (end - start) - timedelta(days=1), start - timedelta(days=1)
+
+
+def percent_change(current, previous):
+    if previous in (None, 0):
+        return 0
+    return round(((current - previous) / previous) * 100, 2)
+
+
+def daily_totals(start: date, end: date) -> pd.DataFrame:
+    """Итоги по дням и валютам - один запрос к таблице дневных итогов."""
+    rows = (
+        DailyFinanceRollup.objects.filter(date__range=(start, end))
+        .values("date", "currency", "carrier_currency")
+        .annotate(
+            orders=Sum("orders_count"),
+            revenue=Sum("revenue"),
+            profit=Sum("profit"),
+            carrier_rate_sum=Sum("carrier_rate_sum"),
+        )
+        .order_by("date")
+    )
+    return pd.DataFrame(list(rows), columns=TOTALS_COLUMNS)
+
+
+def _period_totals(days: pd.DataFrame) -> Dict:
+    revenue = float(days["revenue"].sum())
+    orders = int(days["orders"].sum())
+    return {
+        "revenue": revenue,
+        "orders": orders,
+        "average": round(revenue / orders, 2) if orders else 0,
+        "profit": float(days["profit"].sum()),
+    }
+
+
+def finance_report(start: date, end: date, currency: Optional[str] = None) -> Dict:
+    """Отчет за [start, end] в валюте ``currency`` с трендами к предыдущему периоду и статистикой по дням.
+
+    Без курса для какой-либо суммы периода поднимает fx.ExchangeRateMissing.
+    """
+    currency = normalize_currency(currency)
+    prev_start, _prev_end = previous_period(start, end)
+    converted = convert_totals(daily_totals(prev_start, end), currency)
+    days = converted.groupby("date", sort=True)[["orders", "revenue", "profit"]].sum().reset_index()
+    current_days = days[days["date"] >= start]
+    current = _period_totals(current_days)
+    previous = _period_totals(days[days["date"] < start])
+
+    daily_stats = [
+        {
+            "date": day.date.isoformat(),
+            "revenue": round(day.revenue, 2),
+            "orders": int(day.orders),
+            "average_order_value": round(day.revenue / day.orders, 2) if day.orders else 0,
+            "profit": round(day.profit, 2),
+        }
+        for day in current_days.itertuples()
+    ]
+    return {
+        "currency": currency,
+        "total_revenue": round(current["revenue"], 2),
+        "revenue_trend": percent_change(current["revenue"], previous["revenue"]),
+        "total_orders": current["orders"],
+        "orders_trend": percent_change(current["orders"], previous["orders"]),
+        "average_order_value": current["average"],
+        "average_order_trend": percent_change(current["average"], previous["average"]),
+        "profit": round(current["profit"], 2),
+        "profit_trend": percent_change(current["profit"], previous["profit"]),
+        "daily_stats": daily_stats,
+    }
+
+
+def cached_finance_report(start: date, end: date, currency: Optional[str] = None, scope: str = "all") -> Dict:
+    """finance_report через кэш (api/finance_cache.py).
+
+    ``scope`` - область видимости пользователя, входит в ключ. Отчет за
+    прошедший период хранится без срока, с сегодняшним днем - не дольше
+    FINANCE_REPORT_CACHE_TTL (на случай изменений заказов в обход сигналов).
+    """
+    currency = normalize_currency(currency)
+    prev_start, _prev_end = previous_period(start, end)
+    days = [prev_start + timedelta(days=offset) for offset in range((end - prev_start).days + 1)]
+    key = report_key("report", (scope, currency, start, end), [GENERATION_KEY] + [day_key(day) for day in days])
+    cache = finance_cache()
+    report = cache.get(key)
+    if report is None:
+        report = finance_report(start, end, currency)
+        timeout = None if end < timezone.localdate() else settings.FINANCE_REPORT_CACHE_TTL
+        cache.set(key, report, timeout)
+    return report
+
+
+def margin_percent(revenue: float, profit: float) -> float:
+    return round(profit / revenue * 100, 2) if revenue else 0
+
+
+def _breakdown_totals(rows: pd.DataFrame) -> Dict:
+    revenue, profit = float(rows["revenue"].sum()), float(rows["profit"].sum())
+    return {
+        "orders": int(rows["orders"].sum()),
+        "revenue": round(revenue, 2),
+        "profit": round(profit, 2),
+        "margin": margin_percent(revenue, profit),
+    }
+
+
+def _breakdown_label(group_by: str, values: tuple) -> Tuple:
+    """Ключ и подпись группы по значениям полей BREAKDOWN_GROUPS[group_by]."""
+    if group_by == "route":
+        if not any(values):
+            return None, NOT_SPECIFIED
+        route = " → ".join(city or NOT_SPECIFIED for city in values)
+        return route, route
+    key = values[0] if not pd.isna(values[0]) and values[0] != "" else None
+    if key is None:
+        return None, NOT_SPECIFIED
+    if group_by == "transport_type":
+        return key, dict(Order.TRANSPORT_TYPE_CHOICES).get(key, key)
+    return int(key), values[1] or NOT_SPECIFIED
+
+
+def breakdown_rows(start: date, end: date, group_by: str):
+    """Итоги заказов за [start, end] по группе ``group_by``, дню и валютам - один GROUP BY в базе."""
+    return (
+        Order.objects.filter(created_between(start, end))
+        .annotate(date=TruncDate("created_at"))
+        .values(*BREAKDOWN_GROUPS[group_by], "date", "payment_currency", "carrier_currency")
+        .annotate(
+            orders=Count("id"),
+            revenue=Coalesce(Sum("total_price"), ZERO, output_field=MONEY),
+            profit=Coalesce(Sum(ORDER_PROFIT), ZERO),
+            carrier_rate_sum=Coalesce(Sum("carrier_rate"), ZERO, output_field=MONEY),
+        )
+        .order_by()
+    )
+
+
+def finance_breakdown(
+    start: date, end: date, group_by: str, limit: int = BREAKDOWN_DEFAULT_LIMIT, currency: Optional[str] = None
+) -> Dict:
+    """Выручка, прибыль, маржа и число заказов за [start, end] по группам ``group_by``.
+
+    Возвращает ``limit`` групп с наибольшей выручкой, остальные группы одной
+    строкой "other" и итог. Без курса для какой-либо суммы поднимает fx.ExchangeRateMissing.
+    """
+    currency = normalize_currency(currency)
+    fields = list(BREAKDOWN_GROUPS[group_by])
+    rows = breakdown_rows(start, end, group_by)
+    columns = fields + [
+        "date",
+        "payment_currency",
+        "carrier_currency",
+        "orders",
+        "revenue",
+        "profit",
+        "carrier_rate_sum",
+    ]
+    frame = pd.DataFrame(list(rows), columns=columns).rename(columns={"payment_currency": "currency"})
+    converted = convert_totals(frame, currency)
+    if group_by in ("transport_type", "route"):
+        # NULL и "" - одна группа "не указан"
+        converted[fields] = converted[fields].fillna("")
+    groups = (
+        converted.groupby(fields, dropna=False, sort=False)[["orders", "revenue", "profit"]]
+        .sum()
+        .reset_index()
+        .sort_values("revenue", ascending=False, kind="stable")
+    )
+    top, rest = groups.iloc[:limit], groups.iloc[limit:]
+
+    items = []
+    for values, orders, revenue, profit in zip(
+        top[fields].itertuples(index=False, name=None), top["orders"], top["revenue"], top["profit"]
+    ):
+        key, label = _breakdown_label(group_by, values)
+        items.append(
+            {
+                "key": key,
+                "label": label,
+                "orders": int(orders),
+                "revenue": round(revenue, 2),
+                "profit": round(profit, 2),
+                "margin": margin_percent(revenue, profit),
+            }
+        )
+    return {
+        "group_by": group_by,
+        "currency": currency,
+        "items": items,
+        "other": {"groups": len(rest), **_breakdown_totals(rest)} if len(rest) else None,
+        "total": _breakdown_totals(groups),
+    }
@@ -0,0 +1,71 @@
+"""Кэш финансовых отчетов (кэш "finance" из CACHES).
+
+Отчет кэшируется под ключом из периода, фильтров, области видимости
+пользователя и версий данных, от которых он зависит: версии каждого дня
+периода (вместе с предыдущим периодом для трендов) и общей версии. Сигналы
+Order после коммита меняют версии дней, которых коснулся заказ, поэтому
+отчеты за эти дни перестают находиться в кэше, а отчеты за другие периоды
+остаются. Общая версия меняется при изменении курсов валют и пересборке итогов.
+
+Ключи отчетов не удаляются - устаревшие записи просто больше не читаются и
+вытесняются бэкендом кэша (MAX_ENTRIES). Нужны только get/set/add, поэтому
+подходят locmem и файловый кэш. Версия - метка времени в наносекундах, и
+пропавший из кэша счетчик получает новое значение, которое не совпадет со
+старым.
+"""
+
+import hashlib
+import time
+from datetime import date
+from typing import Iterable, List
+
+from django.core.cache import caches
+from django.db import transaction
+
+FINANCE_CACHE_ALIAS = "finance"
+GENERATION_KEY = "finance:generation"
+
+
+def finance_cache():
+    return caches[FINANCE_CACHE_ALIAS]
+
+
+def day_key(day: date) -> str:
+    return f"finance:day:{day.isoformat()}"
+
+
+def _fresh_version() -> int:
+    return time.time_ns()
+
+
+def versions(keys: List[str]) -> List[int]:
+    """Текущие значения счетчиков версий (отсутствующие заводятся)."""
+    cache = finance_cache()
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _fresh_version(), timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(keys: Iterable[str]) -> None:
+    # Новое уникальное значение вместо incr: в файловом кэше incr - это get и set без блокировки
+    finance_cache().set_many({key: _fresh_version() for key in keys}, timeout=None)
+
+
+def invalidate_days(days: Iterable[date]) -> None:
+    """После коммита транзакции сбрасывает отчеты, в период которых входит любой из дней."""
+    keys = sorted({day_key(day) for day in days})
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate_all() -> None:
+    """После коммита транзакции сбрасывает все отчеты (курсы валют, пересборка итогов)."""
+    transaction.on_commit(lambda: _bump([GENERATION_KEY]))
+
+
+def report_key(name: str, params: Iterable, version_keys: List[str]) -> str:
+    """Ключ записи отчета: параметры и хэш версий его данных."""
+    digest = hashlib.md5(":".join(map(str, versions(version_keys))).encode()).hexdigest()
+    return f"finance:{name}:{':'.join(map(str, params))}:{digest}"
@@ -0,0 +1,181 @@
+"""Перевод финансовых итогов в одну валюту по курсам ExchangeRate.
+
+Курсы хранятся к одной валюте FX_REFERENCE_CURRENCY: rate - сколько ее
+единиц стоит единица валюты. Перевод из A в B на дату - rate(A) / rate(B),
+где rate - последний курс на эту дату или раньше (не старше
+FX_RATE_MAX_AGE_DAYS). Курсы для всех строк подбираются одним
+pd.merge_asof по дате и валюте, суммы пересчитываются операциями над
+столбцами, без цикла по строкам.
+"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection
+
+from .finance_cache import invalidate_all
+from .models import ExchangeRate
+from .spreadsheets import SpreadsheetError, SpreadsheetReader
+
+# Сколько строк без курса перечислять в тексте ошибки
+MISSING_RATES_SHOWN = 5
+# Колонки файла курсов: поле -> допустимые заголовки
+RATE_FILE_COLUMNS = {
+    "date": ("Дата", "date"),
+    "currency": ("Валюта", "currency"),
+    "rate": ("Курс", "rate"),
+}
+RATE_FILE_BATCH_ROWS = 5000
+
+
+class ExchangeRateMissing(ValueError):
+    """Для перевода сумм не хватает курса валюты."""
+
+
+def normalize_currency(code: Optional[str]) -> str:
+    """Код валюты в верхнем регистре; пустой - валюта заказов без валюты (FINANCE_DEFAULT_CURRENCY)."""
+    return (code or "").strip().upper() or settings.FINANCE_DEFAULT_CURRENCY
+
+
+def _normalize_codes(codes: pd.Series) -> pd.Series:
+    codes = codes.fillna("").astype(str).str.strip().str.upper()
+    return codes.mask(codes == "", settings.FINANCE_DEFAULT_CURRENCY)
+
+
+def load_rates(currencies: Iterable[str], start: date, end: date) -> pd.DataFrame:
+    """Курсы валют, действующие в днях [start, end]: date (datetime64), currency, rate (float)."""
+    rows = ExchangeRate.objects.filter(
+        currency__in=list(currencies), date__range=(start - timedelta(days=settings.FX_RATE_MAX_AGE_DAYS), end)
+    ).values_list("date", "currency", "rate")
+    frame = pd.DataFrame(list(rows), columns=["date", "currency", "rate"])
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(frame["date"]),
+            "currency": frame["currency"].astype(object),
+            "rate": frame["rate"].astype(float),
+        }
+    ).sort_values("date", kind="stable")
+
+
+def _reference_rates(dates: pd.Series, codes: pd.Series, rates: pd.DataFrame) -> np.ndarray:
+    """Курс к FX_REFERENCE_CURRENCY для каждой пары (дата, валюта); NaN - курса нет."""
+    left = pd.DataFrame({"date": dates.to_numpy(), "currency": codes.to_numpy(), "position": np.arange(len(dates))})
+    merged = pd.merge_asof(
+        left.sort_values("date", kind="stable"),
+        rates,
+        on="date",
+        by="currency",
+        direction="backward",
+        tolerance=pd.Timedelta(days=settings.FX_RATE_MAX_AGE_DAYS),
+    ).sort_values("position")
+    values = merged["rate"].to_numpy(dtype=float, na_value=np.nan)
+    values[merged["currency"].to_numpy() == settings.FX_REFERENCE_CURRENCY] = 1.0
+    return values
+
+
+def conversion_factors(dates: pd.Series, codes: pd.Series, base: str, rates: pd.DataFrame) -> np.ndarray:
+    """Множители перевода сумм из валют ``codes`` на даты ``dates`` в валюту ``base``.
+
+    Суммы в самой ``base`` переводятся как есть, курс для них не нужен.
+    """
+    factors = np.ones(len(codes))
+    foreign = (codes != base).to_numpy()
+    if not foreign.any():
+        return factors
+    dates, codes = dates[foreign], codes[foreign]
+    source = _reference_rates(dates, codes, rates)
+    target = _reference_rates(dates, pd.Series(base, index=codes.index), rates)
+    missing = np.isnan(source) | np.isnan(target)
+    if missing.any():
+        pairs = pd.DataFrame({"currency": np.where(np.isnan(source), codes, base), "date": dates.dt.date})
+        pairs = pairs[missing].drop_duplicates().sort_values(["date", "currency"]).head(MISSING_RATES_SHOWN)
+        listed = ", ".join(f"{row.currency} на {row.date.isoformat()}" for row in pairs.itertuples())
+        raise ExchangeRateMissing(f"Нет курса валюты для перевода в {base}: {listed}")
+    factors[foreign] = source / target
+    return factors
+
+
+def convert_totals(frame: pd.DataFrame, base: Optional[str] = None) -> pd.DataFrame:
+    """Переводит строки итогов в валюту ``base``.
+
+    ``frame`` - строки итогов (DailyFinanceRollup или группировка заказов) с
+    колонками date, currency, carrier_currency, orders, revenue, profit,
+    carrier_rate_sum и любыми другими. Выручка переводится по валюте расчетов,
+    прибыль - как доход от клиента по валюте расчетов минус ставки
+    перевозчиков по валюте перевозчика (пустая - валюта расчетов). Возвращает
+    те же строки без carrier_rate_sum, с orders, revenue и profit (float, в ``base``).
+    """
+    base = normalize_currency(base)
+    dates = pd.to_datetime(frame["date"])
+    client_codes = _normalize_codes(frame["currency"])
+    carrier_raw = frame["carrier_currency"].fillna("").astype(str).str.strip()
+    carrier_codes = _normalize_codes(carrier_raw.where(carrier_raw != "", frame["currency"]))
+    currencies = (set(client_codes) | set(carrier_codes) | {base}) - {settings.FX_REFERENCE_CURRENCY}
+    if len(frame) and (set(client_codes) | set(carrier_codes)) - {base}:
+        rates = load_rates(currencies, dates.min().date(), dates.max().date())
+    else:
+        rates = None
+    client_factor = conversion_factors(dates, client_codes, base, rates)
+    carrier_factor = conversion_factors(dates, carrier_codes, base, rates)
+
+    carrier_sum = frame["carrier_rate_sum"].astype(float).to_numpy()
+    # В итогах прибыль - доход от клиента минус ставки перевозчиков в их валютах без пересчета
+    income = frame["profit"].astype(float).to_numpy() + carrier_sum
+    return frame.drop(columns="carrier_rate_sum").assign(
+        orders=frame["orders"].astype(int),
+        revenue=frame["revenue"].astype(float).to_numpy() * client_factor,
+        profit=income * client_factor - carrier_sum * carrier_factor,
+    )
+
+
+def _rate_file_columns(header: List[str]) -> dict:
+    titles = {title.strip().lower(): title for title in header}
+    columns, missing = {}, []
+    for field, names in RATE_FILE_COLUMNS.items():
+        title = next((titles[name.lower()] for name in names if name.lower() in titles), None)
+        if title is None:
+            missing.append(names[0])
+        columns[field] = title
+    if missing:
+        raise SpreadsheetError(f"В файле нет колонок: {', '.join(missing)}")
+    return columns
+
+
+def load_rates_file(file, name: str) -> Tuple[int, List[str]]:
+    """Загружает курсы из .xlsx/.csv (колонки Дата, Валюта, Курс); существующие курсы на те же даты заменяются.
+
+    Возвращает число сохраненных курсов и ошибки строк.
+    """
+    saved, errors = 0, []
+    with SpreadsheetReader(file, name) as reader:
+        columns = _rate_file_columns(reader.header)
+        for batch in reader.iter_batches(RATE_FILE_BATCH_ROWS):
+            frame = batch.frame
+            dates = pd.to_datetime(frame[columns["date"]], errors="coerce", dayfirst=True, format="mixed")
+            codes = frame[columns["currency"]].fillna("").astype(str).str.strip().str.upper()
+            rates = pd.to_numeric(
+                frame[columns["rate"]].astype(str).str.strip().str.replace(",", ".", regex=False), errors="coerce"
+            )
+            valid = dates.notna() & (codes != "") & (rates > 0)
+            errors.extend(f"Строка {row}: нужны дата, валюта и курс больше нуля" for row in frame.index[~valid])
+            # Повтор курса на ту же дату в файле: действует последний
+            loaded = pd.DataFrame({"date": dates.dt.date, "currency": codes, "rate": rates})[valid]
+            loaded = loaded.drop_duplicates(["currency", "date"], keep="last")
+            objects = [
+                ExchangeRate(date=day, currency=code, rate=Decimal(f"{rate:.6f}"))
+                for day, code, rate in loaded.itertuples(index=False)
+            ]
+            # MySQL (ON DUPLICATE KEY UPDATE) не принимает список полей уникального ключа
+            unique_fields = ["currency", "date"] if connection.features.supports_update_conflicts_with_target else None
+            ExchangeRate.objects.bulk_create(
+                objects, update_conflicts=True, unique_fields=unique_fields, update_fields=["rate"]
+            )
+            saved += len(objects)
+    # bulk_create не отправляет сигналы ExchangeRate
+    if saved:
+        invalidate_all()
+    return saved, errors
@@ -0,0 +1,216 @@
+"""Фоновый импорт клиентов и перевозчиков.
+
+Загрузка файла только проверяет заголовки, сохраняет файл и создает
+ImportJob (ответ 202), а сам импорт выполняет воркер import_worker. Файл
+читается потоково (SpreadsheetReader) частями по IMPORT_JOB_CHUNK_ROWS строк:
+каждая часть импортируется и отмечается в processed_rows одной транзакцией,
+поэтому после падения или перезапуска воркера чтение продолжается с первой
+необработанной строки без дублей, а ошибки первых частей видны в статусе
+задачи, пока остальной файл еще не прочитан.
+
+Задачи забираются в работу условным UPDATE, как письма в outbox. Воркер
+обновляет claimed_at после каждой части; задача, которая не обновлялась
+дольше IMPORT_JOB_CLAIM_TIMEOUT секунд, считается брошенной и ее подхватывает
+другой воркер.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .duplicates import DuplicateIndex
+from .importers import CARRIER_IMPORT, CLIENT_IMPORT, FIRST_DATA_ROW, ImportReport, import_frame
+from .models import ImportJob
+from .spreadsheets import RowBatch, SpreadsheetError, SpreadsheetReader
+
+logger = logging.getLogger(__name__)
+
+IMPORT_SPECS = {
+    ImportJob.Kinds.CLIENTS: CLIENT_IMPORT,
+    ImportJob.Kinds.CARRIERS: CARRIER_IMPORT,
+}
+
+
+class ClaimLost(Exception):
+    """Задачу забрал другой воркер, пока эта часть импортировалась."""
+
+
+def validate_upload(kind: str, uploaded_file) -> Optional[str]:
+    """Проверяет формат и заголовки загруженного файла, не читая строки данных. Возвращает текст ошибки."""
+    try:
+        with SpreadsheetReader(uploaded_file, uploaded_file.name) as reader:
+            missing = IMPORT_SPECS[kind].missing_columns(reader.header)
+    except SpreadsheetError as e:
+        return str(e)
+    finally:
+        uploaded_file.seek(0)
+    if missing:
+        return f"В файле нет колонки: {', '.join(missing)}"
+    return None
+
+
+def enqueue_import(user, kind: str, uploaded_file, on_duplicate: str = "skip") -> ImportJob:
+    """Сохраняет загруженный файл и ставит его импорт в очередь."""
+    job = ImportJob.objects.create(
+        user=user, kind=kind, file=uploaded_file, file_name=uploaded_file.name, on_duplicate=on_duplicate
+    )
+    logger.info(f"Импорт #{job.id} ({kind}) файла {uploaded_file.name} от {user.email} поставлен в очередь")
+    return job
+
+
+def job_status(job: ImportJob) -> Dict:
+    """Состояние задачи для /imports/<id>/: прогресс, итоги и оценка оставшегося времени."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "file_name": job.file_name,
+        "status": job.status,
+        "total_rows": job.total_rows,
+        "processed_rows": job.processed_rows,
+        "progress": job.progress,
+        "eta_seconds": job.eta_seconds,
+        "created": job.created_count,
+        "updated": job.updated_count,
+        "skipped": job.skipped_count,
+        "duplicates": job.duplicate_count,
+        "errors": job.errors,
+        "warnings": job.warnings,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _claimable(now) -> Q:
+    stale = now - timedelta(seconds=settings.IMPORT_JOB_CLAIM_TIMEOUT)
+    return Q(status=ImportJob.Statuses.QUEUED) | Q(status=ImportJob.Statuses.RUNNING, claimed_at__lt=stale)
+
+
+def claim_batch(limit: int) -> List[ImportJob]:
+    """Забирает в работу до ``limit`` задач: новые и брошенные другими воркерами."""
+    now = timezone.now()
+    candidate_ids = list(
+        ImportJob.objects.filter(_claimable(now)).order_by("created_at").values_list("id", flat=True)[:limit]
+    )
+    claimed = []
+    for job_id in candidate_ids:
+        updated = ImportJob.objects.filter(_claimable(now), id=job_id).update(
+            status=ImportJob.Statuses.RUNNING,
+            claimed_at=now,
+            run_started_at=now,
+            run_started_rows=F("processed_rows"),
+        )
+        if updated:
+            claimed.append(job_id)
+    return list(ImportJob.objects.select_related("user").filter(id__in=claimed))
+
+
+def _append_messages(target: list, messages: list) -> list:
+    # В задаче храним только первые IMPORT_JOB_MAX_MESSAGES сообщений, счетчики - полные
+    room = settings.IMPORT_JOB_MAX_MESSAGES - len(target)
+    return target + sorted(messages, key=lambda item: item["row"])[: max(room, 0)]
+
+
+def _import_chunk(job: ImportJob, batch: RowBatch, index: DuplicateIndex) -> None:
+    """Импортирует пачку строк и сдвигает контрольную точку в той же транзакции."""
+    report = ImportReport()
+    now = timezone.now()
+    with transaction.atomic():
+        import_frame(
+            IMPORT_SPECS[job.kind],
+            batch.frame,
+            job.user,
+            report,
+            first_row=None,
+            index=index,
+            on_duplicate=job.on_duplicate,
+        )
+        errors = _append_messages(job.errors, report.errors)
+        warnings = _append_messages(job.warnings, report.warnings)
+        updated = ImportJob.objects.filter(
+            id=job.id, status=ImportJob.Statuses.RUNNING, claimed_at=job.claimed_at
+        ).update(
+            processed_rows=batch.end,
+            created_count=F("created_count") + report.created,
+            updated_count=F("updated_count") + report.updated,
+            skipped_count=F("skipped_count") + report.skipped,
+            duplicate_count=F("duplicate_count") + report.duplicates,
+            errors=errors,
+            warnings=warnings,
+            claimed_at=now,
+        )
+        if not updated:
+            raise ClaimLost()
+    job.processed_rows = batch.end
+    job.created_count += report.created
+    job.updated_count += report.updated
+    job.skipped_count += report.skipped
+    job.duplicate_count += report.duplicates
+    job.errors, job.warnings, job.claimed_at = errors, warnings, now
+
+
+def _finish(job: ImportJob, status: str, **fields) -> None:
+    ImportJob.objects.filter(id=job.id, claimed_at=job.claimed_at).update(
+        status=status, claimed_at=None, finished_at=timezone.now(), **fields
+    )
+
+
+def run_job(job: ImportJob, stop_event: Optional[threading.Event] = None) -> None:
+    """Импортирует файл задачи с контрольной точки до конца.
+
+    При остановке воркера (stop_event) задача возвращается в очередь и будет
+    продолжена с последней обработанной строки.
+    """
+    close_old_connections()
+    try:
+        with job.file.open("rb") as file, SpreadsheetReader(file, job.file_name) as reader:
+            if job.total_rows is None:
+                job.total_rows = reader.count_rows()
+                ImportJob.objects.filter(id=job.id).update(total_rows=job.total_rows)
+            if job.processed_rows:
+                logger.info(f"Импорт #{job.id}: продолжение со строки {job.processed_rows + FIRST_DATA_ROW}")
+
+            # Индекс дубликатов строится один раз на запуск и пополняется строками файла
+            index = DuplicateIndex.build(IMPORT_SPECS[job.kind])
+            for batch in reader.iter_batches(settings.IMPORT_JOB_CHUNK_ROWS, skip=job.processed_rows):
+                if stop_event is not None and stop_event.is_set():
+                    ImportJob.objects.filter(id=job.id, claimed_at=job.claimed_at).update(
+                        status=ImportJob.Statuses.QUEUED, claimed_at=None
+                    )
+                    logger.info(
+                        f"Импорт #{job.id} прерван на строке {job.processed_rows + FIRST_DATA_ROW}, "
+                        "возвращен в очередь"
+                    )
+                    return
+                _import_chunk(job, batch, index)
+
+        # Загруженный файл больше не нужен; при ошибке он остается для повторного разбора.
+        # Размер листа в .xlsx - оценка, по завершении известно точное число строк
+        job.file.delete(save=False)
+        _finish(job, ImportJob.Statuses.DONE, file="", total_rows=job.processed_rows)
+        logger.info(
+            f"Импорт #{job.id} завершен: строк {job.processed_rows}, создано {job.created_count}, "
+            f"обновлено {job.updated_count}, дубликатов {job.duplicate_count}, пропущено {job.skipped_count}"
+        )
+    except ClaimLost:
+        logger.warning(f"Импорт #{job.id} забран другим воркером, обработка остановлена")
+    except Exception as e:
+        logger.error(f"Импорт #{job.id} завершился ошибкой: {e}", exc_info=True)
+        _finish(job, ImportJob.Statuses.FAILED, last_error=str(e))
+    finally:
+        close_old_connections()
+
+
+def process_imports(executor: ThreadPoolExecutor, limit: int, stop_event: Optional[threading.Event] = None) -> int:
+    """Забирает до ``limit`` задач и выполняет их параллельно. Возвращает число задач."""
+    jobs = claim_batch(limit)
+    if jobs:
+        list(executor.map(lambda job: run_job(job, stop_event), jobs))
+    return len(jobs)
@@ -0,0 +1,317 @@
+"""Массовый импорт клиентов и перевозчиков из Excel.
+
+Данные нормализуются по колонкам (pandas), без обхода строк в Python, а
+записи создаются bulk_create пачками по IMPORT_BATCH_SIZE в одной транзакции.
+Строки с ошибками пропускаются и попадают в отчет с номером строки файла,
+остальные импортируются.
+
+Дубликаты (см. DuplicateIndex) определяются за один проход по строкам по
+индексу, построенному один раз на импорт: строка, совпавшая с существующей
+записью или с предыдущей строкой файла, пропускается (ON_DUPLICATE_SKIP) или
+дополняет существующую запись непустыми значениями (ON_DUPLICATE_UPDATE).
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .duplicates import DuplicateIndex
+from .models import Carrier, CarrierContact, Client, ClientContact
+from .utils import (
+    CONTACT_EMAIL_PATTERN,
+    CONTACT_NAME_PATTERN,
+    CONTACT_PHONE_PATTERN,
+    extract_contact_info,
+    normalize_phone_series,
+)
+
+logger = logging.getLogger(__name__)
+
+# Формат, который пропускает валидатор CarrierContact.phone / ClientContact.phone
+VALID_PHONE_RE = r"^\+375\d{9}$"
+# Номер первой строки данных в Excel: строка 1 - заголовки
+FIRST_DATA_ROW = 2
+
+# Что делать со строкой, которая совпала с уже существующей записью
+ON_DUPLICATE_SKIP = "skip"
+ON_DUPLICATE_UPDATE = "update"
+
+
+class ImportSpec:
+    """Что и куда импортируется: модель, модель контактов и колонки Excel."""
+
+    def __init__(self, model, contact_model, contact_fk: str, columns: Dict[str, str]):
+        self.model = model
+        self.contact_model = contact_model
+        self.contact_fk = contact_fk
+        self.columns = columns  # заголовок Excel -> поле
+        self.fields = [field for field in columns.values() if field not in ("contact_info", "manager_name")]
+
+    def missing_columns(self, header: List[str]) -> List[str]:
+        """Обязательные колонки (наименование компании), которых нет в заголовке файла."""
+        present = {str(title).strip() for title in header}
+        return [title for title, field in self.columns.items() if field == "company_name" and title not in present]
+
+
+CLIENT_IMPORT = ImportSpec(
+    Client,
+    ClientContact,
+    "client",
+    {
+        "Наименование компании": "company_name",
+        "Сфера деятельности": "business_scope",
+        "УНП": "unp",
+        "УНН": "unn",
+        "ОКПО": "okpo",
+        "Контакты": "contact_info",
+        "Менеджер": "manager_name",
+        "Комментарии": "comments",
+    },
+)
+
+CARRIER_IMPORT = ImportSpec(
+    Carrier,
+    CarrierContact,
+    "carrier",
+    {
+        "Наименование": "company_name",
+        "Направления": "working_directions",
+        "Расположение/Местоположение": "location",
+        "Парк": "fleet",
+        "Контактная информация": "contact_info",
+        "Менеджер": "manager_name",
+        "comments": "comments",
+        "Известные тарифы": "known_rates",
+    },
+)
+
+
+class ImportReport:
+    """Итог импорта: сколько создано и что не так с отдельными строками файла."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.errors: List[Dict] = []  # строка не импортирована
+        self.warnings: List[Dict] = []  # часть данных строки отброшена или строка - дубликат
+
+    def add_messages(self, target: List[Dict], messages: pd.Series) -> None:
+        for row, message in messages.items():
+            target.append({"row": int(row), "message": message})
+
+    def as_dict(self) -> Dict:
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "duplicates": self.duplicates,
+            "errors": sorted(self.errors, key=lambda item: item["row"]),
+            "warnings": sorted(self.warnings, key=lambda item: item["row"]),
+        }
+
+
+def _text(frame: pd.DataFrame, column: str) -> pd.Series:
+    if column not in frame:
+        return pd.Series("", index=frame.index, dtype="string")
+    return frame[column].astype("string").fillna("").str.strip()
+
+
+def _parse_contacts(info: pd.Series, manager: pd.Series, report: ImportReport) -> pd.DataFrame:
+    """Имя, телефон и email из колонки контактов.
+
+    Формат "Имя: X, Телефон: Y, Email: Z" разбирается регулярными выражениями
+    по всей колонке сразу; свободный текст - построчно через extract_contact_info.
+    """
+    name = info.str.extract(CONTACT_NAME_PATTERN, flags=re.IGNORECASE)[0].str.strip()
+    raw_phone = info.str.extract(CONTACT_PHONE_PATTERN, flags=re.IGNORECASE)[0].str.strip()
+    email = info.str.extract(CONTACT_EMAIL_PATTERN, flags=re.IGNORECASE)[0].str.strip()
+    contacts = pd.DataFrame({"name": name, "phone": normalize_phone_series(raw_phone), "email": email}, dtype=object)
+
+    labeled = contacts.notna().any(axis=1) | raw_phone.notna()
+    free_text = (info != "") & ~labeled
+    if free_text.any():
+        parsed = info[free_text].map(extract_contact_info)
+        contacts.loc[free_text, ["name", "phone", "email"]] = pd.DataFrame(
+            parsed.tolist(), index=parsed.index, columns=["name", "phone", "email"]
+        )
+
+    # Номер, который не привести к +375XXXXXXXXX, не пройдет валидатор модели - отбрасываем
+    phone = contacts["phone"].astype("string")
+    invalid = phone.notna() & ~phone.str.match(VALID_PHONE_RE).fillna(False)
+    unrecognized = raw_phone.notna() & contacts["phone"].isna()
+    report.add_messages(report.warnings, ("Телефон не распознан: " + raw_phone[unrecognized | invalid]))
+    contacts.loc[invalid, "phone"] = None
+
+    contacts.loc[manager != "", "name"] = manager[manager != ""]
+    contacts = contacts.where(contacts.notna(), None)
+    contacts["present"] = (info != "") & contacts[["name", "phone", "email"]].notna().any(axis=1)
+    return contacts
+
+
+def normalize_frame(
+    spec: ImportSpec, frame: pd.DataFrame, report: ImportReport, first_row: Optional[int] = FIRST_DATA_ROW
+):
+    """Приводит лист Excel к полям модели. Возвращает (строки без ошибок, их контакты).
+
+    ``first_row`` - номер в файле первой строки ``frame``; None - индекс
+    ``frame`` уже содержит номера строк (пачки SpreadsheetReader).
+    """
+    frame = frame.rename(columns=lambda title: str(title).strip())
+    frame = frame.rename(columns={title.strip(): field for title, field in spec.columns.items()})
+    if first_row is not None:
+        frame.index = pd.RangeIndex(first_row, first_row + len(frame))
+
+    records = pd.DataFrame({field: _text(frame, field) for field in spec.fields}, index=frame.index)
+    errors = pd.Series("", index=frame.index, dtype="string")
+    errors[records["company_name"] == ""] = "Не указано наименование компании; "
+    for field in spec.fields:
+        model_field = spec.model._meta.get_field(field)
+        if model_field.max_length:
+            too_long = records[field].str.len() > model_field.max_length
+            errors[too_long] = (
+                errors[too_long] + f"{model_field.verbose_name}: длиннее {model_field.max_length} символов; "
+            )
+
+    failed = errors != ""
+    report.add_messages(report.errors, errors[failed].str.rstrip("; "))
+    report.skipped += int(failed.sum())
+
+    valid = records[~failed]
+    contacts = _parse_contacts(_text(frame, "contact_info")[~failed], _text(frame, "manager_name")[~failed], report)
+    return valid, contacts
+
+
+def resolve_duplicates(
+    index: DuplicateIndex, valid: pd.DataFrame, contacts: pd.DataFrame, report: ImportReport, on_duplicate: str
+):
+    """Один проход по строкам: новые строки, обновления существующих записей и дубликаты.
+
+    Возвращает (номера строк для создания, {id записи: номер строки} для обновления).
+    Новые строки добавляются в индекс, поэтому повтор внутри файла тоже находится.
+    """
+    new_rows, updates = [], {}
+    codes = valid[index.code_fields].to_dict("records") if index.code_fields else [{}] * len(valid)
+    for row, name, row_codes, contact in zip(valid.index, valid["company_name"], codes, contacts.to_dict("records")):
+        phones, emails = (contact["phone"],), (contact["email"],)
+        found = index.match(name, row_codes, phones, emails)
+        if found is None:
+            index.add(("row", row), name, row_codes, phones, emails)
+            new_rows.append(row)
+            continue
+        ref, reason = found
+        if isinstance(ref, tuple) or ref in updates:
+            first_row = ref[1] if isinstance(ref, tuple) else updates[ref]
+            message = f"Повтор строки {first_row} ({reason})"
+        elif on_duplicate == ON_DUPLICATE_UPDATE:
+            updates[ref] = row
+            continue
+        else:
+            message = f"Уже есть: {index.names[ref]} (#{ref}), совпадение: {reason}"
+        report.duplicates += 1
+        report.warnings.append({"row": int(row), "message": message})
+    return new_rows, updates
+
+
+def _contact(spec: ImportSpec, owner, contact: Dict):
+    return spec.contact_model(
+        **{spec.contact_fk: owner},
+        name=contact["name"] or "",
+        phone=contact["phone"] or "",
+        email=contact["email"] or "",
+        contact_type="manager",
+    )
+
+
+def _apply_updates(spec: ImportSpec, index: DuplicateIndex, updates: Dict, valid, contacts, report) -> None:
+    """Дополняет существующие записи непустыми значениями из файла и добавляет новые контакты."""
+    objects = spec.model.objects.in_bulk(list(updates))
+    changed = set()
+    new_contacts = []
+    for pk, row in updates.items():
+        for field, value in valid.loc[row].items():
+            if value:
+                setattr(objects[pk], field, value)
+                changed.add(field)
+        contact = contacts.loc[row]
+        if contact["present"] and not index.knows((contact["phone"],), (contact["email"],)):
+            new_contacts.append(_contact(spec, objects[pk], contact))
+    if changed:
+        spec.model.objects.bulk_update(list(objects.values()), sorted(changed), batch_size=settings.IMPORT_BATCH_SIZE)
+    spec.contact_model.objects.bulk_create(new_contacts, batch_size=settings.IMPORT_BATCH_SIZE)
+    report.updated += len(updates)
+
+
+def _create_batch(spec: ImportSpec, user, batch: pd.DataFrame) -> List:
+    """Создает записи пачки одним bulk_create и возвращает их с pk.
+
+    MySQL (и MariaDB до 10.5) не возвращает pk из многострочного INSERT, тогда
+    созданные записи перечитываются по наименованию: внутри импорта оно не
+    повторяется, повторы отсеивает resolve_duplicates.
+    """
+    objects = [spec.model(created_by=user, **values) for values in batch.to_dict("records")]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return spec.model.objects.bulk_create(objects)
+
+    previous_pk = spec.model.objects.aggregate(last=Max("pk"))["last"] or 0
+    spec.model.objects.bulk_create(objects)
+    created = spec.model.objects.filter(
+        created_by=user, pk__gt=previous_pk, company_name__in=[obj.company_name for obj in objects]
+    )
+    pks = dict(created.order_by("pk").values_list("company_name", "pk"))
+    for obj in objects:
+        obj.pk = pks[obj.company_name]
+        obj._state.adding = False
+    return objects
+
+
+def import_frame(
+    spec: ImportSpec,
+    frame: pd.DataFrame,
+    user,
+    report: Optional[ImportReport] = None,
+    first_row: Optional[int] = FIRST_DATA_ROW,
+    index: Optional[DuplicateIndex] = None,
+    on_duplicate: str = ON_DUPLICATE_SKIP,
+) -> ImportReport:
+    """Импортирует лист (или его часть) в БД и возвращает отчет.
+
+    ``index`` - индекс дубликатов; при импорте по частям его строят один раз
+    и передают во все части, иначе он строится здесь.
+    """
+    report = report or ImportReport()
+    if index is None:
+        index = DuplicateIndex.build(spec)
+    valid, contacts = normalize_frame(spec, frame, report, first_row)
+    new_rows, updates = resolve_duplicates(index, valid, contacts, report, on_duplicate)
+    records = valid.loc[new_rows]
+    batch_size = settings.IMPORT_BATCH_SIZE
+
+    with transaction.atomic():
+        if updates:
+            _apply_updates(spec, index, updates, valid, contacts, report)
+        for start in range(0, len(records), batch_size):
+            batch = records.iloc[start : start + batch_size]
+            objects = _create_batch(spec, user, batch)
+            batch_contacts = contacts.loc[batch.index]
+            present = batch_contacts["present"].to_numpy()
+            spec.contact_model.objects.bulk_create(
+                [
+                    _contact(spec, obj, contact)
+                    for obj, contact, has_contact in zip(objects, batch_contacts.to_dict("records"), present)
+                    if has_contact
+                ]
+            )
+            report.created += len(objects)
+
+    logger.info(
+        f"Импорт {spec.model._meta.verbose_name_plural}: создано {report.created}, обновлено {report.updated}, "
+        f"дубликатов {report.duplicates}, пропущено {report.skipped}, предупреждений {len(report.warnings)}"
+    )
+    return report
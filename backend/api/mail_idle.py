@@ -0,0 +1,329 @@
+"""Фоновая синхронизация почты через IMAP IDLE.
+
+Один поток с селектором держит IDLE сессии всех пользователей с включенной
+интеграцией почты. Когда сервер сообщает об изменениях (EXISTS, EXPUNGE,
+FETCH), сессия выходит из IDLE и синхронизация папки (mail_sync.sync_mailbox)
+выполняется в ограниченном пуле потоков. Об узнанных новых письмах
+рассылается сигнал new_mail_received и создается Notification. После
+синхронизации в поисковый индекс догружается очередная порция тел писем
+(MAIL_SEARCH_BODY_BATCH).
+
+imaplib (до Python 3.14) не умеет IDLE, поэтому команда отправляется
+вручную. На время IDLE буферизованный файл imaplib подменяется небуферизованным,
+чтобы ответы сервера не "застревали" в буфере, невидимом для select().
+"""
+
+import logging
+import re
+import selectors
+import ssl
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.dispatch import Signal
+
+from .email_service import _connect_and_login, _get_user_credentials, _select_mailbox
+from .mail_search import index_bodies
+from .mail_sync import get_state, sync_mailbox
+from .models import Notification, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Рассылается при появлении новых писем: kwargs profile, mailbox, count
+new_mail_received = Signal()
+
+IDLE_RENEW_INTERVAL = 29 * 60  # RFC 2177: сервер может закрыть IDLE через 30 минут
+PROFILES_REFRESH_INTERVAL = 60  # Как часто перечитывать список профилей с включенной почтой
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 300
+
+IDLE_EVENT_RE = re.compile(rb"^\* \d+ (EXISTS|EXPUNGE|FETCH)\b", re.IGNORECASE)
+IDLE_BYE_RE = re.compile(rb"^\* BYE\b", re.IGNORECASE)
+
+
+class IdleSession:
+    """IMAP соединение одного пользователя и его состояние в цикле IDLE."""
+
+    def __init__(self, profile_id: int, mailbox: str):
+        self.profile_id = profile_id
+        self.mailbox = mailbox
+        self.conn = None
+        self.tag: Optional[bytes] = None
+        self.idle_since = 0.0
+        self.needs_sync = True
+        self.busy = False
+        self.retry_at = 0.0
+        self.retry_delay = RECONNECT_DELAY
+        self._buffered_file = None
+        self._raw_file = None
+
+    @property
+    def idling(self) -> bool:
+        return self.tag is not None
+
+    def start_idle(self) -> None:
+        self._buffered_file = self.conn.file
+        self._raw_file = self.conn.sock.makefile("rb", buffering=0)
+        self.conn.file = self._raw_file
+        self.tag = self.conn._new_tag()
+        self.conn.send(self.tag + b" IDLE\r\n")
+        line = self._readline()
+        while line.startswith(b"* "):
+            line = self._readline()
+        if not line.startswith(b"+"):
+            self._restore_file()
+            self.tag = None
+            raise ConnectionError(f"Сервер отклонил IDLE: {line!r}")
+        self.idle_since = time.monotonic()
+
+    def has_pending(self) -> bool:
+        """Есть ли уже расшифрованные SSL данные, которых не видит select()."""
+        sock = self.conn.sock if self.conn else None
+        return isinstance(sock, ssl.SSLSocket) and sock.pending() > 0
+
+    def read_events(self) -> bool:
+        """Читает уведомления сервера. Возвращает True, если в папке что-то изменилось."""
+        changed = False
+        while True:
+            line = self._readline()
+            if IDLE_BYE_RE.match(line):
+                raise ConnectionError("Сервер закрыл IDLE сессию (BYE)")
+            if IDLE_EVENT_RE.match(line):
+                changed = True
+            if not self.has_pending():
+                return changed
+
+    def stop_idle(self) -> None:
+        tag, self.tag = self.tag, None
+        try:
+            self.conn.send(b"DONE\r\n")
+            while True:
+                line = self._readline()
+                if line.startswith(tag + b" "):
+                    break
+        finally:
+            self._restore_file()
+        if not line.startswith(tag + b" OK"):
+            raise ConnectionError(f"Ошибка завершения IDLE: {line!r}")
+
+    def close(self) -> None:
+        self.tag = None
+        self._restore_file()
+        if self.conn is not None:
+            try:
+                self.conn.shutdown()
+            except Exception:
+                pass
+        self.conn = None
+
+    def _readline(self) -> bytes:
+        line = self._raw_file.readline()
+        if not line:
+            raise ConnectionError("Соединение с IMAP сервером закрыто")
+        return line
+
+    def _restore_file(self) -> None:
+        if self._buffered_file is not None and self.conn is not None:
+            self.conn.file = self._buffered_file
+        self._buffered_file = None
+        if self._raw_file is not None:
+            self._raw_file.close()
+            self._raw_file = None
+
+
+class MailIdleWorker:
+    """Мультиплексирует IDLE сессии в одном потоке, синхронизацию выполняет пул потоков.
+
+    ``max_workers=0`` - синхронизация выполняется прямо в цикле (удобно для
+    отладки и тестов). ``credentials_for(profile)`` возвращает (credentials, error)
+    в формате email_service.
+    """
+
+    def __init__(
+        self, max_workers: int = 8, mailbox: str = "INBOX", credentials_for: Optional[Callable] = None
+    ) -> None:
+        self.mailbox = mailbox
+        self.credentials_for = credentials_for or (lambda profile: _get_user_credentials(profile.user))
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="mail-sync") if max_workers else None
+        self.selector = selectors.DefaultSelector()
+        self.sessions: Dict[int, IdleSession] = {}
+        self.futures: Dict[Future, IdleSession] = {}
+        self._profiles_checked_at: Optional[float] = None
+
+    # --- Жизненный цикл ---------------------------------------------------
+
+    def run_forever(self, stop_event=None, poll_timeout: float = 1.0) -> None:
+        while stop_event is None or not stop_event.is_set():
+            self.run_once(poll_timeout)
+
+    def shutdown(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        self._collect_finished()
+        for session in list(self.sessions.values()):
+            self._close(session)
+        self.sessions.clear()
+        self.selector.close()
+
+    def refresh_profiles(self) -> None:
+        enabled = set(UserProfile.objects.filter(email_integration_enabled=True).values_list("id", flat=True))
+        for profile_id in enabled - set(self.sessions):
+            self.sessions[profile_id] = IdleSession(profile_id, self.mailbox)
+        for profile_id in set(self.sessions) - enabled:
+            session = self.sessions[profile_id]
+            if not session.busy:
+                self._close(session)
+                del self.sessions[profile_id]
+        self._profiles_checked_at = time.monotonic()
+
+    def run_once(self, timeout: float = 1.0) -> None:
+        """Одна итерация: запуск/продление IDLE, синхронизация, ожидание событий."""
+        now = time.monotonic()
+        if self._profiles_checked_at is None or now - self._profiles_checked_at > PROFILES_REFRESH_INTERVAL:
+            self.refresh_profiles()
+        self._collect_finished()
+
+        for session in list(self.sessions.values()):
+            if session.busy or now < session.retry_at:
+                continue
+            try:
+                self._advance(session, now)
+            except Exception as e:
+                self._fail(session, e)
+
+        for session in self._wait_for_events(timeout):
+            try:
+                if session.read_events():
+                    self._stop_idle(session)
+                    session.needs_sync = True
+                    self._submit_sync(session)
+            except Exception as e:
+                self._fail(session, e)
+
+    def _advance(self, session: IdleSession, now: float) -> None:
+        """Продлевает IDLE, запускает синхронизацию или входит в IDLE - в зависимости от состояния сессии."""
+        if session.idling:
+            if now - session.idle_since < IDLE_RENEW_INTERVAL:
+                return
+            self._stop_idle(session)
+        if session.conn is None or session.needs_sync:
+            self._submit_sync(session)
+        else:
+            session.start_idle()
+            self.selector.register(session.conn.sock, selectors.EVENT_READ, session)
+
+    def _wait_for_events(self, timeout: float):
+        ready = [session for session in self.sessions.values() if session.idling and session.has_pending()]
+        if ready:
+            return ready
+        if not self.selector.get_map():
+            time.sleep(timeout)
+            return []
+        return [key.data for key, _ in self.selector.select(timeout)]
+
+    # --- Синхронизация ------------------------------------------------------
+
+    def _submit_sync(self, session: IdleSession) -> None:
+        session.busy = True
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(self._sync(session))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self.executor.submit(self._sync, session)
+        self.futures[future] = session
+        if self.executor is None:
+            self._collect_finished()
+
+    def _sync(self, session: IdleSession) -> int:
+        """Подключается (при необходимости), выбирает папку и синхронизирует ее. Возвращает число новых писем."""
+        close_old_connections()
+        try:
+            profile = UserProfile.objects.select_related("user").get(pk=session.profile_id)
+            if session.conn is None:
+                credentials, error = self.credentials_for(profile)
+                if error:
+                    raise ConnectionError(error[1])
+                session.conn, error = _connect_and_login(credentials)
+                if error:
+                    raise ConnectionError(error[1])
+
+            server_name, error = _select_mailbox(session.conn, session.mailbox, profile.user.email)
+            if error:
+                raise ConnectionError(error[1])
+
+            previous = get_state(profile, session.mailbox)
+            known_uid = previous.highest_uid if previous and previous.synced_at else None
+            known_validity = previous.uidvalidity if previous else None
+
+            state = sync_mailbox(session.conn, profile, session.mailbox, server_name, force=True)
+
+            # Первую загрузку папки и смену UIDVALIDITY не считаем "новой почтой"
+            new_count = 0
+            if known_uid is not None and known_validity == state.uidvalidity:
+                new_count = state.messages.filter(uid__gt=known_uid).count()
+            if new_count:
+                self._notify(profile, session.mailbox, new_count)
+            self._index_bodies(session, state)
+            return new_count
+        finally:
+            close_old_connections()
+
+    def _index_bodies(self, session: IdleSession, state) -> None:
+        """Догружает в поисковый индекс тела писем папки; ошибки индексации не прерывают синхронизацию."""
+        try:
+            index_bodies(session.conn, state, limit=settings.MAIL_SEARCH_BODY_BATCH)
+        except Exception as e:
+            logger.error(f"Ошибка индексации тел писем {session.mailbox} ({session.profile_id}): {e}", exc_info=True)
+
+    def _notify(self, profile: UserProfile, mailbox: str, count: int) -> None:
+        logger.info(f"Новых писем для {profile.user.email} в {mailbox}: {count}")
+        Notification.objects.create(
+            user=profile.user,
+            message=f"Новых писем в папке {mailbox}: {count}",
+            notification_type=Notification.NotificationTypes.EMAIL,
+        )
+        new_mail_received.send(sender=self.__class__, profile=profile, mailbox=mailbox, count=count)
+
+    def _collect_finished(self) -> None:
+        for future in [future for future in self.futures if future.done()]:
+            session = self.futures.pop(future)
+            session.busy = False
+            error = future.exception()
+            if error is not None:
+                self._fail(session, error)
+            else:
+                session.needs_sync = False
+                session.retry_delay = RECONNECT_DELAY
+
+    # --- Вспомогательное --------------------------------------------------
+
+    def _stop_idle(self, session: IdleSession) -> None:
+        self._unregister(session)
+        session.stop_idle()
+
+    def _unregister(self, session: IdleSession) -> None:
+        if session.conn is None:
+            return
+        try:
+            self.selector.unregister(session.conn.sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _close(self, session: IdleSession) -> None:
+        self._unregister(session)
+        session.close()
+
+    def _fail(self, session: IdleSession, error: Exception) -> None:
+        logger.warning(
+            f"IDLE сессия профиля {session.profile_id} прервана: {error}. Повтор через {session.retry_delay} с"
+        )
+        self._close(session)
+        session.needs_sync = True
+        session.retry_at = time.monotonic() + session.retry_delay
+        session.retry_delay = min(session.retry_delay * 2, MAX_RECONNECT_DELAY)
@@ -0,0 +1,302 @@
+"""Пул аутентифицированных почтовых сессий.
+
+Пул живёт в памяти процесса (у каждого воркера gunicorn он свой) и хранит
+уже залогиненные соединения отдельно для каждого набора учетных данных.
+Перед выдачей простаивающее соединение проверяется командой NOOP,
+устаревшие и "сломанные" сессии закрываются, вместо них создаются новые.
+"""
+
+import hashlib
+import imaplib
+import logging
+import os
+import smtplib
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Значения по умолчанию, переопределяются одноименными настройками Django
+DEFAULT_MAX_SESSIONS = 4  # Максимум сессий на одни учетные данные в одном процессе
+DEFAULT_IDLE_TIMEOUT = 300  # Через сколько секунд простоя сессия закрывается
+DEFAULT_ACQUIRE_TIMEOUT = 10  # Сколько ждать освобождения сессии при исчерпании лимита
+DEFAULT_CHECK_INTERVAL = 5  # Сессии, использованные недавно, не проверяются NOOP
+
+SMTP_OK = 250
+
+
+class MailConnectionPool:
+    """Потокобезопасный пул сессий, сгруппированных по учетным данным.
+
+    Наследники определяют, как строится ключ пула, как проверяется
+    "живость" соединения и как оно закрывается. Само соединение создает
+    функция ``connect(credentials) -> (connection, error)``, поэтому
+    пул возвращает ошибки в том же формате, что и ``email_service``.
+    """
+
+    setting_prefix = ""
+    setting_key = ""
+    protocol = ""
+
+    def __init__(
+        self,
+        connect: Callable,
+        timeout_error_type: str,
+        max_sessions: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        acquire_timeout: Optional[float] = None,
+        check_interval: Optional[float] = None,
+    ):
+        self._connect = connect
+        self._timeout_error_type = timeout_error_type
+        self._max_sessions = max_sessions
+        self._idle_timeout = idle_timeout
+        self._acquire_timeout = acquire_timeout
+        self._check_interval = check_interval
+        self._condition = threading.Condition()
+        self._idle = defaultdict(deque)  # key -> deque[(connection, last_used)]
+        self._in_use = defaultdict(int)  # key -> количество выданных сессий
+        self._stats = {"hits": 0, "misses": 0, "reconnects": 0, "expired": 0, "discarded": 0, "timeouts": 0}
+
+    # --- Настройки -------------------------------------------------------
+
+    def _setting(self, name: str, explicit, default):
+        if explicit is not None:
+            return explicit
+        return getattr(settings, f"{self.setting_prefix}_{name}", default)
+
+    @property
+    def max_sessions(self) -> int:
+        return int(self._setting("MAX_SESSIONS", self._max_sessions, DEFAULT_MAX_SESSIONS))
+
+    @property
+    def idle_timeout(self) -> float:
+        return float(self._setting("IDLE_TIMEOUT", self._idle_timeout, DEFAULT_IDLE_TIMEOUT))
+
+    @property
+    def acquire_timeout(self) -> float:
+        return float(self._setting("ACQUIRE_TIMEOUT", self._acquire_timeout, DEFAULT_ACQUIRE_TIMEOUT))
+
+    @property
+    def check_interval(self) -> float:
+        return float(self._setting("CHECK_INTERVAL", self._check_interval, DEFAULT_CHECK_INTERVAL))
+
+    # --- Методы, определяемые наследниками -------------------------------
+
+    def make_key(self, credentials: Dict[str, str]) -> Tuple:
+        raise NotImplementedError
+
+    def is_alive(self, connection) -> bool:
+        raise NotImplementedError
+
+    def close(self, connection) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _password_digest(password: Optional[str]) -> str:
+        """Пароль входит в ключ только в виде хэша: смена пароля дает новый ключ."""
+        return hashlib.sha256((password or "").encode("utf-8")).hexdigest()
+
+    # --- Основной API -----------------------------------------------------
+
+    def acquire(self, credentials: Dict[str, str]):
+        """Выдает залогиненную сессию. Возвращает (connection, error)."""
+        key = self.make_key(credentials)
+        deadline = time.monotonic() + self.acquire_timeout
+        reconnect = False
+
+        while True:
+            expired = []
+            connection = None
+            last_used = 0.0
+            with self._condition:
+                idle = self._idle[key]
+                now = time.monotonic()
+                while idle:
+                    candidate, candidate_last_used = idle.pop()  # LIFO: самая "свежая" сессия
+                    if now - candidate_last_used > self.idle_timeout:
+                        expired.append(candidate)
+                        self._stats["expired"] += 1
+                        continue
+                    connection, last_used = candidate, candidate_last_used
+                    break
+
+                if connection is None and self._in_use[key] + len(idle) >= self.max_sessions:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        user = credentials.get(f"{self.setting_key}_user", "?")
+                        msg = f"Нет свободных {self.protocol} сессий для {user}"
+                        logger.warning(msg)
+                        self._close_all(expired)
+                        return None, (self._timeout_error_type, msg)
+                    self._close_all(expired)
+                    self._condition.wait(remaining)
+                    continue
+
+                # Резервируем место под сессию (найденную или будущую)
+                self._in_use[key] += 1
+
+            self._close_all(expired)
+
+            if connection is not None:
+                if time.monotonic() - last_used < self.check_interval or self.is_alive(connection):
+                    self._count("hits")
+                    return connection, None
+                logger.info(f"{self.protocol} сессия не прошла проверку NOOP, переподключаемся")
+                self.close(connection)
+                reconnect = True
+
+            connection, error = self._connect(credentials)
+            if error:
+                with self._condition:
+                    self._in_use[key] -= 1
+                    self._condition.notify()
+                return None, error
+
+            self._count("reconnects" if reconnect else "misses")
+            return connection, None
+
+    def release(self, credentials: Dict[str, str], connection, discard: bool = False) -> None:
+        """Возвращает сессию в пул. При discard=True сессия закрывается."""
+        if connection is None:
+            return
+        key = self.make_key(credentials)
+        with self._condition:
+            self._in_use[key] = max(0, self._in_use[key] - 1)
+            keep = not discard and self.is_reusable(connection)
+            if keep:
+                self._idle[key].append((connection, time.monotonic()))
+            else:
+                self._stats["discarded"] += 1
+            self._condition.notify()
+        if not keep:
+            self.close(connection)
+
+    def is_reusable(self, connection) -> bool:
+        return True
+
+    @contextmanager
+    def session(self, credentials: Dict[str, str]):
+        """Контекстный менеджер: ``with pool.session(creds) as (conn, error): ...``.
+
+        Если внутри блока возникло исключение, сессия считается испорченной
+        и не возвращается в пул.
+        """
+        connection, error = self.acquire(credentials)
+        try:
+            yield connection, error
+        except BaseException:
+            self.release(credentials, connection, discard=True)
+            raise
+        else:
+            self.release(credentials, connection)
+
+    def clear(self) -> None:
+        """Закрывает все простаивающие сессии (например, при остановке воркера)."""
+        with self._condition:
+            connections = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        self._close_all(connections)
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий/промахов и текущее число сессий."""
+        with self._condition:
+            result = dict(self._stats)
+            result["idle"] = sum(len(idle) for idle in self._idle.values())
+            result["in_use"] = sum(self._in_use.values())
+        result["pid"] = os.getpid()
+        return result
+
+    # --- Вспомогательное --------------------------------------------------
+
+    def _count(self, name: str) -> None:
+        with self._condition:
+            self._stats[name] += 1
+
+    def _close_all(self, connections) -> None:
+        for connection in connections:
+            self.close(connection)
+
+
+class IMAPConnectionPool(MailConnectionPool):
+    """Пул IMAP сессий, ключ - (хост, порт, пользователь, SSL, хэш пароля)."""
+
+    setting_prefix = "IMAP_POOL"
+    setting_key = "imap"
+    protocol = "IMAP"
+
+    def make_key(self, credentials: Dict[str, str]) -> Tuple:
+        return (
+            credentials["imap_host"],
+            int(credentials["imap_port"]),
+            credentials["imap_user"],
+            bool(credentials.get("imap_use_ssl", True)),
+            self._password_digest(credentials.get("imap_password")),
+        )
+
+    def is_alive(self, connection) -> bool:
+        try:
+            typ, _ = connection.noop()
+            return typ == "OK"
+        except (imaplib.IMAP4.error, OSError, EOFError):
+            return False
+
+    def is_reusable(self, connection) -> bool:
+        # После LOGOUT или разрыва соединения imaplib переводит сессию в состояние LOGOUT
+        return getattr(connection, "state", None) in ("AUTH", "SELECTED")
+
+    def close(self, connection) -> None:
+        try:
+            connection.logout()
+        except Exception:
+            try:
+                connection.shutdown()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool(MailConnectionPool):
+    """Пул SMTP сессий, ключ - (хост, порт, пользователь, хэш пароля).
+
+    После отказа сервера smtplib сам сбрасывает транзакцию командой RSET,
+    поэтому сессия остается пригодной для следующего письма; простаивавшая
+    сессия перед выдачей проверяется командой NOOP.
+    """
+
+    setting_prefix = "SMTP_POOL"
+    setting_key = "smtp"
+    protocol = "SMTP"
+
+    def make_key(self, credentials: Dict[str, str]) -> Tuple:
+        return (
+            credentials["smtp_host"],
+            int(credentials["smtp_port"]),
+            credentials["smtp_user"],
+            self._password_digest(credentials.get("smtp_password")),
+        )
+
+    def is_alive(self, connection) -> bool:
+        try:
+            code, _ = connection.noop()
+            return code == SMTP_OK
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def is_reusable(self, connection) -> bool:
+        # После разрыва соединения smtplib обнуляет сокет
+        return getattr(connection, "sock", None) is not None
+
+    def close(self, connection) -> None:
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
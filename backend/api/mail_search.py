@@ -0,0 +1,234 @@
+"""Полнотекстовый поиск по синхронизированной почте.
+
+Инвертированный индекс хранится в EmailSearchPosting: для каждого письма
+из локального кэша (CachedEmailMessage) - набор терминов с весами. Заголовки
+индексируются сразу после синхронизации, тела писем догружаются частичным
+FETCH (первые MAIL_SEARCH_BODY_BYTES байт) небольшими порциями в воркере
+IDLE и командой index_mail, вне запросов пользователя. Поиск
+выполняется только по базе, без обращения к почтовому серверу.
+"""
+
+import email
+import logging
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Max, Q, Sum, Value, When
+from django.utils.html import strip_tags
+from imapclient.response_parser import parse_fetch_response
+
+from .mail_sync import cached_message_to_dict, get_state
+from .models import CachedEmailMessage, EmailSearchPosting, MailboxState, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Состояния индексации письма (CachedEmailMessage.index_state)
+INDEX_NONE = 0
+INDEX_HEADERS = 1
+INDEX_FULL = 2
+
+# Вес термина зависит от поля, в котором он встретился
+FIELD_WEIGHTS = {"subject": 8, "from": 5, "to": 3, "body": 1}
+MAX_TERM_REPEATS = 3  # Повторы термина в поле учитываются не больше этого числа раз
+MAX_WEIGHT = 32767
+
+MIN_TERM_LENGTH = 2
+MIN_PREFIX_LENGTH = 3  # Более короткое последнее слово запроса ищется целиком, а не как префикс
+PREFIX_EXPANSION_LIMIT = 50  # Сколько терминов индекса может подставиться вместо префикса
+MAX_TERM_LENGTH = 64
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOP_WORDS = {
+    "and", "the", "for", "you", "with", "from", "this", "that", "are", "was", "not", "but",
+    "на", "не", "что", "по", "за", "из", "от", "до", "как", "это", "для", "или", "то", "же", "вы", "мы",
+}  # fmt: skip
+
+HEADERS_BATCH = 1000  # Сколько писем индексировать за один запрос к базе
+BODY_FETCH_BATCH = 25  # Сколько тел запрашивать одним UID FETCH
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Разбивает текст на нормализованные термины (нижний регистр, ё -> е)."""
+    if not text:
+        return []
+    terms = TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    return [term for term in terms if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH and term not in STOP_WORDS]
+
+
+def _term_weights(fields: Dict[str, str]) -> Dict[str, int]:
+    weights = defaultdict(int)
+    for field, text in fields.items():
+        for term, count in Counter(tokenize(text)).items():
+            weights[term] += FIELD_WEIGHTS[field] * min(count, MAX_TERM_REPEATS)
+    return weights
+
+
+def _header_fields(message: CachedEmailMessage) -> Dict[str, str]:
+    return {"subject": message.subject, "from": message.from_addr, "to": message.to_addr}
+
+
+def _write_postings(state: MailboxState, indexed: Dict[int, Dict[str, str]], index_state: int) -> None:
+    """Перестраивает записи индекса для писем {message_id: поля} и отмечает их состояние."""
+    postings = [
+        EmailSearchPosting(state=state, message_id=message_id, term=term, weight=min(weight, MAX_WEIGHT))
+        for message_id, fields in indexed.items()
+        for term, weight in _term_weights(fields).items()
+    ]
+    with transaction.atomic():
+        EmailSearchPosting.objects.filter(message_id__in=list(indexed)).delete()
+        EmailSearchPosting.objects.bulk_create(postings, batch_size=HEADERS_BATCH)
+        CachedEmailMessage.objects.filter(id__in=list(indexed)).update(index_state=index_state)
+
+
+def index_headers(state: MailboxState) -> int:
+    """Индексирует тему, отправителя и получателей еще не проиндексированных писем."""
+    total = 0
+    fields = ("id", "subject", "from_addr", "to_addr")
+    while True:
+        batch = list(state.messages.filter(index_state=INDEX_NONE).only(*fields)[:HEADERS_BATCH])
+        if not batch:
+            return total
+        _write_postings(state, {message.id: _header_fields(message) for message in batch}, INDEX_HEADERS)
+        total += len(batch)
+
+
+def _body_text(raw: bytes) -> str:
+    """Текст письма для индекса: plain-часть, либо HTML без тегов."""
+    from .email_service import _extract_email_body
+
+    content = _extract_email_body(email.message_from_bytes(raw))
+    return content["plain"] or strip_tags(content["html"])
+
+
+def index_bodies(mail, state: MailboxState, limit: Optional[int] = None) -> int:
+    """Догружает начало тел писем (без пометки прочитанным) и добавляет их в индекс.
+
+    Папка ``state`` должна быть выбрана на соединении ``mail``. Сначала
+    индексируются самые новые письма; ``limit`` ограничивает число писем
+    за вызов, чтобы не задерживать ответ на запрос списка.
+    """
+    body_bytes = int(getattr(settings, "MAIL_SEARCH_BODY_BYTES", 32768))
+    pending = state.messages.filter(index_state=INDEX_HEADERS).order_by("-uid")
+    if limit is not None:
+        pending = pending[:limit]
+    pending = list(pending.only("id", "uid", "subject", "from_addr", "to_addr"))
+
+    for start in range(0, len(pending), BODY_FETCH_BATCH):
+        batch = pending[start : start + BODY_FETCH_BATCH]
+        uid_set = ",".join(str(message.uid) for message in batch)
+        typ, fetch_data = mail.uid("FETCH", uid_set, f"(UID BODY.PEEK[]<0.{body_bytes}>)")
+        if typ != "OK":
+            raise RuntimeError(f"UID FETCH тел писем завершился с ошибкой: {typ}")
+        parsed = parse_fetch_response(fetch_data, normalise_times=False, uid_is_key=True)
+
+        indexed = {}
+        for message in batch:
+            fields = _header_fields(message)
+            raw = next(
+                (value for key, value in parsed.get(message.uid, {}).items() if key.startswith(b"BODY[")),
+                None,
+            )
+            if raw:
+                try:
+                    fields["body"] = _body_text(raw)
+                except Exception as e:
+                    logger.warning(f"Не удалось извлечь текст письма {message.uid} для индекса: {e}")
+            indexed[message.id] = fields
+        _write_postings(state, indexed, INDEX_FULL)
+    return len(pending)
+
+
+def _term_groups(state_ids: List[int], terms: List[str]) -> List[List[str]]:
+    """Для каждого слова запроса - термины индекса, которые ему соответствуют.
+
+    Последнее слово длиной не меньше MIN_PREFIX_LENGTH считается префиксом и
+    раскрывается в не более чем PREFIX_EXPANSION_LIMIT терминов индекса.
+    """
+    if not terms:
+        return []
+    *words, prefix = terms
+    groups = [[term] for term in dict.fromkeys(words)]
+    if len(prefix) >= MIN_PREFIX_LENGTH:
+        expanded = (
+            EmailSearchPosting.objects.filter(state_id__in=state_ids, term__startswith=prefix)
+            .order_by("term")
+            .values_list("term", flat=True)
+            .distinct()[:PREFIX_EXPANSION_LIMIT]
+        )
+        groups.append(list(expanded))
+    else:
+        groups.append([prefix])
+    return groups
+
+
+def _rank(state_ids: List[int], query: str):
+    """Запрос к индексу: message_id и score писем, в которых есть все слова запроса, по убыванию score.
+
+    Ранжирование выполняется в базе (GROUP BY письму, HAVING по словам
+    запроса), поэтому из базы читается только нужная страница. None - запрос
+    заведомо ничего не находит.
+    """
+    groups = _term_groups(state_ids, tokenize(query))
+    if not state_ids or not groups or not all(groups):
+        return None
+    matched = {
+        f"matched_{position}": Max(Case(When(term__in=group, then=Value(1)), default=Value(0)))
+        for position, group in enumerate(groups)
+    }
+    return (
+        EmailSearchPosting.objects.filter(state_id__in=state_ids, term__in={term for group in groups for term in group})
+        .values("message_id")
+        .alias(**matched)
+        .filter(**{name: 1 for name in matched})
+        .annotate(score=Sum("weight"))
+        .order_by("-score", "-message_id")
+    )
+
+
+def search_messages(profile: UserProfile, query: str, mailbox: Optional[str] = None, limit=25, offset=0) -> Dict:
+    """Ищет письма по всем словам запроса (последнее слово - как префикс).
+
+    Результаты ранжируются по сумме весов найденных терминов, при равенстве
+    выше письма, загруженные позже.
+    """
+    states = MailboxState.objects.filter(profile=profile)
+    if mailbox:
+        states = states.filter(Q(mailbox=mailbox) | Q(server_name=mailbox))
+    states = states.in_bulk()
+
+    ranked = _rank(list(states), query)
+    if ranked is None:
+        return {"emails": [], "total": 0, "total_count": 0, "query": query}
+    page = list(ranked[offset : offset + limit])
+    messages = CachedEmailMessage.objects.in_bulk([row["message_id"] for row in page])
+    emails = []
+    for row in page:
+        message = messages.get(row["message_id"])
+        if message is None:
+            continue
+        result = cached_message_to_dict(message, states[message.state_id])
+        result["score"] = row["score"]
+        emails.append(result)
+    total = ranked.count()
+    return {"emails": emails, "total": total, "total_count": total, "query": query}
+
+
+def select_uids(
+    profile: UserProfile, mailbox: str, query: Optional[str] = None, is_read: Optional[bool] = None, exclude=()
+) -> List[int]:
+    """UID писем папки из локального кэша, подходящих под фильтр списка ("выбрать все")."""
+    state = get_state(profile, mailbox)
+    if state is None:
+        return []
+    messages = state.messages.all()
+    if is_read is not None:
+        messages = messages.filter(is_read=is_read)
+    if query:
+        ranked = _rank([state.id], query)
+        if ranked is None:
+            return []
+        messages = messages.filter(id__in=ranked.values("message_id"))
+    excluded = {int(uid) for uid in exclude}
+    return sorted(uid for uid in messages.values_list("uid", flat=True) if uid not in excluded)
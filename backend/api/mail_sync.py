@@ -0,0 +1,376 @@
+"""Локальный кэш заголовков писем и инкрементальная синхронизация по UID.
+
+Для каждой папки хранится MailboxState (UIDVALIDITY, максимальный UID,
+HIGHESTMODSEQ) и CachedEmailMessage с заголовками и флагами. При синхронизации
+с сервера забираются только письма с UID больше уже загруженного, изменения
+флагов - через CONDSTORE (CHANGEDSINCE), если сервер его поддерживает.
+Список, пагинация и сортировка затем отдаются из базы.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from imapclient.response_parser import parse_fetch_response
+
+from .models import CachedEmailMessage, MailboxState, UserProfile
+
+logger = logging.getLogger(__name__)
+
+# Допустимые значения параметра ordering для списка писем
+ORDERING_FIELDS = {
+    "date": "date",
+    "subject": "subject",
+    "from": "from_addr",
+    "size": "size",
+    "uid": "uid",
+}
+DEFAULT_ORDERING = "-date"
+
+# RFC 7162, раздел 4: строка команды клиента не должна превышать 8192 байт, держимся с запасом
+UID_SET_MAX_LENGTH = 1000
+
+
+def _min_interval() -> timedelta:
+    return timedelta(seconds=getattr(settings, "MAIL_SYNC_MIN_INTERVAL", 60))
+
+
+def _claim_timeout() -> timedelta:
+    return timedelta(seconds=getattr(settings, "MAIL_SYNC_CLAIM_TIMEOUT", 600))
+
+
+def _fetch_chunk() -> int:
+    return int(getattr(settings, "MAIL_SYNC_FETCH_CHUNK", 500))
+
+
+def has_capability(mail, name: str) -> bool:
+    return name.upper() in getattr(mail, "capabilities", ())
+
+
+def enable_condstore(mail) -> bool:
+    """Включает CONDSTORE сразу после логина, чтобы SELECT возвращал HIGHESTMODSEQ.
+
+    После аутентификации список возможностей сервера может измениться, поэтому
+    запрашиваем его заново. Ошибки не критичны: без CONDSTORE синхронизация
+    флагов просто идет полным проходом.
+    """
+    try:
+        typ, data = mail.capability()
+        if typ == "OK" and data and data[-1]:
+            mail.capabilities = tuple(data[-1].decode().upper().split())
+        if has_capability(mail, "CONDSTORE") and has_capability(mail, "ENABLE"):
+            typ, _ = mail.enable("CONDSTORE")
+            return typ == "OK"
+    except Exception as e:
+        logger.debug(f"Не удалось включить CONDSTORE: {e}")
+    return False
+
+
+def read_select_status(mail) -> Dict[str, Optional[int]]:
+    """Читает UIDVALIDITY, UIDNEXT, EXISTS и HIGHESTMODSEQ из ответа на только что выполненный SELECT."""
+    status = {}
+    for name in ("UIDVALIDITY", "UIDNEXT", "EXISTS", "HIGHESTMODSEQ"):
+        _, data = mail.response(name)
+        value = data[-1] if data else None
+        try:
+            status[name.lower()] = int(value) if value is not None else None
+        except (TypeError, ValueError):
+            status[name.lower()] = None
+    return status
+
+
+def get_state(profile: UserProfile, mailbox: str) -> Optional[MailboxState]:
+    """Состояние папки по имени, запрошенному клиентом, или по имени на сервере."""
+    return (
+        MailboxState.objects.filter(profile=profile)
+        .filter(Q(mailbox=mailbox) | Q(server_name=mailbox))
+        .order_by("-synced_at")
+        .first()
+    )
+
+
+def is_fresh(state: Optional[MailboxState]) -> bool:
+    """Папка синхронизировалась недавно - можно отвечать из базы, не трогая сервер."""
+    return bool(state and state.synced_at and timezone.now() - state.synced_at < _min_interval())
+
+
+def _uid_range_chunks(uids: List[int], size: int) -> Iterable[List[int]]:
+    for i in range(0, len(uids), size):
+        yield uids[i : i + size]
+
+
+def uid_sequence_sets(uids: Iterable, max_length: int = UID_SET_MAX_LENGTH) -> List[str]:
+    """Сжимает UID в IMAP наборы вида "1:50,72,90:120", каждый не длиннее ``max_length`` символов."""
+    ranges = []
+    for uid in sorted({int(uid) for uid in uids}):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+
+    sequence_sets, current, length = [], [], 0
+    for first, last in ranges:
+        item = str(first) if first == last else f"{first}:{last}"
+        if current and length + len(item) >= max_length:
+            sequence_sets.append(",".join(current))
+            current, length = [], 0
+        current.append(item)
+        length += len(item) + 1
+    if current:
+        sequence_sets.append(",".join(current))
+    return sequence_sets
+
+
+def _summary_to_fields(summary: Dict) -> Dict:
+    date = None
+    if summary.get("date"):
+        date = datetime.fromisoformat(summary["date"])
+        if timezone.is_naive(date):
+            date = date.replace(tzinfo=dt_timezone.utc)
+    return {
+        "subject": (summary.get("subject") or "")[:500],
+        "from_addr": (summary.get("from") or "")[:500],
+        "to_addr": summary.get("to") or "",
+        "date": date,
+        "size": summary.get("size"),
+        "flags": summary.get("flags") or [],
+        "is_read": bool(summary.get("is_read")),
+    }
+
+
+def _decode_flags(fetch_item: Dict) -> List[str]:
+    return [flag.decode() if isinstance(flag, bytes) else str(flag) for flag in fetch_item.get(b"FLAGS", ())]
+
+
+def _fetch_new_messages(mail, state: MailboxState) -> int:
+    """Загружает заголовки писем с UID больше state.highest_uid."""
+    from .email_service import LIST_FETCH_ITEMS, _build_email_summary
+
+    typ, data = mail.uid("SEARCH", None, f"UID {state.highest_uid + 1}:*")
+    if typ != "OK":
+        raise RuntimeError(f"UID SEARCH завершился с ошибкой: {typ}")
+    # Для диапазона "n:*" сервер всегда возвращает последнее письмо, даже если его UID меньше n
+    new_uids = sorted(uid for uid in map(int, data[0].split()) if uid > state.highest_uid)
+    if not new_uids:
+        return 0
+
+    created = 0
+    for chunk in _uid_range_chunks(new_uids, _fetch_chunk()):
+        typ, fetch_data = mail.uid("FETCH", ",".join(map(str, chunk)), LIST_FETCH_ITEMS)
+        if typ != "OK":
+            raise RuntimeError(f"UID FETCH завершился с ошибкой: {typ}")
+        parsed = parse_fetch_response(fetch_data, normalise_times=False, uid_is_key=True)
+        rows = []
+        for uid in chunk:
+            if uid not in parsed:
+                continue
+            try:
+                summary = _build_email_summary(uid, parsed[uid])
+            except Exception as e:
+                logger.error(f"Ошибка при разборе заголовков письма {uid}: {e}")
+                continue
+            rows.append(CachedEmailMessage(state=state, uid=uid, **_summary_to_fields(summary)))
+        state.highest_uid = max(state.highest_uid, chunk[-1])
+        # Каждая порция записывается отдельно: прерванная синхронизация продолжится с этого UID
+        with transaction.atomic():
+            CachedEmailMessage.objects.bulk_create(rows, ignore_conflicts=True)
+            MailboxState.objects.filter(pk=state.pk).update(highest_uid=state.highest_uid)
+        created += len(rows)
+    return created
+
+
+def _update_flags(mail, state: MailboxState, max_uid: int, changed_since: Optional[int]) -> int:
+    """Обновляет флаги уже загруженных писем. Возвращает число измененных писем."""
+    if max_uid <= 0:
+        return 0
+    items = "(UID FLAGS)"
+    if changed_since is not None:
+        items = f"(UID FLAGS) (CHANGEDSINCE {changed_since})"
+    typ, fetch_data = mail.uid("FETCH", f"1:{max_uid}", items)
+    if typ != "OK":
+        raise RuntimeError(f"UID FETCH FLAGS завершился с ошибкой: {typ}")
+    parsed = parse_fetch_response(fetch_data, normalise_times=False, uid_is_key=True)
+    if not parsed:
+        return 0
+
+    cached = {message.uid: message for message in state.messages.filter(uid__lte=max_uid).only("id", "uid", "flags")}
+    changed = []
+    for uid, fetch_item in parsed.items():
+        message = cached.get(uid)
+        if message is None or b"FLAGS" not in fetch_item:
+            continue
+        flags = _decode_flags(fetch_item)
+        if flags != message.flags:
+            message.flags = flags
+            message.is_read = "\\Seen" in flags
+            changed.append(message)
+    CachedEmailMessage.objects.bulk_update(changed, ["flags", "is_read"], batch_size=_fetch_chunk())
+    return len(changed)
+
+
+def _remove_expunged(mail, state: MailboxState) -> int:
+    """Удаляет из кэша письма, которых больше нет на сервере."""
+    typ, data = mail.uid("SEARCH", None, "ALL")
+    if typ != "OK":
+        raise RuntimeError(f"UID SEARCH ALL завершился с ошибкой: {typ}")
+    server_uids = set(map(int, data[0].split()))
+    local_uids = set(state.messages.values_list("uid", flat=True))
+    gone = local_uids - server_uids
+    if gone:
+        state.messages.filter(uid__in=gone).delete()
+    return len(gone)
+
+
+def _claim_sync(state: MailboxState, force: bool) -> Optional[datetime]:
+    """Захватывает синхронизацию папки условным UPDATE и возвращает метку захвата.
+
+    None - папку уже синхронизирует другой процесс или (без ``force``) она
+    недавно синхронизирована. Захват старше MAIL_SYNC_CLAIM_TIMEOUT считается
+    брошенным: процесс упал посреди синхронизации.
+    """
+    now = timezone.now()
+    claim = MailboxState.objects.filter(pk=state.pk).filter(
+        Q(syncing_since__isnull=True) | Q(syncing_since__lt=now - _claim_timeout())
+    )
+    if not force:
+        claim = claim.filter(Q(synced_at__isnull=True) | Q(synced_at__lte=now - _min_interval()))
+    return now if claim.update(syncing_since=now) else None
+
+
+def sync_mailbox(mail, profile: UserProfile, mailbox: str, server_name: str, force: bool = False) -> MailboxState:
+    """Синхронизирует папку, уже выбранную командой SELECT на соединении ``mail``.
+
+    ``mailbox`` - имя, которое запросил клиент, ``server_name`` - имя, под которым
+    папка реально выбрана на сервере. Без ``force`` синхронизация пропускается,
+    если другой запрос успел обновить папку в пределах MAIL_SYNC_MIN_INTERVAL.
+
+    Папку одновременно синхронизирует только один процесс: он захватывает ее
+    полем syncing_since, остальные сразу получают текущее состояние из базы.
+    Обмен с IMAP сервером идет вне транзакций, результаты записываются короткими
+    транзакциями по мере загрузки.
+    """
+    status = read_select_status(mail)
+
+    state, _ = MailboxState.objects.get_or_create(profile=profile, mailbox=mailbox)
+    claimed_at = _claim_sync(state, force)
+    if claimed_at is None:
+        state.refresh_from_db()
+        return state
+
+    try:
+        state.refresh_from_db()
+        state.server_name = server_name
+        if state.uidvalidity != status["uidvalidity"]:
+            if state.uidvalidity is not None:
+                logger.info(f"UIDVALIDITY папки {server_name} изменился, кэш сброшен")
+            state.uidvalidity = status["uidvalidity"]
+            state.highest_uid = 0
+            state.highest_modseq = None
+            with transaction.atomic():
+                state.messages.all().delete()
+                state.save(update_fields=["server_name", "uidvalidity", "highest_uid", "highest_modseq"])
+
+        known_uid = state.highest_uid
+        modseq = status["highestmodseq"]
+        uidnext = status["uidnext"]
+
+        created = 0
+        if uidnext is None or uidnext - 1 > known_uid:
+            created = _fetch_new_messages(mail, state)
+
+        updated = 0
+        if known_uid:
+            if modseq is None:
+                # Сервер без CONDSTORE: сверяем флаги всех загруженных писем (без заголовков)
+                updated = _update_flags(mail, state, known_uid, None)
+            elif state.highest_modseq is None or modseq != state.highest_modseq:
+                changed_since = state.highest_modseq or 0
+                updated = _update_flags(mail, state, known_uid, changed_since)
+
+        removed = 0
+        exists = status["exists"]
+        if exists is not None and state.messages.count() != exists:
+            removed = _remove_expunged(mail, state)
+
+        state.highest_modseq = modseq
+        state.message_count = exists if exists is not None else state.messages.count()
+        state.synced_at = timezone.now()
+        state.syncing_since = None
+        state.save()
+    except Exception:
+        # Снимаем захват, чтобы следующий запрос не ждал MAIL_SYNC_CLAIM_TIMEOUT
+        MailboxState.objects.filter(pk=state.pk, syncing_since=claimed_at).update(syncing_since=None)
+        raise
+
+    logger.info(f"Синхронизация {server_name} ({profile.user_id}): новых {created}, флаги {updated}, удалено {removed}")
+
+    # Заголовки новых писем сразу попадают в поисковый индекс (только база, без обращений к серверу).
+    # Тела догружают воркер IDLE и команда index_mail, чтобы не задерживать запрос списка.
+    from .mail_search import index_headers
+
+    try:
+        index_headers(state)
+    except Exception as e:
+        logger.error(f"Ошибка индексации писем {server_name} ({profile.user_id}): {e}", exc_info=True)
+    return state
+
+
+def cached_message_to_dict(message: CachedEmailMessage, state: MailboxState) -> Dict:
+    """Письмо из кэша в формате элемента списка fetch_emails."""
+    return {
+        "id": str(message.uid),
+        "subject": message.subject,
+        "from": message.from_addr,
+        "to": message.to_addr,
+        "date": message.date.isoformat() if message.date else None,
+        "is_read": message.is_read,
+        "flags": message.flags,
+        "size": message.size,
+        "mailbox": state.server_name or state.mailbox,
+    }
+
+
+def list_cached_messages(state: MailboxState, limit: int, offset: int, ordering: str = DEFAULT_ORDERING) -> Dict:
+    """Страница писем из локального кэша в формате ответа fetch_emails."""
+    descending = ordering.startswith("-")
+    field = ORDERING_FIELDS.get(ordering.lstrip("-"), "date")
+    order_by = [f"-{field}", "-uid"] if descending else [field, "uid"]
+
+    queryset = state.messages.order_by(*order_by)
+    total = queryset.count()
+    emails = [cached_message_to_dict(message, state) for message in queryset[offset : offset + limit]]
+    return {
+        "emails": emails,
+        "total": total,
+        "total_count": total,
+        "mailbox": state.server_name or state.mailbox,
+        "synced_at": state.synced_at.isoformat() if state.synced_at else None,
+    }
+
+
+def update_cached_flags(profile: UserProfile, mailbox: str, uids: Iterable, flags: List[str], add: bool) -> None:
+    """Отражает в кэше изменение флагов, выполненное на сервере."""
+    state = get_state(profile, mailbox)
+    if state is None:
+        return
+    for chunk in _uid_range_chunks(sorted({int(uid) for uid in uids}), _fetch_chunk()):
+        messages = list(state.messages.filter(uid__in=chunk).only("id", "flags"))
+        for message in messages:
+            current = [flag for flag in message.flags if flag not in flags]
+            message.flags = current + list(flags) if add else current
+            message.is_read = "\\Seen" in message.flags
+        CachedEmailMessage.objects.bulk_update(messages, ["flags", "is_read"])
+
+
+def remove_cached_messages(profile: UserProfile, mailbox: str, uids: Iterable) -> None:
+    """Удаляет из кэша письма, удаленные на сервере."""
+    state = get_state(profile, mailbox)
+    if state is None:
+        return
+    for chunk in _uid_range_chunks(sorted({int(uid) for uid in uids}), _fetch_chunk()):
+        state.messages.filter(uid__in=chunk).delete()
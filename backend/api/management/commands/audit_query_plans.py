@@ -0,0 +1,69 @@
+import re
+from datetime import timedelta
+from typing import List
+
+from api.finance import BREAKDOWN_GROUPS, breakdown_rows
+from api.models import Carrier, Client, Notification, Order
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+# Полный просмотр таблицы в плане: PostgreSQL "Seq Scan on", SQLite "SCAN <table>" без индекса,
+# MySQL/MariaDB - строка табличного EXPLAIN (id select_type table [partitions] type ...) с type = ALL
+FULL_SCAN_RE = re.compile(
+    r"Seq Scan on|\bSCAN (?!.*\bUSING (?:COVERING )?INDEX\b)\w+|^\s*\d+ \w+ \S+ (?:\S+ )?ALL\b", re.IGNORECASE
+)
+
+
+def full_scans(plan: str) -> List[str]:
+    """Строки плана EXPLAIN с полным просмотром таблицы."""
+    return [line.strip() for line in plan.splitlines() if FULL_SCAN_RE.search(line)]
+
+
+def hot_queries(user_id: int):
+    """Основные запросы списков и отчетов - те же фильтры, что строят вьюсеты."""
+    now = timezone.now()
+    month_ago = now - timedelta(days=30)
+    orders = Order.objects.filter(created_by=user_id)
+    return [
+        ("OrderViewSet.list", orders.order_by("-created_at")[:20]),
+        ("OrderViewSet.list ?status=", orders.filter(status="new").order_by("-created_at")[:20]),
+        ("OrderViewSet.list ?client__id=", orders.filter(client_id=1).order_by("-created_at")[:20]),
+        ("OrderViewSet.list ?loading_date=", orders.filter(loading_date=now)[:20]),
+        ("OrderViewSet.create (номер договора)", Order.objects.filter(contract_number="0")),
+        ("FinanceReportView", Order.objects.filter(created_at__gte=month_ago, created_at__lt=now)),
+        *(
+            (f"FinanceBreakdownView ?group_by={group_by}", breakdown_rows(month_ago.date(), now.date(), group_by))
+            for group_by in BREAKDOWN_GROUPS
+        ),
+        ("ClientViewSet.list", Client.objects.filter(created_by=user_id).order_by("-created_at")[:20]),
+        ("CarrierViewSet.list", Carrier.objects.filter(created_by=user_id).order_by("-created_at")[:20]),
+        ("NotificationViewSet.list", Notification.objects.filter(user=user_id).order_by("-sent_at")[:20]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Выполняет EXPLAIN для основных запросов вьюсетов и отмечает полные просмотры таблиц"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user-id", type=int, default=1, help="Пользователь, от имени которого строятся фильтры")
+        parser.add_argument("--verbose-plans", action="store_true", help="Печатать планы целиком")
+        parser.add_argument("--fail-on-scan", action="store_true", help="Код возврата 1, если найден полный просмотр")
+
+    def handle(self, *args, **options):
+        queries = hot_queries(options["user_id"])
+        flagged = []
+        for name, queryset in queries:
+            plan = queryset.explain()
+            scans = full_scans(plan)
+            if scans:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f"{name}: полный просмотр - {'; '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: индекс"))
+            if options["verbose_plans"]:
+                self.stdout.write(plan)
+
+        self.stdout.write(f"База: {connection.vendor}, запросов: {len(queries)}, с полным просмотром: {len(flagged)}")
+        if flagged and options["fail_on_scan"]:
+            raise CommandError(f"Полный просмотр таблицы: {', '.join(flagged)}")
@@ -0,0 +1,36 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api.import_jobs import process_imports
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Импортирует загруженные файлы клиентов и перевозчиков (ImportJob) частями с контрольными точками"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Сколько файлов импортировать параллельно")
+        parser.add_argument("--poll", type=float, default=2.0, help="Пауза при пустой очереди, секунды")
+        parser.add_argument("--once", action="store_true", help="Обработать задачи из очереди один раз и выйти")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Остановка воркера...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        workers = options["workers"]
+        self.stdout.write(f"Воркер импорта запущен (потоков: {workers})")
+        with ThreadPoolExecutor(workers, thread_name_prefix="import") as executor:
+            while not stop_event.is_set():
+                processed = process_imports(executor, limit=workers, stop_event=stop_event)
+                if options["once"]:
+                    break
+                if not processed:
+                    stop_event.wait(options["poll"])
+        self.stdout.write("Воркер импорта остановлен")
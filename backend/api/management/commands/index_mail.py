@@ -0,0 +1,45 @@
+from api.email_service import _get_user_credentials, _select_mailbox, imap_pool
+from api.mail_search import INDEX_HEADERS, index_bodies, index_headers
+from api.models import MailboxState
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Дозаполняет поисковый индекс почты: заголовки и тела всех синхронизированных писем"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Email пользователя (по умолчанию - все пользователи)")
+
+    def handle(self, *args, **options):
+        states = MailboxState.objects.select_related("profile__user").filter(profile__email_integration_enabled=True)
+        if options["user"]:
+            states = states.filter(profile__user__email=options["user"])
+
+        for state in states:
+            user = state.profile.user
+            index_headers(state)
+            if not state.messages.filter(index_state=INDEX_HEADERS).exists():
+                continue
+
+            credentials, error = _get_user_credentials(user)
+            if error:
+                self.stderr.write(f"{user.email}: {error[1]}")
+                continue
+            mail, error = imap_pool.acquire(credentials)
+            if error:
+                self.stderr.write(f"{user.email}: {error[1]}")
+                continue
+
+            session_broken = False
+            try:
+                selected, error = _select_mailbox(mail, state.server_name or state.mailbox, user.email)
+                if error:
+                    self.stderr.write(f"{user.email}: {error[1]}")
+                    continue
+                count = index_bodies(mail, state)
+                self.stdout.write(f"{user.email} / {selected}: проиндексировано писем {count}")
+            except Exception as e:
+                session_broken = True
+                self.stderr.write(f"{user.email} / {state.mailbox}: {e}")
+            finally:
+                imap_pool.release(credentials, mail, discard=session_broken)
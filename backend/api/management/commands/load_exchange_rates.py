@@ -0,0 +1,21 @@
+from api.fx import load_rates_file
+from api.spreadsheets import SpreadsheetError
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Загружает курсы валют (ExchangeRate) из .xlsx или .csv файла с колонками Дата, Валюта, Курс"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу курсов")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            with open(path, "rb") as file:
+                saved, errors = load_rates_file(file, path)
+        except (OSError, SpreadsheetError) as e:
+            raise CommandError(str(e)) from e
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(f"Курсов сохранено: {saved}, строк с ошибками: {len(errors)}"))
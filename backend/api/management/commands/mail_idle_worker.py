@@ -0,0 +1,32 @@
+import signal
+import threading
+
+from api.mail_idle import MailIdleWorker
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Держит IMAP IDLE сессии пользователей с включенной почтой и синхронизирует изменения в локальный кэш"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Размер пула потоков синхронизации")
+        parser.add_argument("--mailbox", default="INBOX", help="Отслеживаемая папка")
+        parser.add_argument("--poll", type=float, default=1.0, help="Таймаут ожидания событий, секунды")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Остановка воркера...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        worker = MailIdleWorker(max_workers=options["workers"], mailbox=options["mailbox"])
+        self.stdout.write(f"Воркер IMAP IDLE запущен (потоков синхронизации: {options['workers']})")
+        try:
+            worker.run_forever(stop_event, poll_timeout=options["poll"])
+        finally:
+            worker.shutdown()
+            self.stdout.write("Воркер IMAP IDLE остановлен")
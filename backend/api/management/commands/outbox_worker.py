@@ -0,0 +1,37 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from api.outbox import process_outbox
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди исходящих (OutgoingEmail) с повторами при ошибках"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Сколько отправителей обслуживать параллельно")
+        parser.add_argument("--batch", type=int, default=50, help="Сколько писем забирать из очереди за раз")
+        parser.add_argument("--poll", type=float, default=2.0, help="Пауза при пустой очереди, секунды")
+        parser.add_argument("--once", action="store_true", help="Обработать одну пачку и выйти")
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("Остановка воркера...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        workers = options["workers"]
+        self.stdout.write(f"Воркер исходящей почты запущен (потоков: {workers})")
+        with ThreadPoolExecutor(workers, thread_name_prefix="outbox") as executor:
+            while not stop_event.is_set():
+                processed = process_outbox(executor, batch_size=options["batch"])
+                if options["once"]:
+                    break
+                if not processed:
+                    stop_event.wait(options["poll"])
+        self.stdout.write("Воркер исходящей почты остановлен")
@@ -0,0 +1,22 @@
+from datetime import date
+
+from api.rollups import rebuild_rollup
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Пересобирает таблицу дневных финансовых итогов (DailyFinanceRollup) из заказов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat, help="Первый день, YYYY-MM-DD")
+        parser.add_argument("--end", type=date.fromisoformat, help="Последний день, YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        start, end = options["start"], options["end"]
+        if (start is None) != (end is None):
+            raise CommandError("Укажите обе даты --start и --end или ни одной")
+        if start is not None and start > end:
+            raise CommandError("Дата --start позже --end")
+        rows = rebuild_rollup(start, end)
+        period = f"за {start} - {end}" if start is not None else "за все время"
+        self.stdout.write(self.style.SUCCESS(f"Итоги {period} пересобраны, строк: {rows}"))
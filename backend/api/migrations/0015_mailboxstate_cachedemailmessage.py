@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0014_calendartask_assignee"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailboxState",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("mailbox", models.CharField(max_length=255, verbose_name="Папка (как запрошена клиентом)")),
+                ("server_name", models.CharField(blank=True, max_length=255, verbose_name="Имя папки на сервере")),
+                ("uidvalidity", models.BigIntegerField(blank=True, null=True, verbose_name="UIDVALIDITY")),
+                ("highest_uid", models.BigIntegerField(default=0, verbose_name="Максимальный загруженный UID")),
+                ("highest_modseq", models.BigIntegerField(blank=True, null=True, verbose_name="HIGHESTMODSEQ")),
+                ("message_count", models.IntegerField(default=0, verbose_name="Писем на сервере")),
+                ("synced_at", models.DateTimeField(blank=True, null=True, verbose_name="Последняя синхронизация")),
+                (
+                    "profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="mailbox_states", to="api.userprofile"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Состояние почтовой папки",
+                "verbose_name_plural": "Состояния почтовых папок",
+                "unique_together": {("profile", "mailbox")},
+            },
+        ),
+        migrations.CreateModel(
+            name="CachedEmailMessage",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("uid", models.BigIntegerField(verbose_name="UID")),
+                ("subject", models.CharField(blank=True, max_length=500, verbose_name="Тема")),
+                ("from_addr", models.CharField(blank=True, max_length=500, verbose_name="От")),
+                ("to_addr", models.TextField(blank=True, verbose_name="Кому")),
+                ("date", models.DateTimeField(blank=True, null=True, verbose_name="Дата")),
+                ("size", models.IntegerField(blank=True, null=True, verbose_name="Размер")),
+                ("flags", models.JSONField(default=list, verbose_name="Флаги")),
+                ("is_read", models.BooleanField(default=False, verbose_name="Прочитано")),
+                (
+                    "state",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="messages", to="api.mailboxstate"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Письмо (кэш)",
+                "verbose_name_plural": "Письма (кэш)",
+                "indexes": [models.Index(fields=["state", "date"], name="api_cachede_state_i_68a11a_idx")],
+                "unique_together": {("state", "uid")},
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0015_mailboxstate_cachedemailmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cachedemailmessage",
+            name="index_state",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="Состояние поискового индекса"),
+        ),
+        migrations.CreateModel(
+            name="EmailSearchPosting",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("term", models.CharField(max_length=64, verbose_name="Термин")),
+                ("weight", models.PositiveSmallIntegerField(default=1, verbose_name="Вес")),
+                (
+                    "message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_postings",
+                        to="api.cachedemailmessage",
+                    ),
+                ),
+                (
+                    "state",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_postings",
+                        to="api.mailboxstate",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Поисковый индекс писем",
+                "verbose_name_plural": "Поисковый индекс писем",
+                "indexes": [models.Index(fields=["state", "term"], name="api_emailse_state_i_935d94_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0016_emailsearchposting"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("to_email", models.CharField(max_length=500, verbose_name="получатель")),
+                ("subject", models.TextField(verbose_name="тема")),
+                ("body", models.TextField(verbose_name="текст")),
+                ("documents", models.JSONField(blank=True, default=list, verbose_name="документы")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "В очереди"),
+                            ("sending", "Отправляется"),
+                            ("sent", "Отправлено"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                        verbose_name="статус",
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0, verbose_name="попыток")),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now, verbose_name="следующая попытка"),
+                ),
+                ("claimed_at", models.DateTimeField(blank=True, null=True, verbose_name="взято в работу")),
+                ("last_error", models.TextField(blank=True, verbose_name="последняя ошибка")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="дата создания")),
+                ("sent_at", models.DateTimeField(blank=True, null=True, verbose_name="дата отправки")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="outgoing_emails",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Исходящее письмо",
+                "verbose_name_plural": "Исходящие письма",
+                "indexes": [models.Index(fields=["status", "next_attempt_at"], name="api_outgoin_status_c7140f_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0017_outgoingemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outgoingemail",
+            name="batch_id",
+            field=models.UUIDField(blank=True, db_index=True, null=True, verbose_name="рассылка"),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+from django.db.models import Count
+
+# Сколько повторяющихся номеров перечислять в тексте ошибки
+DUPLICATES_SHOWN = 20
+
+
+def check_contract_numbers(apps, schema_editor):
+    """Готовит данные к уникальному индексу на contract_number.
+
+    Пустые номера становятся NULL. Повторяющиеся номера миграция не меняет:
+    она останавливается со списком повторов (номер и id заказов), чтобы их
+    исправили вручную и заново запустили migrate.
+    """
+    Order = apps.get_model("api", "Order")
+    Order.objects.filter(contract_number="").update(contract_number=None)
+    duplicates = list(
+        Order.objects.exclude(contract_number=None)
+        .values("contract_number")
+        .annotate(total=Count("id"))
+        .filter(total__gt=1)
+        .order_by("contract_number")
+        .values_list("contract_number", flat=True)
+    )
+    if not duplicates:
+        return
+    lines = []
+    for number in duplicates[:DUPLICATES_SHOWN]:
+        ids = Order.objects.filter(contract_number=number).order_by("id").values_list("id", flat=True)
+        lines.append(f"  {number}: заказы {', '.join(map(str, ids))}")
+    if len(duplicates) > DUPLICATES_SHOWN:
+        lines.append(f"  ... и еще {len(duplicates) - DUPLICATES_SHOWN}")
+    raise RuntimeError(
+        f"Номера договоров повторяются ({len(duplicates)}), уникальный индекс создать нельзя. "
+        "Исправьте номера и повторите migrate:\n" + "\n".join(lines)
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0018_outgoingemail_batch_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_contract_numbers, migrations.RunPython.noop),
+    ]
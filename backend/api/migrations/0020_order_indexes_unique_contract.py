@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0019_deduplicate_contract_numbers"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="contract_number",
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True, verbose_name="Номер договора"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["created_by", "-created_at"], name="api_order_created_9c28c0_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["status", "-created_at"], name="api_order_status_f9da42_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["created_at"], name="api_order_created_7fb22c_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["loading_date"], name="api_order_loading_ea32e3_idx"),
+        ),
+    ]
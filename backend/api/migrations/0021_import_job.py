@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-18 15:40
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0020_order_indexes_unique_contract"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("clients", "Клиенты"), ("carriers", "Перевозчики")],
+                        max_length=20,
+                        verbose_name="что импортируется",
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        upload_to="imports/",
+                        validators=[django.core.validators.FileExtensionValidator(["xlsx"])],
+                        verbose_name="файл",
+                    ),
+                ),
+                ("file_name", models.CharField(blank=True, max_length=255, verbose_name="имя файла")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("done", "Завершен"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                        verbose_name="статус",
+                    ),
+                ),
+                ("total_rows", models.PositiveIntegerField(blank=True, null=True, verbose_name="строк в файле")),
+                ("processed_rows", models.PositiveIntegerField(default=0, verbose_name="обработано строк")),
+                ("created_count", models.PositiveIntegerField(default=0, verbose_name="создано записей")),
+                ("skipped_count", models.PositiveIntegerField(default=0, verbose_name="пропущено строк")),
+                ("errors", models.JSONField(blank=True, default=list, verbose_name="ошибки")),
+                ("warnings", models.JSONField(blank=True, default=list, verbose_name="предупреждения")),
+                ("last_error", models.TextField(blank=True, verbose_name="последняя ошибка")),
+                ("claimed_at", models.DateTimeField(blank=True, null=True, verbose_name="взято в работу")),
+                ("run_started_at", models.DateTimeField(blank=True, null=True, verbose_name="начало текущего запуска")),
+                (
+                    "run_started_rows",
+                    models.PositiveIntegerField(default=0, verbose_name="обработано строк на начало запуска"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="дата создания")),
+                ("finished_at", models.DateTimeField(blank=True, null=True, verbose_name="дата завершения")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="import_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Импорт файла",
+                "verbose_name_plural": "Импорт файлов",
+                "indexes": [models.Index(fields=["status", "created_at"], name="api_importj_status_47df30_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0021_import_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="duplicate_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="дубликатов"),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="on_duplicate",
+            field=models.CharField(
+                choices=[("skip", "Пропустить"), ("update", "Дополнить существующую запись")],
+                default="skip",
+                max_length=10,
+                verbose_name="при совпадении с существующей записью",
+            ),
+        ),
+        migrations.AddField(
+            model_name="importjob",
+            name="updated_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="обновлено записей"),
+        ),
+    ]
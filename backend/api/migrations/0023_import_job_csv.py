@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:05
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0022_import_job_duplicates"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="importjob",
+            name="file",
+            field=models.FileField(
+                upload_to="imports/",
+                validators=[django.core.validators.FileExtensionValidator(["xlsx", "csv"])],
+                verbose_name="файл",
+            ),
+        ),
+    ]
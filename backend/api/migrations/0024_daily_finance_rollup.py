@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:30
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+AMOUNT_FIELDS = ("orders_count", "revenue", "profit", "client_rate_sum", "carrier_rate_sum")
+
+
+def backfill_daily_finance_rollup(apps, schema_editor):
+    """Заполняет итоги по существующим заказам (дальше их ведут сигналы Order)."""
+    Order = apps.get_model("api", "Order")
+    DailyFinanceRollup = apps.get_model("api", "DailyFinanceRollup")
+    money = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(0, output_field=money)
+    profit = ExpressionWrapper(
+        Coalesce(F("client_rate"), F("total_price"), zero) - Coalesce(F("carrier_rate"), zero), output_field=money
+    )
+    groups = (
+        Order.objects.annotate(date=TruncDate("created_at"))
+        .values("date", "created_by", "payment_currency", "transport_type")
+        .annotate(
+            orders_count=Count("id"),
+            revenue=Coalesce(Sum("total_price"), zero, output_field=money),
+            profit=Coalesce(Sum(profit), zero),
+            client_rate_sum=Coalesce(Sum("client_rate"), zero, output_field=money),
+            carrier_rate_sum=Coalesce(Sum("carrier_rate"), zero, output_field=money),
+        )
+        .order_by()
+    )
+    totals = defaultdict(lambda: dict.fromkeys(AMOUNT_FIELDS, 0))
+    for row in groups:
+        key = (row["date"], row["created_by"], row["payment_currency"] or "", row["transport_type"] or "")
+        for field in AMOUNT_FIELDS:
+            totals[key][field] += row[field]
+    DailyFinanceRollup.objects.bulk_create(
+        [
+            DailyFinanceRollup(
+                date=day, created_by_id=created_by_id, currency=currency, transport_type=transport_type, **amounts
+            )
+            for (day, created_by_id, currency, transport_type), amounts in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0023_import_job_csv"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyFinanceRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(verbose_name="дата")),
+                ("currency", models.CharField(blank=True, default="", max_length=10, verbose_name="валюта")),
+                (
+                    "transport_type",
+                    models.CharField(blank=True, default="", max_length=20, verbose_name="тип транспорта"),
+                ),
+                ("orders_count", models.IntegerField(default=0, verbose_name="заказов")),
+                ("revenue", models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="выручка")),
+                ("profit", models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name="прибыль")),
+                (
+                    "client_rate_sum",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="сумма ставок клиентов"
+                    ),
+                ),
+                (
+                    "carrier_rate_sum",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="сумма ставок перевозчиков"
+                    ),
+                ),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="менеджер",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Финансовые итоги за день",
+                "verbose_name_plural": "Финансовые итоги по дням",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyfinancerollup",
+            constraint=models.UniqueConstraint(
+                fields=("date", "created_by", "currency", "transport_type"), name="unique_daily_finance_rollup"
+            ),
+        ),
+        migrations.RunPython(backfill_daily_finance_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:55
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+AMOUNT_FIELDS = ("orders_count", "revenue", "profit", "client_rate_sum", "carrier_rate_sum")
+
+
+def refill_daily_finance_rollup(apps, schema_editor):
+    """Пересобирает итоги с валютой перевозчика в ключе (без нее - валюта расчетов)."""
+    Order = apps.get_model("api", "Order")
+    DailyFinanceRollup = apps.get_model("api", "DailyFinanceRollup")
+    money = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(0, output_field=money)
+    profit = ExpressionWrapper(
+        Coalesce(F("client_rate"), F("total_price"), zero) - Coalesce(F("carrier_rate"), zero), output_field=money
+    )
+    groups = (
+        Order.objects.annotate(date=TruncDate("created_at"))
+        .values("date", "created_by", "payment_currency", "carrier_currency", "transport_type")
+        .annotate(
+            orders_count=Count("id"),
+            revenue=Coalesce(Sum("total_price"), zero, output_field=money),
+            profit=Coalesce(Sum(profit), zero),
+            client_rate_sum=Coalesce(Sum("client_rate"), zero, output_field=money),
+            carrier_rate_sum=Coalesce(Sum("carrier_rate"), zero, output_field=money),
+        )
+        .order_by()
+    )
+    totals = defaultdict(lambda: dict.fromkeys(AMOUNT_FIELDS, 0))
+    for row in groups:
+        currency = row["payment_currency"] or ""
+        key = (
+            row["date"],
+            row["created_by"],
+            currency,
+            row["carrier_currency"] or currency,
+            row["transport_type"] or "",
+        )
+        for field in AMOUNT_FIELDS:
+            totals[key][field] += row[field]
+    DailyFinanceRollup.objects.all().delete()
+    DailyFinanceRollup.objects.bulk_create(
+        [
+            DailyFinanceRollup(
+                date=day,
+                created_by_id=created_by_id,
+                currency=currency,
+                carrier_currency=carrier_currency,
+                transport_type=transport_type,
+                **amounts,
+            )
+            for (day, created_by_id, currency, carrier_currency, transport_type), amounts in totals.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0024_daily_finance_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("date", models.DateField(verbose_name="дата")),
+                ("currency", models.CharField(max_length=10, verbose_name="валюта")),
+                ("rate", models.DecimalField(decimal_places=6, max_digits=18, verbose_name="курс")),
+            ],
+            options={
+                "verbose_name": "Курс валюты",
+                "verbose_name_plural": "Курсы валют",
+                "ordering": ["-date", "currency"],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name="dailyfinancerollup",
+            name="unique_daily_finance_rollup",
+        ),
+        migrations.AddField(
+            model_name="dailyfinancerollup",
+            name="carrier_currency",
+            field=models.CharField(blank=True, default="", max_length=10, verbose_name="валюта перевозчика"),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyfinancerollup",
+            constraint=models.UniqueConstraint(
+                fields=("date", "created_by", "currency", "carrier_currency", "transport_type"),
+                name="unique_daily_finance_rollup",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="exchangerate",
+            constraint=models.UniqueConstraint(fields=("currency", "date"), name="unique_exchange_rate"),
+        ),
+        migrations.RunPython(refill_daily_finance_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:20
+
+from api.utils import extract_city
+from django.db import migrations, models
+from django.db.models import Q
+
+BATCH_SIZE = 1000
+
+
+def fill_route_cities(apps, schema_editor):
+    """Заполняет города загрузки и выгрузки по адресам существующих заказов."""
+    Order = apps.get_model("api", "Order")
+    orders = Order.objects.filter(Q(loading_address__gt="") | Q(unloading_address__gt="")).only(
+        "pk", "loading_address", "unloading_address"
+    )
+    batch = []
+    for order in orders.iterator(chunk_size=BATCH_SIZE):
+        order.loading_city = extract_city(order.loading_address)
+        order.unloading_city = extract_city(order.unloading_address)
+        batch.append(order)
+        if len(batch) >= BATCH_SIZE:
+            Order.objects.bulk_update(batch, ["loading_city", "unloading_city"])
+            batch = []
+    Order.objects.bulk_update(batch, ["loading_city", "unloading_city"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0025_exchange_rates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="loading_city",
+            field=models.CharField(blank=True, default="", max_length=100, verbose_name="Город загрузки"),
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="unloading_city",
+            field=models.CharField(blank=True, default="", max_length=100, verbose_name="Город выгрузки"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["loading_city", "unloading_city", "created_at"], name="api_order_loading_a726e8_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["transport_type", "created_at"], name="api_order_transpo_7b16ff_idx"),
+        ),
+        migrations.RunPython(fill_route_cities, migrations.RunPython.noop),
+    ]
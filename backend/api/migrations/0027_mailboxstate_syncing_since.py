@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0026_order_route_cities"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailboxstate",
+            name="syncing_since",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Синхронизация идет с"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0027_mailboxstate_syncing_since"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="carrier",
+            index=models.Index(fields=["created_by", "-created_at"], name="api_carrier_created_6826f6_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["created_by", "-created_at"], name="api_client_created_2b3e36_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(fields=["user", "-sent_at"], name="api_notific_user_id_2861b5_idx"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-18 19:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0028_keyset_list_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="api_order_loading_a726e8_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="order",
+            name="api_order_transpo_7b16ff_idx",
+        ),
+    ]
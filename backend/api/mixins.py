@@ -0,0 +1,141 @@
+"""Разреженные наборы полей (sparse fieldsets) для API.
+
+Параметры запроса list/retrieve:
+    ?fields=id,status,client   - вывести только перечисленные поля
+    ?exclude=carrier_details   - вывести все поля, кроме перечисленных
+    ?profile=list              - именованный набор полей из FIELD_PROFILES сериализатора
+
+Ограничивается не только ответ, но и запрос к БД: связи подгружаются только
+для выводимых полей, а список колонок SELECT сужается через queryset.only().
+Поле "id" выводится всегда - по нему таблицы на фронтенде различают строки.
+"""
+
+import re
+from typing import Dict, List, Optional, Set
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+# CharField(source="get_status_display") читает колонку status
+DISPLAY_SOURCE_RE = re.compile(r"get_(\w+)_display")
+
+
+def _split(value: Optional[str]) -> List[str]:
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+class SparseFieldsSerializerMixin:
+    """Сериализатор, который выводит только поля из context["sparse_fields"].
+
+    SELECT_RELATED / PREFETCH_RELATED - какую связь читает поле (для вычисляемых
+    полей это единственный способ узнать, какие колонки им нужны).
+    """
+
+    SELECT_RELATED: Dict[str, str] = {}
+    PREFETCH_RELATED: Dict[str, str] = {}
+    FIELD_PROFILES: Dict[str, List[str]] = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = self.context.get("sparse_fields")
+        if names is not None:
+            for name in set(self.fields) - set(names):
+                self.fields.pop(name)
+
+    @classmethod
+    def resolve_field_names(
+        cls, fields: Optional[str] = None, exclude: Optional[str] = None, profile: Optional[str] = None
+    ) -> Optional[List[str]]:
+        """Имена выводимых полей по параметрам запроса; None - выводить все поля."""
+        selected = None
+        if profile:
+            if profile not in cls.FIELD_PROFILES:
+                raise ValidationError({"profile": f"Неизвестный набор полей: {profile}"})
+            selected = set(cls.FIELD_PROFILES[profile])
+        if fields:
+            selected = set(_split(fields))
+        excluded = set(_split(exclude))
+        if selected is None and not excluded:
+            return None
+        return [
+            name
+            for name in cls().fields
+            if name == "id" or ((selected is None or name in selected) and name not in excluded)
+        ]
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """Подгружает связи, нужные выводимым полям, чтобы список не делал запросов на каждую строку.
+
+        ``fields`` - имена выводимых полей; по умолчанию все поля сериализатора.
+        """
+        fields = set(cls().fields if fields is None else fields)
+        select = {relation for field, relation in cls.SELECT_RELATED.items() if field in fields}
+        prefetch = {relation for field, relation in cls.PREFETCH_RELATED.items() if field in fields}
+        return queryset.select_related(*sorted(select)).prefetch_related(*sorted(prefetch))
+
+    def get_source_columns(self) -> Optional[Set[str]]:
+        """Колонки модели, которые читают выводимые поля.
+
+        None - если какое-то поле берет значение из свойства модели: какие колонки
+        ему нужны, неизвестно, и сужать SELECT небезопасно.
+        """
+        opts = self.Meta.model._meta
+        columns = {opts.pk.name}
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in self.SELECT_RELATED:
+                columns.add(self.SELECT_RELATED[name].split("__")[0])
+                continue
+            if name in self.PREFETCH_RELATED:
+                continue
+            source = field.source.split(".")[0]
+            match = DISPLAY_SOURCE_RE.fullmatch(source)
+            if match:
+                source = match.group(1)
+            try:
+                model_field = opts.get_field(source)
+            except FieldDoesNotExist:
+                return None
+            # Обратные связи и M2M загружаются отдельным запросом по первичному ключу
+            if model_field.concrete:
+                columns.add(model_field.name)
+        return columns
+
+
+class SparseFieldsViewSetMixin:
+    """Применяет ?fields= / ?exclude= / ?profile= к ответу и к запросу вьюсета.
+
+    Сериализатор вьюсета должен наследовать SparseFieldsSerializerMixin.
+    """
+
+    sparse_field_actions = ("list", "retrieve")
+
+    def get_sparse_fields(self) -> Optional[List[str]]:
+        if getattr(self, "request", None) is None or self.action not in self.sparse_field_actions:
+            return None
+        params = self.request.query_params
+        return self.get_serializer_class().resolve_field_names(
+            fields=params.get("fields"), exclude=params.get("exclude"), profile=params.get("profile")
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["sparse_fields"] = self.get_sparse_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        return self.sparse_queryset(super().filter_queryset(queryset))
+
+    def sparse_queryset(self, queryset):
+        """Подгружает связи выводимых полей и сужает SELECT до их колонок."""
+        if self.action not in self.sparse_field_actions:
+            return queryset
+        names = self.get_sparse_fields()
+        queryset = self.get_serializer_class().setup_eager_loading(queryset, names)
+        if names is not None:
+            columns = self.get_serializer().get_source_columns()
+            if columns is not None:
+                queryset = queryset.only(*sorted(columns))
+        return queryset
@@ -8,6 +8,8 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .utils import extract_city
+
 
 class CustomUser(AbstractUser):
     class RoleChoices(models.TextChoices):
@@ -66,6 +68,7 @@ class Client(models.Model):
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["created_by", "-created_at"])]
 
     def __str__(self):
         return self.company_name
@@ -139,6 +142,9 @@ class Carrier(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name="Создатель")
 
+    class Meta:
+        indexes = [models.Index(fields=["created_by", "-created_at"])]
+
     def __str__(self):
         return self.company_name or "Без названия"
 
@@ -254,7 +260,7 @@ class Order(models.Model):
     created_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, verbose_name="Создатель")
 
     # 1. Документы и реквизиты
-    contract_number = models.CharField(max_length=50, verbose_name="Номер договора", null=True, blank=True)
+    contract_number = models.CharField(max_length=50, verbose_name="Номер договора", null=True, blank=True, unique=True)
     transport_order_number = models.CharField(
         max_length=50, verbose_name="Транспортный заказ номер", null=True, blank=True
     )
@@ -341,6 +347,9 @@ class Order(models.Model):
     consignee_okpo = models.CharField(max_length=10, verbose_name="ОКПО грузополучателя", null=True, blank=True)
     loading_address = models.TextField(verbose_name="Адрес загрузки", null=True, blank=True)
     unloading_address = models.TextField(verbose_name="Адрес выгрузки", null=True, blank=True)
+    # Города из адресов (api.utils.extract_city) для группировки по маршруту, заполняются в save()
+    loading_city = models.CharField(max_length=100, verbose_name="Город загрузки", blank=True, default="")
+    unloading_city = models.CharField(max_length=100, verbose_name="Город выгрузки", blank=True, default="")
     shipper = models.CharField(max_length=255, verbose_name="Грузоотправитель", null=True, blank=True)
     destination = models.CharField(max_length=255, verbose_name="Пункт назначения", null=True, blank=True)
 
@@ -352,10 +361,82 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ["-created_at"]
+        # Под фильтры списка заказов (см. audit_query_plans) и финансовые отчеты по дате создания
+        indexes = [
+            models.Index(fields=["created_by", "-created_at"]),
+            models.Index(fields=["status", "-created_at"]),
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["loading_date"]),
+        ]
 
     def __str__(self):
         return f"Заказ №{self.contract_number} от {self.contract_date}"
 
+    def save(self, *args, **kwargs):
+        self.loading_city = extract_city(self.loading_address)
+        self.unloading_city = extract_city(self.unloading_address)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"loading_address", "unloading_address"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"loading_city", "unloading_city"}
+        super().save(*args, **kwargs)
+
+
+class DailyFinanceRollup(models.Model):
+    """Итоги заказов за день создания по менеджеру, валютам и типу транспорта.
+
+    Выручка и ставки клиентов - в валюте расчетов (currency), ставки
+    перевозчиков - в валюте перевозчика (carrier_currency), прибыль - их
+    разность без пересчета; в одну валюту итоги переводит api/fx.py.
+    Ведется сигналами Order (api/signals.py), пересобирается командой rebuild_finance_rollup.
+    """
+
+    date = models.DateField(_("дата"))
+    created_by = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name=_("менеджер")
+    )
+    currency = models.CharField(_("валюта"), max_length=10, blank=True, default="")
+    carrier_currency = models.CharField(_("валюта перевозчика"), max_length=10, blank=True, default="")
+    transport_type = models.CharField(_("тип транспорта"), max_length=20, blank=True, default="")
+    orders_count = models.IntegerField(_("заказов"), default=0)
+    revenue = models.DecimalField(_("выручка"), max_digits=14, decimal_places=2, default=0)
+    profit = models.DecimalField(_("прибыль"), max_digits=14, decimal_places=2, default=0)
+    client_rate_sum = models.DecimalField(_("сумма ставок клиентов"), max_digits=14, decimal_places=2, default=0)
+    carrier_rate_sum = models.DecimalField(_("сумма ставок перевозчиков"), max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = _("Финансовые итоги за день")
+        verbose_name_plural = _("Финансовые итоги по дням")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "created_by", "currency", "carrier_currency", "transport_type"],
+                name="unique_daily_finance_rollup",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.currency} {self.transport_type}: {self.orders_count} заказов"
+
+
+class ExchangeRate(models.Model):
+    """Курс валюты на дату: сколько единиц FX_REFERENCE_CURRENCY стоит одна единица currency.
+
+    Курс действует до следующей даты с курсом этой валюты (но не дольше FX_RATE_MAX_AGE_DAYS).
+    Загружается командой load_exchange_rates или вводится вручную в админке.
+    """
+
+    date = models.DateField(_("дата"))
+    currency = models.CharField(_("валюта"), max_length=10)
+    rate = models.DecimalField(_("курс"), max_digits=18, decimal_places=6)
+
+    class Meta:
+        verbose_name = _("Курс валюты")
+        verbose_name_plural = _("Курсы валют")
+        ordering = ["-date", "currency"]
+        constraints = [models.UniqueConstraint(fields=["currency", "date"], name="unique_exchange_rate")]
+
+    def __str__(self):
+        return f"{self.currency} {self.date}: {self.rate}"
+
 
 # Остальные модели (Document, UserActionLog, Payment, Invoice, Notification) без изменений
 
@@ -433,6 +514,9 @@ class Notification(models.Model):
     sent_at = models.DateTimeField(_("дата отправки"), auto_now_add=True)
     is_read = models.BooleanField(_("прочитано"), default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "-sent_at"])]
+
     def __str__(self):
         return f"Уведомление #{self.id} ({self.notification_type})"
 
@@ -513,6 +597,173 @@ class UserProfile(models.Model):
         verbose_name_plural = "Профили пользователей"
 
 
+class MailboxState(models.Model):
+    """Состояние синхронизации одной папки IMAP для профиля пользователя."""
+
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name="mailbox_states")
+    mailbox = models.CharField(max_length=255, verbose_name="Папка (как запрошена клиентом)")
+    server_name = models.CharField(max_length=255, blank=True, verbose_name="Имя папки на сервере")
+    uidvalidity = models.BigIntegerField(null=True, blank=True, verbose_name="UIDVALIDITY")
+    highest_uid = models.BigIntegerField(default=0, verbose_name="Максимальный загруженный UID")
+    highest_modseq = models.BigIntegerField(null=True, blank=True, verbose_name="HIGHESTMODSEQ")
+    message_count = models.IntegerField(default=0, verbose_name="Писем на сервере")
+    synced_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя синхронизация")
+    syncing_since = models.DateTimeField(null=True, blank=True, verbose_name="Синхронизация идет с")
+
+    class Meta:
+        verbose_name = "Состояние почтовой папки"
+        verbose_name_plural = "Состояния почтовых папок"
+        unique_together = (("profile", "mailbox"),)
+
+    def __str__(self):
+        return f"{self.mailbox} ({self.profile_id})"
+
+
+class CachedEmailMessage(models.Model):
+    """Локальная копия заголовков и флагов письма (без тела)."""
+
+    state = models.ForeignKey(MailboxState, on_delete=models.CASCADE, related_name="messages")
+    uid = models.BigIntegerField(verbose_name="UID")
+    subject = models.CharField(max_length=500, blank=True, verbose_name="Тема")
+    from_addr = models.CharField(max_length=500, blank=True, verbose_name="От")
+    to_addr = models.TextField(blank=True, verbose_name="Кому")
+    date = models.DateTimeField(null=True, blank=True, verbose_name="Дата")
+    size = models.IntegerField(null=True, blank=True, verbose_name="Размер")
+    flags = models.JSONField(default=list, verbose_name="Флаги")
+    is_read = models.BooleanField(default=False, verbose_name="Прочитано")
+    index_state = models.PositiveSmallIntegerField(default=0, verbose_name="Состояние поискового индекса")
+
+    class Meta:
+        verbose_name = "Письмо (кэш)"
+        verbose_name_plural = "Письма (кэш)"
+        unique_together = (("state", "uid"),)
+        indexes = [models.Index(fields=["state", "date"])]
+
+    def __str__(self):
+        return f"{self.uid}: {self.subject}"
+
+
+class EmailSearchPosting(models.Model):
+    """Запись инвертированного индекса: термин -> письмо с весом."""
+
+    state = models.ForeignKey(MailboxState, on_delete=models.CASCADE, related_name="search_postings")
+    message = models.ForeignKey(CachedEmailMessage, on_delete=models.CASCADE, related_name="search_postings")
+    term = models.CharField(max_length=64, verbose_name="Термин")
+    weight = models.PositiveSmallIntegerField(default=1, verbose_name="Вес")
+
+    class Meta:
+        verbose_name = "Поисковый индекс писем"
+        verbose_name_plural = "Поисковый индекс писем"
+        indexes = [models.Index(fields=["state", "term"])]
+
+    def __str__(self):
+        return f"{self.term} -> {self.message_id}"
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди на отправку (исходящий ящик), отправляется воркером outbox_worker."""
+
+    class Statuses(models.TextChoices):
+        QUEUED = "queued", _("В очереди")
+        SENDING = "sending", _("Отправляется")
+        SENT = "sent", _("Отправлено")
+        FAILED = "failed", _("Ошибка")
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="outgoing_emails")
+    to_email = models.CharField(_("получатель"), max_length=500)
+    subject = models.TextField(_("тема"))
+    body = models.TextField(_("текст"))
+    documents = models.JSONField(_("документы"), default=list, blank=True)
+    batch_id = models.UUIDField(_("рассылка"), null=True, blank=True, db_index=True)
+    status = models.CharField(_("статус"), max_length=20, choices=Statuses.choices, default=Statuses.QUEUED)
+    attempts = models.PositiveSmallIntegerField(_("попыток"), default=0)
+    next_attempt_at = models.DateTimeField(_("следующая попытка"), default=timezone.now)
+    claimed_at = models.DateTimeField(_("взято в работу"), null=True, blank=True)
+    last_error = models.TextField(_("последняя ошибка"), blank=True)
+    created_at = models.DateTimeField(_("дата создания"), auto_now_add=True)
+    sent_at = models.DateTimeField(_("дата отправки"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Исходящее письмо")
+        verbose_name_plural = _("Исходящие письма")
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"Письмо #{self.id} для {self.to_email} ({self.status})"
+
+
+class ImportJob(models.Model):
+    """Фоновый импорт файла клиентов или перевозчиков, выполняется воркером import_worker."""
+
+    class Kinds(models.TextChoices):
+        CLIENTS = "clients", _("Клиенты")
+        CARRIERS = "carriers", _("Перевозчики")
+
+    class Statuses(models.TextChoices):
+        QUEUED = "queued", _("В очереди")
+        RUNNING = "running", _("Выполняется")
+        DONE = "done", _("Завершен")
+        FAILED = "failed", _("Ошибка")
+
+    class OnDuplicate(models.TextChoices):
+        SKIP = "skip", _("Пропустить")
+        UPDATE = "update", _("Дополнить существующую запись")
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="import_jobs")
+    kind = models.CharField(_("что импортируется"), max_length=20, choices=Kinds.choices)
+    file = models.FileField(_("файл"), upload_to="imports/", validators=[FileExtensionValidator(["xlsx", "csv"])])
+    file_name = models.CharField(_("имя файла"), max_length=255, blank=True)
+    on_duplicate = models.CharField(
+        _("при совпадении с существующей записью"),
+        max_length=10,
+        choices=OnDuplicate.choices,
+        default=OnDuplicate.SKIP,
+    )
+    status = models.CharField(_("статус"), max_length=20, choices=Statuses.choices, default=Statuses.QUEUED)
+    total_rows = models.PositiveIntegerField(_("строк в файле"), null=True, blank=True)
+    # Контрольная точка: строки до этой обработаны и закоммичены, продолжать отсюда
+    processed_rows = models.PositiveIntegerField(_("обработано строк"), default=0)
+    created_count = models.PositiveIntegerField(_("создано записей"), default=0)
+    updated_count = models.PositiveIntegerField(_("обновлено записей"), default=0)
+    skipped_count = models.PositiveIntegerField(_("пропущено строк"), default=0)
+    duplicate_count = models.PositiveIntegerField(_("дубликатов"), default=0)
+    errors = models.JSONField(_("ошибки"), default=list, blank=True)
+    warnings = models.JSONField(_("предупреждения"), default=list, blank=True)
+    last_error = models.TextField(_("последняя ошибка"), blank=True)
+    claimed_at = models.DateTimeField(_("взято в работу"), null=True, blank=True)
+    run_started_at = models.DateTimeField(_("начало текущего запуска"), null=True, blank=True)
+    run_started_rows = models.PositiveIntegerField(_("обработано строк на начало запуска"), default=0)
+    created_at = models.DateTimeField(_("дата создания"), auto_now_add=True)
+    finished_at = models.DateTimeField(_("дата завершения"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Импорт файла")
+        verbose_name_plural = _("Импорт файлов")
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Импорт #{self.id} {self.file_name} ({self.status})"
+
+    @property
+    def progress(self):
+        """Доля обработанных строк в процентах; None, пока файл не прочитан."""
+        if not self.total_rows:
+            return 100 if self.status == self.Statuses.DONE else None
+        # Число строк .xlsx берется из размера листа и может быть неточным
+        return min(round(100 * self.processed_rows / self.total_rows, 1), 100)
+
+    @property
+    def eta_seconds(self):
+        """Оценка оставшегося времени по скорости текущего запуска."""
+        if self.status != self.Statuses.RUNNING or not self.total_rows or self.run_started_at is None:
+            return None
+        done = self.processed_rows - self.run_started_rows
+        if done <= 0:
+            return None
+        elapsed = (timezone.now() - self.run_started_at).total_seconds()
+        return round(elapsed / done * max(self.total_rows - self.processed_rows, 0))
+
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
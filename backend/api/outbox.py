@@ -0,0 +1,161 @@
+"""Очередь исходящих писем.
+
+Запрос на отправку только сохраняет OutgoingEmail и сразу отвечает 202,
+а SMTP отправку (вместе с вложениями и копией в "Отправленные") выполняет
+воркер outbox_worker. Письма забираются в работу условным UPDATE, поэтому
+несколько воркеров не отправят одно письмо дважды. Неудачные попытки
+повторяются с экспоненциальной задержкой.
+
+Забранные письма группируются по отправителю: письма одного пользователя
+уходят последовательно через одну SMTP сессию из пула, а документы рассылки
+запрашиваются из БД один раз на группу.
+"""
+
+import logging
+import random
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .email_service import ERR_TYPE_AUTHENTICATION, ERR_TYPE_CONFIG, ERR_TYPE_UNKNOWN, send_email
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# Ошибки, при которых повтор бессмысленен, пока пользователь не исправит настройки
+PERMANENT_ERROR_TYPES = {ERR_TYPE_AUTHENTICATION, ERR_TYPE_CONFIG}
+
+
+def enqueue_email(user, to: str, subject: str, body: str, documents: Optional[List[int]] = None) -> OutgoingEmail:
+    """Ставит письмо в очередь на отправку."""
+    outgoing = OutgoingEmail.objects.create(
+        user=user, to_email=to, subject=subject, body=body, documents=[int(doc_id) for doc_id in documents or []]
+    )
+    logger.info(f"Письмо #{outgoing.id} от {user.email} к {to} поставлено в очередь")
+    return outgoing
+
+
+def enqueue_bulk(
+    user, recipients: List[str], subject: str, body: str, documents: Optional[List[int]] = None
+) -> Tuple[uuid.UUID, List[OutgoingEmail]]:
+    """Ставит в очередь одно и то же письмо для каждого получателя. Возвращает (batch_id, письма)."""
+    batch_id = uuid.uuid4()
+    document_ids = [int(doc_id) for doc_id in documents or []]
+    outgoing = OutgoingEmail.objects.bulk_create(
+        [
+            OutgoingEmail(user=user, to_email=to, subject=subject, body=body, documents=document_ids, batch_id=batch_id)
+            for to in recipients
+        ]
+    )
+    logger.info(f"Рассылка {batch_id} от {user.email}: в очередь поставлено {len(outgoing)} писем")
+    return batch_id, outgoing
+
+
+def _claimable(now) -> Q:
+    stale = now - timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+    return Q(status=OutgoingEmail.Statuses.QUEUED, next_attempt_at__lte=now) | Q(
+        status=OutgoingEmail.Statuses.SENDING, claimed_at__lt=stale
+    )
+
+
+def claim_batch(limit: int) -> List[OutgoingEmail]:
+    """Забирает в работу до ``limit`` писем, готовых к отправке.
+
+    Каждое письмо захватывается отдельным условным UPDATE: если другой воркер
+    успел раньше, UPDATE не затронет строк и письмо будет пропущено.
+    """
+    now = timezone.now()
+    candidate_ids = list(
+        OutgoingEmail.objects.filter(_claimable(now)).order_by("next_attempt_at").values_list("id", flat=True)[:limit]
+    )
+    claimed = []
+    for outgoing_id in candidate_ids:
+        updated = OutgoingEmail.objects.filter(_claimable(now), id=outgoing_id).update(
+            status=OutgoingEmail.Statuses.SENDING, claimed_at=now, attempts=F("attempts") + 1
+        )
+        if updated:
+            claimed.append(outgoing_id)
+    return list(OutgoingEmail.objects.select_related("user").filter(id__in=claimed))
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Экспоненциальная задержка с небольшим разбросом, чтобы повторы не шли пачкой."""
+    delay = min(settings.OUTBOX_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), settings.OUTBOX_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def record_result(outgoing: OutgoingEmail, success: bool, error_info=None) -> None:
+    """Сохраняет результат попытки отправки: отправлено, повтор позже или окончательная ошибка."""
+    now = timezone.now()
+    if success:
+        outgoing.status = OutgoingEmail.Statuses.SENT
+        outgoing.sent_at = now
+        outgoing.last_error = ""
+        logger.info(f"Письмо #{outgoing.id} отправлено с попытки {outgoing.attempts}")
+    else:
+        error_type, message = error_info or (ERR_TYPE_UNKNOWN, "Неизвестная ошибка")
+        outgoing.last_error = message
+        if error_type in PERMANENT_ERROR_TYPES or outgoing.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            outgoing.status = OutgoingEmail.Statuses.FAILED
+            logger.error(f"Письмо #{outgoing.id} не отправлено окончательно: {message}")
+        else:
+            outgoing.status = OutgoingEmail.Statuses.QUEUED
+            outgoing.next_attempt_at = now + retry_delay(outgoing.attempts)
+            logger.warning(
+                f"Письмо #{outgoing.id} не отправлено (попытка {outgoing.attempts}), повтор позже: {message}"
+            )
+    outgoing.claimed_at = None
+    outgoing.save(update_fields=["status", "sent_at", "last_error", "next_attempt_at", "claimed_at"])
+
+
+def deliver(outgoing: OutgoingEmail, attachment_cache: Optional[Dict] = None) -> bool:
+    """Отправляет одно письмо из очереди и сохраняет результат."""
+    close_old_connections()
+    try:
+        try:
+            success, error_info = send_email(
+                outgoing.user,
+                to=outgoing.to_email,
+                subject=outgoing.subject,
+                body=outgoing.body,
+                documents=outgoing.documents,
+                attachment_cache=attachment_cache,
+            )
+        except Exception as e:
+            logger.error(f"Исключение при отправке письма #{outgoing.id}: {e}", exc_info=True)
+            success, error_info = False, (ERR_TYPE_UNKNOWN, str(e))
+        record_result(outgoing, success, error_info)
+        return success
+    finally:
+        close_old_connections()
+
+
+def deliver_group(group: List[OutgoingEmail]) -> int:
+    """Последовательно отправляет письма одного отправителя. Возвращает число отправленных."""
+    attachment_cache = {}
+    return sum(deliver(outgoing, attachment_cache) for outgoing in group)
+
+
+def group_by_sender(batch: List[OutgoingEmail]) -> List[List[OutgoingEmail]]:
+    groups = defaultdict(list)
+    for outgoing in sorted(batch, key=lambda item: item.id):
+        groups[outgoing.user_id].append(outgoing)
+    return list(groups.values())
+
+
+def process_outbox(executor: ThreadPoolExecutor, batch_size: int) -> int:
+    """Забирает пачку писем и отправляет их: отправители параллельно, письма одного отправителя подряд.
+
+    Возвращает число обработанных писем.
+    """
+    batch = claim_batch(batch_size)
+    if batch:
+        list(executor.map(deliver_group, group_by_sender(batch)))
+    return len(batch)
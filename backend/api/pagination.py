@@ -0,0 +1,138 @@
+"""Keyset (cursor) пагинация для больших таблиц.
+
+PageNumberPagination на каждой странице делает COUNT(*) и OFFSET, поэтому
+дальние страницы и подсчет дорожают вместе с таблицей. KeysetPagination
+включается параметром запроса и листает по ключу (created_at, id) - или
+(keyset_field, id) у подклассов:
+
+    ?cursor=            - первая страница (пустой курсор)
+    ?cursor=<next/prev> - следующая или предыдущая страница из ответа
+    ?count=1 (или true) - добавить в ответ общее число строк (кэшируется на
+                          PAGINATION_COUNT_CACHE_TTL секунд, поэтому приблизительное)
+
+Страница N выбирается условием по индексу, а не OFFSET, и стоит столько же,
+сколько первая. Без параметра cursor работает обычная постраничная пагинация.
+Порядок при keyset пагинации всегда "сначала новые".
+"""
+
+import base64
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position, pk: int, reverse: bool = False) -> str:
+    payload = {"t": position.isoformat(), "id": pk}
+    if reverse:
+        payload["r"] = 1
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(value: str) -> Tuple:
+    """Возвращает (время, id, reverse). Невалидный курсор - 404, как в DRF CursorPagination."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(value.encode()))
+        created_at = parse_datetime(payload["t"])
+        pk = int(payload["id"])
+    except (TypeError, ValueError, KeyError):
+        raise NotFound("Неверный курсор")
+    if created_at is None:
+        raise NotFound("Неверный курсор")
+    return created_at, pk, bool(payload.get("r"))
+
+
+class KeysetPagination(PageNumberPagination):
+    """PageNumberPagination с опциональной keyset пагинацией по (keyset_field, id)."""
+
+    keyset_field = "created_at"
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def keyset_requested(self, request) -> bool:
+        return self.cursor_query_param in request.query_params
+
+    def count_requested(self, request) -> bool:
+        return request.query_params.get(self.count_query_param, "").lower() in ("1", "true")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_requested(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.total = self.get_cached_count(queryset) if self.count_requested(request) else None
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if cursor:
+            value, pk, reverse = decode_cursor(cursor)
+            position = (value, pk)
+
+        field = self.keyset_field
+        if reverse:
+            queryset = queryset.order_by(field, "id")
+        else:
+            queryset = queryset.order_by(f"-{field}", "-id")
+        if position is not None:
+            value, pk = position
+            lookup = "gt" if reverse else "lt"
+            queryset = queryset.filter(Q(**{f"{field}__{lookup}": value}) | Q(**{field: value, f"id__{lookup}": pk}))
+
+        # Одна лишняя строка показывает, есть ли страница дальше
+        rows = list(queryset[: self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[: self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        # На обратной странице более новые строки есть всегда - с них мы пришли
+        more_after = has_more if not reverse else True
+        more_before = has_more if reverse else position is not None
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if more_after:
+                self.next_cursor = encode_cursor(getattr(rows[-1], field), rows[-1].pk)
+            if more_before:
+                self.previous_cursor = encode_cursor(getattr(rows[0], field), rows[0].pk, reverse=True)
+        return rows
+
+    def get_cached_count(self, queryset) -> int:
+        """COUNT(*) по тем же фильтрам, не чаще раза в PAGINATION_COUNT_CACHE_TTL секунд."""
+        sql, params = queryset.order_by().values("pk").query.sql_with_params()
+        key = "keyset-count:" + hashlib.md5(f"{sql}|{params}".encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.order_by().count()
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TTL)
+        return count
+
+    def _cursor_link(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = {"next": self._cursor_link(self.next_cursor), "previous": self._cursor_link(self.previous_cursor)}
+        if self.total is not None:
+            response["count"] = self.total
+        response["results"] = data
+        return Response(response)
+
+
+class NotificationKeysetPagination(KeysetPagination):
+    keyset_field = "sent_at"
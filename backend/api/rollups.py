@@ -0,0 +1,143 @@
+"""Таблица дневных финансовых итогов (DailyFinanceRollup).
+
+Каждый заказ вносит в строку своего ключа (день создания, менеджер, валюта
+расчетов, валюта перевозчика, тип транспорта) выручку, прибыль, ставки и единицу в число заказов. Сигналы
+Order (api/signals.py) при сохранении вычитают прежний вклад заказа и
+добавляют новый, при удалении - вычитают. Изменения в обход сигналов
+(queryset.update, bulk_create, raw SQL) таблица не видит - после них итоги
+пересобираются командой rebuild_finance_rollup.
+
+Заказ без валюты перевозчика считается оплаченным перевозчику в валюте
+расчетов с клиентом.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .finance import MONEY, ORDER_PROFIT, ZERO, created_between
+from .finance_cache import invalidate_all
+from .models import DailyFinanceRollup, Order
+
+logger = logging.getLogger(__name__)
+
+# Поля заказа, от которых зависит его вклад в итоги
+ROLLUP_SOURCE_FIELDS = (
+    "created_at",
+    "created_by_id",
+    "payment_currency",
+    "carrier_currency",
+    "transport_type",
+    "total_price",
+    "client_rate",
+    "carrier_rate",
+)
+ROLLUP_AMOUNT_FIELDS = ("orders_count", "revenue", "profit", "client_rate_sum", "carrier_rate_sum")
+
+RollupKey = Tuple[date, Optional[int], str, str, str]
+
+
+def order_contribution(values: Dict) -> Tuple[RollupKey, Dict]:
+    """Ключ строки итогов и вклад заказа по значениям полей ROLLUP_SOURCE_FIELDS."""
+    total_price = values["total_price"] or Decimal(0)
+    client_rate = values["client_rate"]
+    carrier_rate = values["carrier_rate"] or Decimal(0)
+    key = (
+        timezone.localdate(values["created_at"]),
+        values["created_by_id"],
+        values["payment_currency"] or "",
+        values["carrier_currency"] or values["payment_currency"] or "",
+        values["transport_type"] or "",
+    )
+    amounts = {
+        "orders_count": 1,
+        "revenue": total_price,
+        "profit": (client_rate if client_rate is not None else total_price) - carrier_rate,
+        "client_rate_sum": client_rate or Decimal(0),
+        "carrier_rate_sum": carrier_rate,
+    }
+    return key, amounts
+
+
+def _key_filter(key: RollupKey) -> Dict:
+    day, created_by_id, currency, carrier_currency, transport_type = key
+    return {
+        "date": day,
+        "created_by_id": created_by_id,
+        "currency": currency,
+        "carrier_currency": carrier_currency,
+        "transport_type": transport_type,
+    }
+
+
+def apply_contribution(key: RollupKey, amounts: Dict, sign: int) -> None:
+    """Добавляет (sign=1) или вычитает (sign=-1) вклад заказа в строку итогов."""
+    lookup = _key_filter(key)
+    changes = {field: F(field) + sign * amounts[field] for field in ROLLUP_AMOUNT_FIELDS}
+    # Обновляем одну строку по pk: у строк без менеджера уникальность в БД не проверяется
+    pk = DailyFinanceRollup.objects.filter(**lookup).values_list("pk", flat=True).first()
+    if pk is not None:
+        DailyFinanceRollup.objects.filter(pk=pk).update(**changes)
+        if sign < 0:
+            DailyFinanceRollup.objects.filter(pk=pk, orders_count__lte=0).delete()
+        return
+    if sign < 0:
+        # Итогов по ключу нет (таблица еще не собрана) - вычитать не из чего
+        return
+    try:
+        with transaction.atomic():
+            DailyFinanceRollup.objects.create(**lookup, **amounts)
+    except IntegrityError:
+        # Строку только что создал параллельный запрос
+        DailyFinanceRollup.objects.filter(**lookup).update(**changes)
+
+
+def rebuild_rollup(start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Пересобирает итоги за дни [start, end] (без дат - за все время) из заказов. Возвращает число строк."""
+    orders = Order.objects.all()
+    rollups = DailyFinanceRollup.objects.all()
+    if start is not None and end is not None:
+        orders = orders.filter(created_between(start, end))
+        rollups = rollups.filter(date__range=(start, end))
+
+    groups = (
+        orders.annotate(date=TruncDate("created_at"))
+        .values("date", "created_by", "payment_currency", "carrier_currency", "transport_type")
+        .annotate(
+            orders_count=Count("id"),
+            revenue=Coalesce(Sum("total_price"), ZERO, output_field=MONEY),
+            profit=Coalesce(Sum(ORDER_PROFIT), ZERO),
+            client_rate_sum=Coalesce(Sum("client_rate"), ZERO, output_field=MONEY),
+            carrier_rate_sum=Coalesce(Sum("carrier_rate"), ZERO, output_field=MONEY),
+        )
+        .order_by()
+    )
+    # NULL и "" в валютах и типе транспорта попадают в одну строку итогов
+    totals = defaultdict(lambda: dict.fromkeys(ROLLUP_AMOUNT_FIELDS, 0))
+    for row in groups:
+        currency = row["payment_currency"] or ""
+        key = (
+            row["date"],
+            row["created_by"],
+            currency,
+            row["carrier_currency"] or currency,
+            row["transport_type"] or "",
+        )
+        for field in ROLLUP_AMOUNT_FIELDS:
+            totals[key][field] += row[field]
+
+    with transaction.atomic():
+        rollups.delete()
+        DailyFinanceRollup.objects.bulk_create(
+            [DailyFinanceRollup(**_key_filter(key), **amounts) for key, amounts in totals.items()], batch_size=1000
+        )
+    invalidate_all()
+    logger.info(f"Финансовые итоги пересобраны: строк {len(totals)}")
+    return len(totals)
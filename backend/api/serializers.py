@@ -6,6 +6,7 @@ from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from .encryption_utils import encrypt_data  # Импортируем функцию шифрования
+from .mixins import SparseFieldsSerializerMixin
 from .models import (
     CalendarTask,
     Cargo,
@@ -147,7 +148,7 @@ class CarrierContactSerializer(ContactSerializer):
         model = CarrierContact
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     contacts = ClientContactSerializer(many=True, required=False)
     has_active_order = serializers.BooleanField(read_only=True)
     created_by = UserSerializer(read_only=True)
@@ -155,6 +156,9 @@ class ClientSerializer(serializers.ModelSerializer):
         queryset=CustomUser.objects.all(), source="created_by", write_only=True, required=False, allow_null=True
     )
 
+    SELECT_RELATED = {"created_by": "created_by"}
+    PREFETCH_RELATED = {"contacts": "contacts"}
+
     class Meta:
         model = Client
         fields = [
@@ -212,6 +216,8 @@ class ClientSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        if "contacts" not in self.fields:
+            return representation
         # Группируем контакты по типу
         contacts = representation.pop("contacts", [])
         representation["contacts"] = {
@@ -229,7 +235,7 @@ class ClientListSerializer(serializers.ModelSerializer):
         fields = ["id", "company_name", "has_active_order", "comments"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     client = serializers.SerializerMethodField()
     client_id = serializers.PrimaryKeyRelatedField(
         queryset=Client.objects.all(), source="client", write_only=True, required=False, allow_null=True
@@ -240,10 +246,38 @@ class OrderSerializer(serializers.ModelSerializer):
     )
     carrier_details = serializers.SerializerMethodField()
     created_by = UserSerializer(read_only=True)
-    updated_by = UserSerializer(read_only=True)
     status_display = serializers.CharField(source="get_status_display", read_only=True)
     payment_status_display = serializers.CharField(source="get_payment_status_display", read_only=True)
 
+    # Связи, которые читает каждое поле (см. setup_eager_loading)
+    SELECT_RELATED = {
+        "client": "client",
+        "carrier": "carrier",
+        "carrier_details": "carrier",
+        "created_by": "created_by",
+    }
+    PREFETCH_RELATED = {"carrier_details": "carrier__contacts"}
+    # Колонки таблицы заказов; полная карточка загружается через retrieve
+    FIELD_PROFILES = {
+        "list": [
+            "id",
+            "client",
+            "carrier",
+            "status",
+            "status_display",
+            "contract_number",
+            "loading_date",
+            "loading_address",
+            "unloading_address",
+            "transport_type",
+            "total_price",
+            "payment_currency",
+            "payment_status",
+            "payment_status_display",
+            "created_at",
+        ],
+    }
+
     class Meta:
         model = Order
         fields = [
@@ -275,11 +309,16 @@ class OrderSerializer(serializers.ModelSerializer):
             "payment_status",
             "updated_at",
             "created_by",
-            "updated_by",
             "status_display",
             "payment_status_display",
         ]
-        read_only_fields = ("created_at", "updated_at", "created_by", "updated_by")
+        read_only_fields = ("created_at", "updated_at", "created_by")
+        # Уникальность номера договора проверяет индекс в БД (см. OrderViewSet.create)
+        extra_kwargs = {"contract_number": {"validators": []}}
+
+    def validate_contract_number(self, value):
+        # Пустой номер храним как NULL: уникальный индекс допускает любое число NULL
+        return value or None
 
     def get_client(self, obj):
         if obj.client:
@@ -324,19 +363,6 @@ class OrderSerializer(serializers.ModelSerializer):
 
         return data
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-
-        # Добавляем информацию о клиенте
-        if instance.client:
-            representation["client"] = {"id": instance.client.id, "company_name": instance.client.company_name}
-
-        # Добавляем информацию о перевозчике
-        if instance.carrier:
-            representation["carrier"] = {"id": instance.carrier.id, "company_name": instance.carrier.company_name}
-
-        return representation
-
 
 class CargoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -405,16 +431,19 @@ class InvoiceSerializer(serializers.ModelSerializer):
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ["id", "message", "notification_type", "sent_at", "is_read", "related_order"]
+        fields = ["id", "message", "notification_type", "sent_at", "is_read"]
 
 
-class CarrierSerializer(serializers.ModelSerializer):
+class CarrierSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     contacts = CarrierContactSerializer(many=True, required=False)
     created_by = UserSerializer(read_only=True)
     created_by_id = serializers.PrimaryKeyRelatedField(
         queryset=CustomUser.objects.all(), source="created_by", write_only=True, required=False, allow_null=True
     )
 
+    SELECT_RELATED = {"created_by": "created_by"}
+    PREFETCH_RELATED = {"contacts": "contacts"}
+
     class Meta:
         model = Carrier
         fields = [
@@ -469,6 +498,8 @@ class CarrierSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        if "contacts" not in self.fields:
+            return representation
 
         # Получаем контакты из базы данных
         contacts = instance.contacts.all()
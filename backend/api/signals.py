@@ -0,0 +1,50 @@
+"""Сигналы моделей приложения api. Подключаются в ApiConfig.ready."""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .finance_cache import invalidate_all, invalidate_days
+from .models import ExchangeRate, Order
+from .rollups import ROLLUP_SOURCE_FIELDS, apply_contribution, order_contribution
+
+
+def _current_values(order: Order):
+    return {field: getattr(order, field) for field in ROLLUP_SOURCE_FIELDS}
+
+
+@receiver(pre_save, sender=Order, dispatch_uid="order_rollup_remember_previous")
+def remember_previous_contribution(sender, instance, raw=False, **kwargs):
+    """Запоминает значения заказа в БД до сохранения, чтобы вычесть их из итогов."""
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._rollup_previous = Order.objects.filter(pk=instance.pk).values(*ROLLUP_SOURCE_FIELDS).first()
+
+
+@receiver(post_save, sender=Order, dispatch_uid="order_rollup_update")
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_rollup_previous", None)
+    current = order_contribution(_current_values(instance))
+    if previous is not None:
+        previous = order_contribution(previous)
+        if previous == current:
+            return
+        apply_contribution(*previous, sign=-1)
+    apply_contribution(*current, sign=1)
+    # Дни, итоги которых изменились: ключ содержит дату первым элементом
+    invalidate_days({current[0][0]} | ({previous[0][0]} if previous is not None else set()))
+
+
+@receiver(post_delete, sender=Order, dispatch_uid="order_rollup_delete")
+def update_rollup_on_delete(sender, instance, **kwargs):
+    contribution = order_contribution(_current_values(instance))
+    apply_contribution(*contribution, sign=-1)
+    invalidate_days({contribution[0][0]})
+
+
+@receiver(post_save, sender=ExchangeRate, dispatch_uid="exchange_rate_invalidate_reports")
+@receiver(post_delete, sender=ExchangeRate, dispatch_uid="exchange_rate_delete_invalidate_reports")
+def invalidate_reports_on_rate_change(sender, **kwargs):
+    invalidate_all()
@@ -0,0 +1,149 @@
+"""Потоковое чтение загруженных таблиц (.xlsx и .csv).
+
+pd.read_excel строит DataFrame из всего файла до первой проверки, и 50 МБ
+книги занимают в памяти гигабайт. SpreadsheetReader читает лист построчно
+(openpyxl read_only / csv.reader) и отдает пачки строк (RowBatch) по
+batch_rows штук, поэтому в памяти одновременно только одна пачка, а ошибки
+первых строк видны до того, как файл прочитан целиком.
+
+Значения ячеек .xlsx сохраняют тип из книги (int, float, datetime, str), в
+.csv все значения - строки. Индекс DataFrame пачки - номер строки в файле
+(строка 1 - заголовки), полностью пустые строки пропускаются.
+"""
+
+import csv
+import io
+import itertools
+import os
+from typing import Iterator, List, Optional
+
+import pandas as pd
+from openpyxl import load_workbook
+
+SPREADSHEET_EXTENSIONS = (".xlsx", ".csv")
+# Сколько байт начала CSV файла смотреть, чтобы определить кодировку и разделитель
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ",;\t"
+
+
+class SpreadsheetError(ValueError):
+    """Файл не удается прочитать как таблицу."""
+
+
+class RowBatch:
+    """Пачка строк файла: DataFrame и сколько строк данных прочитано с начала файла."""
+
+    def __init__(self, frame: pd.DataFrame, end: int):
+        self.frame = frame
+        self.end = end  # контрольная точка: продолжать чтение после этой строки данных
+
+
+def _is_empty(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class SpreadsheetReader:
+    """Построчное чтение первого листа .xlsx или .csv файла.
+
+    ``file`` - бинарный файловый объект (с поддержкой seek), ``name`` -
+    имя файла, по расширению которого выбирается формат.
+    """
+
+    def __init__(self, file, name: str):
+        self.file = file
+        self.extension = os.path.splitext(name or "")[1].lower()
+        if self.extension not in SPREADSHEET_EXTENSIONS:
+            raise SpreadsheetError(f"Поддерживаются только файлы {', '.join(SPREADSHEET_EXTENSIONS)}")
+        self.workbook = None
+        self.text = None
+        self.csv_dialect = None
+        try:
+            if self.extension == ".xlsx":
+                self.workbook = load_workbook(file, read_only=True, data_only=True)
+                self.sheet = self.workbook.worksheets[0]
+            else:
+                self._open_csv()
+            self.header = self._read_header()
+        except SpreadsheetError:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise SpreadsheetError(f"Не удалось прочитать файл: {e}") from e
+
+    def _open_csv(self) -> None:
+        sample = self.file.read(CSV_SNIFF_BYTES)
+        self.file.seek(0)
+        try:
+            sample.decode("utf-8")
+            encoding = "utf-8-sig"
+        except UnicodeDecodeError as e:
+            # Обрыв многобайтового символа на границе образца - это все еще UTF-8
+            encoding = "utf-8-sig" if e.start >= len(sample) - 3 else "cp1251"
+        self.text = io.TextIOWrapper(self.file, encoding=encoding, newline="")
+        sample_text = sample.decode(encoding, errors="ignore")
+        try:
+            self.csv_dialect = csv.Sniffer().sniff(sample_text.split("\n", 1)[0], delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            self.csv_dialect = csv.excel
+
+    def _raw_rows(self, skip: int = 0) -> Iterator[tuple]:
+        """Строки данных после заголовка, начиная с ``skip``-й (с 0)."""
+        if self.workbook is not None:
+            return self.sheet.iter_rows(min_row=2 + skip, max_col=len(self.header), values_only=True)
+        self.text.seek(0)
+        return itertools.islice(csv.reader(self.text, self.csv_dialect), 1 + skip, None)
+
+    def _read_header(self) -> List[str]:
+        if self.workbook is not None:
+            first = next(self.sheet.iter_rows(max_row=1, values_only=True), ())
+        else:
+            self.text.seek(0)
+            first = next(csv.reader(self.text, self.csv_dialect), [])
+        header = [str(title).strip() if not _is_empty(title) else "" for title in first]
+        while header and not header[-1]:
+            header.pop()
+        if not header:
+            raise SpreadsheetError("В первой строке файла нет заголовков колонок")
+        return [title or f"Unnamed: {position}" for position, title in enumerate(header)]
+
+    def count_rows(self) -> Optional[int]:
+        """Число строк данных: для .xlsx - по размеру листа из файла, для CSV - отдельным проходом по файлу."""
+        if self.workbook is not None:
+            max_row = self.sheet.max_row
+            return max(max_row - 1, 0) if max_row else None
+        return sum(1 for _row in self._raw_rows())
+
+    def iter_batches(self, batch_rows: int, skip: int = 0) -> Iterator[RowBatch]:
+        """Пачки по ``batch_rows`` строк данных, начиная со строки данных ``skip`` (с 0)."""
+        width = len(self.header)
+        position = batch_start = skip
+        rows, numbers = [], []
+        for raw in self._raw_rows(skip):
+            position += 1
+            values = list(raw[:width]) + [None] * (width - len(raw))
+            if not all(_is_empty(value) for value in values):
+                rows.append(values)
+                numbers.append(position + 1)  # номер строки в файле: строка 1 - заголовки
+            if position - batch_start >= batch_rows:
+                yield self._batch(rows, numbers, position)
+                rows, numbers, batch_start = [], [], position
+        if position > batch_start:
+            yield self._batch(rows, numbers, position)
+
+    def _batch(self, rows: list, numbers: list, end: int) -> RowBatch:
+        return RowBatch(pd.DataFrame(rows, columns=self.header, index=numbers, dtype=object), end)
+
+    def close(self) -> None:
+        if self.workbook is not None:
+            self.workbook.close()
+        if self.text is not None:
+            # Файл закрывает владелец, TextIOWrapper только отпускает его
+            self.text.detach()
+            self.text = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -8,9 +8,18 @@ from .views import (
     ClientViewSet,
     DocumentViewSet,
     EmailActionView,
+    EmailBulkSendView,
+    EmailMailboxListView,
+    EmailMessageDetailView,
     EmailMessageListView,
+    EmailMessageSearchView,
     EmailMessageSendView,
+    EmailOutboxBatchStatusView,
+    EmailOutboxStatusView,
+    EmailPoolStatsView,
+    FinanceBreakdownView,
     FinanceReportView,
+    ImportJobStatusView,
     InvoiceViewSet,
     NotificationViewSet,
     OrderViewSet,
@@ -51,11 +60,22 @@ urlpatterns = [
     path("validate-token/", validate_token, name="validate-token"),
     path("", include(router.urls)),
     path("finance/report/", FinanceReportView.as_view(), name="finance-report"),
+    path("finance/breakdown/", FinanceBreakdownView.as_view(), name="finance-breakdown"),
     path("orders/<int:pk>/generate-contract/", DocumentViewSet.as_view({"post": "generate_contract"})),
     path("orders/<int:pk>/generate_document/", OrderViewSet.as_view({"post": "generate_document"})),
+    path("imports/<int:pk>/", ImportJobStatusView.as_view(), name="import-job-status"),
     path("system/config/", system_config, name="system-config"),
     path("profile/email-settings/", UserProfileEmailSettingsView.as_view(), name="user-profile-email-settings"),
+    path("email/mailboxes/", EmailMailboxListView.as_view(), name="email-mailboxes"),
     path("email/messages/", EmailMessageListView.as_view(), name="email-messages-list"),
+    path("email/messages/search/", EmailMessageSearchView.as_view(), name="email-message-search"),
+    path("email/messages/<int:uid>/", EmailMessageDetailView.as_view(), name="email-message-detail"),
     path("email/messages/send/", EmailMessageSendView.as_view(), name="email-message-send"),
+    path("email/messages/bulk-send/", EmailBulkSendView.as_view(), name="email-message-bulk-send"),
+    path("email/outbox/<int:pk>/", EmailOutboxStatusView.as_view(), name="email-outbox-status"),
+    path(
+        "email/outbox/batches/<uuid:batch_id>/", EmailOutboxBatchStatusView.as_view(), name="email-outbox-batch-status"
+    ),
     path("email/messages/action/", EmailActionView.as_view(), name="email-message-action"),
+    path("email/pool-stats/", EmailPoolStatsView.as_view(), name="email-pool-stats"),
 ]
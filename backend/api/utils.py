@@ -1,6 +1,26 @@
 import re
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+import pandas as pd
+
+# Коды мобильных операторов Беларуси
+OPERATOR_CODES = ("25", "29", "33", "44")
+
+# Контакты в формате "Имя: X, Телефон: Y, Email: Z" (см. parse_contacts)
+CONTACT_NAME_PATTERN = r"(?:Имя|ФИО|Контактное лицо|Контакт):\s*([^,]+)"
+CONTACT_PHONE_PATTERN = r"(?:Телефон|Тел|Моб|Мобильный|Тел\.|Тел:):\s*([^,]+)"
+CONTACT_EMAIL_PATTERN = r"(?:Email|Почта|E-mail|E-mail:):\s*([^,\s]+)"
+
+# Город в адресе: "г. Минск", "г.Брест", "город Гродно"
+CITY_PREFIX_RE = re.compile(r"(?:^|[\s,])(?:г\.|город\s)\s*([^,;]+)", re.IGNORECASE)
+# Части адреса, которые не являются городом: страна, область, район, улица, дом, индекс
+ADDRESS_NOT_CITY_RE = re.compile(
+    r"^(?:\d[\d\s-]*|беларусь|республика беларусь|рб|россия|российская федерация|рф|польша|литва|латвия|украина|"
+    r"казахстан|германия)$|(?:обл\.?|область|р-н|район|ул\.|улица|пр-т|проспект|пер\.|переулок|д\.|дом|тракт)(?:\s|$)",
+    re.IGNORECASE,
+)
+
 
 def normalize_phone(phone: str) -> Optional[str]:
     """
@@ -61,6 +81,34 @@ def normalize_phone(phone: str) -> Optional[str]:
     return None
 
 
+def normalize_phone_series(phones: pd.Series) -> pd.Series:
+    """Векторная версия normalize_phone для колонки DataFrame.
+
+    Правила те же и в том же порядке; нераспознанные номера становятся None.
+    Числа из Excel (375291234567.0) обрабатываются как строки цифр.
+    """
+    text = phones.astype("string").fillna("").str.replace(r"\.0$", "", regex=True)
+    digits = text.str.replace(r"\D", "", regex=True)
+    digits = digits.where(~digits.str.startswith("80"), "375" + digits.str[2:])
+
+    length = digits.str.len()
+    operator = digits.str[:2].isin(OPERATOR_CODES)
+    conditions = [
+        digits.str.startswith("375"),
+        (length == 9) & operator,
+        (length == 11) & digits.str.startswith("8") & digits.str[1:3].isin(OPERATOR_CODES),
+        digits.str.startswith("7"),
+        (length == 10) & digits.str[:1].isin(("9", "8")),
+        (length == 7) & operator,
+    ]
+    local = "+375" + digits
+    without_prefix = "+375" + digits.str[1:]
+    choices = ["+" + digits, local, without_prefix, without_prefix, local, local]
+    conditions = [condition.fillna(False).to_numpy(dtype=bool) for condition in conditions]
+    choices = [choice.to_numpy(dtype=object) for choice in choices]
+    return pd.Series(np.select(conditions, choices, default=None), index=phones.index, dtype=object)
+
+
 def parse_contacts(contacts_str: str) -> List[Dict[str, str]]:
     """
     Парсит строку с контактами и возвращает список контактов
@@ -83,9 +131,9 @@ def parse_contacts(contacts_str: str) -> List[Dict[str, str]]:
     contacts = []
 
     # Пробуем найти контакты в формате "Имя: X, Телефон: Y, Email: Z"
-    name_match = re.search(r"(?:Имя|ФИО|Контактное лицо|Контакт):\s*([^,]+)", contacts_str, re.IGNORECASE)
-    phone_match = re.search(r"(?:Телефон|Тел|Моб|Мобильный|Тел\.|Тел:):\s*([^,]+)", contacts_str, re.IGNORECASE)
-    email_match = re.search(r"(?:Email|Почта|E-mail|E-mail:):\s*([^,\s]+)", contacts_str, re.IGNORECASE)
+    name_match = re.search(CONTACT_NAME_PATTERN, contacts_str, re.IGNORECASE)
+    phone_match = re.search(CONTACT_PHONE_PATTERN, contacts_str, re.IGNORECASE)
+    email_match = re.search(CONTACT_EMAIL_PATTERN, contacts_str, re.IGNORECASE)
 
     if name_match or phone_match or email_match:
         contact = {}
@@ -177,3 +225,24 @@ def extract_contact_info(text: str) -> Tuple[Optional[str], Optional[str], Optio
     # Берем первый контакт
     contact = contacts[0]
     return (contact.get("name"), contact.get("phone"), contact.get("email"))
+
+
+def extract_city(address: Optional[str]) -> str:
+    """
+    Город из адреса в виде для группировки: "Минск" для "220030, г. Минск, ул. Ленина, 1"
+
+    Берется название после "г."/"город", иначе первая часть адреса через запятую,
+    которая не похожа на индекс, страну, область, район или улицу.
+
+    Returns:
+        Название города или пустая строка, если город не найден
+    """
+    if not address:
+        return ""
+    match = CITY_PREFIX_RE.search(address)
+    if match:
+        city = match.group(1)
+    else:
+        parts = (part.strip() for part in re.split(r"[,;\n]", address))
+        city = next((part for part in parts if part and not ADDRESS_NOT_CITY_RE.search(part)), "")
+    return " ".join(city.split()).title()
@@ -1,28 +1,28 @@
-import csv
 import logging
 import os
-from datetime import datetime, timedelta
-from io import BytesIO
+from datetime import datetime
 from typing import Optional, Tuple
 
-import pandas as pd
-
 # noqa comments for late imports (E402)
 from django.conf import settings  # noqa: E402
 from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.exceptions import ValidationError
 from django.core.files import File
-from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value
-from django.db.models.functions import Coalesce, TruncDate
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
 from django.http import HttpResponse
 from django.middleware.csrf import get_token
+from django.shortcuts import get_object_or_404
 from django.utils.deprecation import MiddlewareMixin
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_GET
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import generics, permissions, status, viewsets
+from rest_framework import generics, permissions, serializers, status, viewsets
 from rest_framework.authentication import SessionAuthentication  # noqa: E402
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from rest_framework.filters import SearchFilter
 
 # from docxtpl import DocxTemplate
@@ -32,6 +32,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .authentication import CustomTokenAuthentication
+from .duplicates import DuplicateIndex
 from .email_service import (  # noqa: F401
     ERR_TYPE_AUTHENTICATION,  # Импортируем типы ошибок
     ERR_TYPE_CONFIG,
@@ -39,24 +40,53 @@ from .email_service import (  # noqa: F401
     ERR_TYPE_MAILBOX,
     ERR_TYPE_OPERATION,
     ERR_TYPE_UNKNOWN,
+    _get_user_credentials,
     delete_email,
+    fetch_email_message,
     fetch_emails,
+    get_imap_pool_stats,
+    get_smtp_pool_stats,
+    invalidate_mail_caches,
     list_mailboxes,
     send_email,
     set_email_flags,
 )
+from .exports import (
+    CARRIER_EXPORT_COLUMNS,
+    CLIENT_EXPORT_COLUMNS,
+    FINANCE_DAILY_EXPORT_COLUMNS,
+    ORDER_EXPORT_COLUMNS,
+    ORDER_EXPORT_DEFAULT_COLUMNS,
+    rows_xlsx_response,
+    select_columns,
+    stream_csv,
+    xlsx_response,
+)
+from .finance import (
+    BREAKDOWN_DEFAULT_LIMIT,
+    BREAKDOWN_GROUPS,
+    BREAKDOWN_MAX_LIMIT,
+    cached_finance_report,
+    finance_breakdown,
+)
+from .fx import ExchangeRateMissing
+from .import_jobs import enqueue_import, job_status, validate_upload
+from .importers import CARRIER_IMPORT, CLIENT_IMPORT
+from .mail_search import search_messages, select_uids
+from .mail_sync import DEFAULT_ORDERING
+from .mixins import SparseFieldsViewSetMixin
 from .models import (
     CalendarTask,
     Cargo,
     Carrier,
-    CarrierContact,
     Client,
-    ClientContact,
     CustomUser,
     Document,
+    ImportJob,
     Invoice,
     Notification,
     Order,
+    OutgoingEmail,
     Payment,
     TableHighlight,
     Task,
@@ -64,6 +94,8 @@ from .models import (
     UserSettings,
     Vehicle,
 )
+from .outbox import enqueue_bulk, enqueue_email
+from .pagination import KeysetPagination, NotificationKeysetPagination
 from .permissions import IsAdmin, IsAdminOrManager, IsManager
 from .serializers import (
     CalendarTaskSerializer,
@@ -85,7 +117,6 @@ from .serializers import (
     VehicleSerializer,
 )
 from .services.document_generator import generate_document
-from .utils import extract_contact_info
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -124,9 +155,25 @@ def csrf_token(request):
     return Response({"csrfToken": token})
 
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.select_related("client")
+DUPLICATE_CONTRACT_MESSAGE = "Договор с таким номером уже существует"
+
+
+def _is_duplicate_contract(serializer) -> bool:
+    """IntegrityError при сохранении заказа вызван повтором номера договора, а не другим ограничением."""
+    instance = serializer.instance
+    number = serializer.validated_data.get("contract_number", getattr(instance, "contract_number", None))
+    if not number:
+        return False
+    orders = Order.objects.filter(contract_number=number)
+    if instance is not None:
+        orders = orders.exclude(pk=instance.pk)
+    return orders.exists()
+
+
+class OrderViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter]
     filterset_fields = ["status", "transport_type", "client__id", "loading_date", "created_by"]
@@ -146,30 +193,44 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def create(self, request):
         try:
-            contract_number = request.data.get("contract_number")
-            if contract_number and Order.objects.filter(contract_number=contract_number).exists():
-                return Response({"error": "Договор с таким номером уже существует"}, status=status.HTTP_400_BAD_REQUEST)
-
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save(created_by=request.user)
+            # Повтор номера договора ловит уникальный индекс, причину ошибки проверяем только после отказа
+            try:
+                with transaction.atomic():
+                    serializer.save(created_by=request.user)
+            except IntegrityError:
+                if not _is_duplicate_contract(serializer):
+                    raise
+                return Response({"error": DUPLICATE_CONTRACT_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Exception as e:
             logger.error(f"Ошибка при создании заказа: {str(e)}")
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    def perform_update(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            if not _is_duplicate_contract(serializer):
+                raise
+            raise DRFValidationError({"error": DUPLICATE_CONTRACT_MESSAGE})
+
     @action(detail=False, methods=["get"])
     def export_orders_csv(self, request):
-        orders = Order.objects.all()
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = 'attachment; filename="orders.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(["Contract Number", "Status", "Client Email", "Total Price"])
-        for order in orders:
-            writer.writerow([order.contract_number, order.status, order.client.user.email, order.total_price])
-        return response
+        """Потоковая CSV выгрузка заказов с теми же фильтрами, что и список; набор колонок - ?columns=."""
+        keys = select_columns(ORDER_EXPORT_COLUMNS, request.query_params.get("columns"), ORDER_EXPORT_DEFAULT_COLUMNS)
+        orders = self.filter_queryset(self.get_queryset())
+        return stream_csv(orders, ORDER_EXPORT_COLUMNS, keys, "orders.csv")
+
+    @action(detail=False, methods=["get"])
+    def export_orders_excel(self, request):
+        """Excel выгрузка заказов: те же фильтры и ?columns=, что у CSV."""
+        keys = select_columns(ORDER_EXPORT_COLUMNS, request.query_params.get("columns"), ORDER_EXPORT_DEFAULT_COLUMNS)
+        orders = self.filter_queryset(self.get_queryset())
+        return xlsx_response(orders, ORDER_EXPORT_COLUMNS, keys, "Заказы", "orders.xlsx")
 
     @action(detail=True, methods=["post"])
     def generate_document(self, request, pk=None):
@@ -202,14 +263,17 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_permissions(self):
         if self.action in ["create", "update", "partial_update", "destroy"]:
             return [IsAdminOrManager()]
+        if self.action == "possible_duplicates":
+            return [IsAdmin()]
         return [permissions.IsAuthenticated()]
 
     def get_queryset(self):
@@ -252,36 +316,13 @@ class ClientViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def export_excel(self, request):
         try:
-            clients = self.get_queryset()
-            data = []
-            for client in clients:
-                data.append(
-                    {
-                        "ID": client.id,
-                        "Наименование компании": client.company_name,
-                        "Сфера деятельности": client.business_scope,
-                        "Адрес": client.address,
-                        "Банковские реквизиты": client.bank_details,
-                        "УНП": client.unp,
-                        "УНН": client.unn,
-                        "ОКПО": client.okpo,
-                        "Комментарии": client.comments,
-                        "Дата создания": client.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                        "Дата обновления": client.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    }
-                )
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                df.to_excel(writer, index=False, sheet_name="Клиенты")
-
-            output.seek(0)
-            response = HttpResponse(
-                output.getvalue(), content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            keys = select_columns(
+                CLIENT_EXPORT_COLUMNS, request.query_params.get("columns"), list(CLIENT_EXPORT_COLUMNS)
             )
-            response["Content-Disposition"] = "attachment; filename=clients.xlsx"
-            return response
+            clients = self.get_queryset()
+            return xlsx_response(clients, CLIENT_EXPORT_COLUMNS, keys, "Клиенты", "clients.xlsx")
+        except DRFValidationError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при экспорте клиентов в Excel: {str(e)}")
             return Response({"error": str(e)}, status=500)
@@ -292,79 +333,23 @@ class ClientViewSet(viewsets.ModelViewSet):
             return Response({"error": "Файл не найден"}, status=400)
 
         file = request.FILES["file"]
-        if not file.name.endswith(".xlsx"):
-            return Response({"error": "Поддерживаются только файлы .xlsx"}, status=400)
-
-        try:
-            df = pd.read_excel(file)
-
-            # Логируем содержимое файла
-            logger.info(f"Содержимое файла {file.name}:")
-            logger.info(f"Колонки: {df.columns.tolist()}")
-            logger.info(f"Первые 5 строк:\n{df.head().to_string()}")
-
-            # Маппинг колонок Excel в поля модели
-            column_mapping = {
-                "Наименование компании": "company_name",
-                "Сфера деятельности": "business_scope",
-                "Контакты": "contact_info",
-                "Менеджер": "manager_name",
-                "Комментарии": "comments",
-            }
+        error = validate_upload(ImportJob.Kinds.CLIENTS, file)
+        if error:
+            return Response({"error": error}, status=400)
 
-            # Логируем маппинг
-            logger.info(f"Маппинг колонок: {column_mapping}")
+        on_duplicate = request.data.get("on_duplicate", ImportJob.OnDuplicate.SKIP)
+        if on_duplicate not in ImportJob.OnDuplicate.values:
+            return Response({"error": f"on_duplicate: допустимо {', '.join(ImportJob.OnDuplicate.values)}"}, status=400)
 
-            # Переименовываем колонки
-            df = df.rename(columns=column_mapping)
+        # Файл только сохраняется, импорт выполняет воркер import_worker; ход - GET /imports/<id>/
+        job = enqueue_import(request.user, ImportJob.Kinds.CLIENTS, file, on_duplicate)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
 
-            # Логируем переименованные колонки
-            logger.info(f"Переименованные колонки: {df.columns.tolist()}")
-
-            # Обрабатываем каждую строку
-            for idx, row in df.iterrows():
-                # Логируем данные строки
-                logger.info(f"Обработка строки {idx + 2}:")
-                logger.info(f"Данные: {row.to_dict()}")
-
-                # Создаем или обновляем клиента
-                client_data = {
-                    "company_name": row.get("company_name", ""),
-                    "business_scope": row.get("business_scope", ""),
-                    "comments": row.get("comments", ""),
-                }
-
-                # Очищаем данные от NaN
-                client_data = {k: v if pd.notna(v) else "" for k, v in client_data.items()}
-
-                # Логируем данные для создания клиента
-                logger.info(f"Данные для создания клиента: {client_data}")
-
-                # Создаем клиента
-                client = Client.objects.create(**client_data)
-
-                # Обрабатываем контактную информацию
-                contact_info = row.get("contact_info", "")
-                manager_name = row.get("manager_name", "")
-
-                if pd.notna(contact_info):
-                    # Парсим контактную информацию
-                    name, phone, email = extract_contact_info(contact_info)
-
-                    # Если есть имя менеджера, используем его
-                    if pd.notna(manager_name):
-                        name = manager_name
-
-                    if name or phone or email:
-                        ClientContact.objects.create(
-                            client=client, name=name or "", phone=phone or "", email=email or "", contact_type="manager"
-                        )
-
-            return Response({"message": "Импорт успешно завершен"})
-
-        except Exception as e:
-            logger.error(f"Ошибка при импорте: {str(e)}")
-            return Response({"error": str(e)}, status=400)
+    @action(detail=False, methods=["get"], permission_classes=[IsAdmin])
+    def possible_duplicates(self, request):
+        """Группы клиентов, похожих на одну компанию: совпадают коды, контакты или наименования."""
+        groups = DuplicateIndex.build(CLIENT_IMPORT).possible_duplicates()
+        return Response({"count": len(groups), "results": groups})
 
 
 class PaymentPagination(PageNumberPagination):
@@ -587,6 +572,20 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response(InvoiceSerializer(invoice).data, status=201)
 
 
+def _parse_report_period(query_params):
+    """(start, end) из ?start_date=&end_date= (YYYY-MM-DD) или Response с ошибкой 400."""
+    start_date = query_params.get("start_date")
+    end_date = query_params.get("end_date")
+
+    if not start_date or not end_date:
+        return Response({"error": "start_date and end_date are required"}, status=400)
+
+    try:
+        return datetime.strptime(start_date, "%Y-%m-%d").date(), datetime.strptime(end_date, "%Y-%m-%d").date()
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+
+
 class FinanceReportView(APIView):
     """Возвращает расширенный финансовый отчёт за произвольный период.
 
@@ -600,141 +599,89 @@ class FinanceReportView(APIView):
         "average_order_trend": 5.1,
         "profit": 15000,
         "profit_trend": 9.4,
-        "daily_stats": [ { … }, … ]
+        "daily_stats": [ { … }, … ],
+        "currency": "RUB"
     }
+
+    Суммы переводятся в валюту ?currency= (по умолчанию FINANCE_DEFAULT_CURRENCY)
+    по курсам ExchangeRate; если курса не хватает, возвращается 400. Отчеты
+    кэшируются до изменения заказов за их дни (api/finance_cache.py).
+    ?export=xlsx отдает статистику по дням Excel файлом.
     """
 
     permission_classes = [IsAuthenticated, IsAdminOrManager]
     authentication_classes = [CustomTokenAuthentication, SessionAuthentication]
 
-    def _percent_change(self, current, previous):
-        if previous in (None, 0):
-            return 0
-        return round(((current - previous) / previous) * 100, 2)
-
     def get(self, request):
-        start_date = request.query_params.get("start_date")
-        end_date = request.query_params.get("end_date")
-
-        if not start_date or not end_date:
-            return Response({"error": "start_date and end_date are required"}, status=400)
-
+        period = _parse_report_period(request.query_params)
+        if isinstance(period, Response):
+            return period
+        start, end = period
+
+        # Текущий и предыдущий период и статистика по дням - один запрос (и один запрос курсов)
+        # Admin и manager видят отчет по всем заказам, роль - область видимости в ключе кэша
+        currency = request.query_params.get("currency")
         try:
-            start = datetime.strptime(start_date, "%Y-%m-%d")
-            end = datetime.strptime(end_date, "%Y-%m-%d")
-        except ValueError:
-            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+            report = cached_finance_report(start, end, currency, scope=request.user.role)
+        except ExchangeRateMissing as e:
+            return Response({"error": str(e)}, status=400)
+        if request.query_params.get("export") == "xlsx":
+            rows = ([day[key] for key in FINANCE_DAILY_EXPORT_COLUMNS] for day in report["daily_stats"])
+            header = [
+                f"{title} ({report['currency']})" if money else title
+                for title, money in FINANCE_DAILY_EXPORT_COLUMNS.values()
+            ]
+            return rows_xlsx_response(header, rows, "Финансы", f"finance_{start}_{end}.xlsx")
+        return Response(report)
 
-        # Текущий период
-        orders = Order.objects.filter(created_at__date__range=(start, end))
 
-        zero_decimal = Value(0, output_field=DecimalField(max_digits=12, decimal_places=2))
-        revenue_agg = orders.aggregate(
-            total_revenue=Coalesce(
-                Sum("total_price"), zero_decimal, output_field=DecimalField(max_digits=12, decimal_places=2)
-            )
-        )
-        total_revenue = revenue_agg["total_revenue"]
-
-        total_orders = orders.count()
-
-        profit_agg = orders.aggregate(
-            total_profit=Coalesce(
-                Sum(
-                    ExpressionWrapper(
-                        Coalesce(F("client_rate"), F("total_price"), zero_decimal)
-                        - Coalesce(F("carrier_rate"), zero_decimal),
-                        output_field=DecimalField(max_digits=12, decimal_places=2),
-                    )
-                ),
-                zero_decimal,
-            )
-        )
-        profit = profit_agg["total_profit"] or 0
-
-        average_order_value = round(total_revenue / total_orders, 2) if total_orders else 0
-
-        # Предыдущий период такой же длительности
-        period_delta = end - start
-        prev_start = start - period_delta - timedelta(days=1)
-        prev_end = start - timedelta(days=1)
-
-        prev_orders = Order.objects.filter(created_at__date__range=(prev_start, prev_end))
-        prev_revenue = prev_orders.aggregate(
-            total=Coalesce(Sum("total_price"), zero_decimal, output_field=DecimalField(max_digits=12, decimal_places=2))
-        )["total"]
-        prev_total_orders = prev_orders.count()
-        prev_average_order = round(prev_revenue / prev_total_orders, 2) if prev_total_orders else 0
-        prev_profit = (
-            prev_orders.aggregate(
-                total_profit=Coalesce(
-                    Sum(
-                        ExpressionWrapper(
-                            Coalesce(F("client_rate"), F("total_price"), zero_decimal)
-                            - Coalesce(F("carrier_rate"), zero_decimal),
-                            output_field=DecimalField(max_digits=12, decimal_places=2),
-                        )
-                    ),
-                    zero_decimal,
-                )
-            )["total_profit"]
-            or 0
-        )
+class FinanceBreakdownView(APIView):
+    """Выручка, прибыль, маржа (%) и число заказов за период по группам.
 
-        # Ежедневная статистика
-        daily_qs = (
-            orders.annotate(date=TruncDate("created_at"))
-            .values("date")
-            .annotate(
-                revenue=Coalesce(
-                    Sum("total_price"), zero_decimal, output_field=DecimalField(max_digits=12, decimal_places=2)
-                ),
-                orders=Count("id"),
-                profit=Coalesce(
-                    Sum(
-                        ExpressionWrapper(
-                            Coalesce(F("client_rate"), F("total_price"), zero_decimal)
-                            - Coalesce(F("carrier_rate"), zero_decimal),
-                            output_field=DecimalField(max_digits=12, decimal_places=2),
-                        )
-                    ),
-                    zero_decimal,
-                ),
-            )
-            .order_by("date")
-        )
+    ?group_by=client|carrier|transport_type|route (маршрут - город загрузки → город выгрузки),
+    ?limit=N групп с наибольшей выручкой (остальные - в "other"), ?currency= - как в FinanceReportView:
+    {
+        "start_date": "2025-03-01",
+        "end_date": "2025-03-31",
+        "group_by": "client",
+        "currency": "RUB",
+        "items": [{"key": 5, "label": "ООО Ромашка", "orders": 12, "revenue": 150000.0, "profit": 30000.0,
+                   "margin": 20.0}, …],
+        "other": {"groups": 40, "orders": 60, "revenue": …, "profit": …, "margin": …} или null,
+        "total": {"orders": 72, "revenue": …, "profit": …, "margin": …}
+    }
+    """
 
-        daily_stats = []
-        for row in daily_qs:
-            avg_val = round(row["revenue"] / row["orders"], 2) if row["orders"] else 0
-            daily_stats.append(
-                {
-                    "date": row["date"].isoformat(),
-                    "revenue": float(row["revenue"]),
-                    "orders": row["orders"],
-                    "average_order_value": avg_val,
-                    "profit": float(row["profit"]),
-                }
-            )
+    permission_classes = [IsAuthenticated, IsAdminOrManager]
+    authentication_classes = [CustomTokenAuthentication, SessionAuthentication]
 
-        response = {
-            "total_revenue": float(total_revenue),
-            "revenue_trend": self._percent_change(total_revenue, prev_revenue),
-            "total_orders": total_orders,
-            "orders_trend": self._percent_change(total_orders, prev_total_orders),
-            "average_order_value": average_order_value,
-            "average_order_trend": self._percent_change(average_order_value, prev_average_order),
-            "profit": float(profit),
-            "profit_trend": self._percent_change(profit, prev_profit),
-            "daily_stats": daily_stats,
-        }
+    def get(self, request):
+        period = _parse_report_period(request.query_params)
+        if isinstance(period, Response):
+            return period
+        start, end = period
+
+        group_by = request.query_params.get("group_by", "client")
+        if group_by not in BREAKDOWN_GROUPS:
+            return Response({"error": f"group_by must be one of: {', '.join(BREAKDOWN_GROUPS)}"}, status=400)
+        try:
+            limit = int(request.query_params.get("limit", BREAKDOWN_DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+        if not 1 <= limit <= BREAKDOWN_MAX_LIMIT:
+            return Response({"error": f"limit must be between 1 and {BREAKDOWN_MAX_LIMIT}"}, status=400)
 
-        return Response(response)
+        try:
+            report = finance_breakdown(start, end, group_by, limit, request.query_params.get("currency"))
+        except ExchangeRateMissing as e:
+            return Response({"error": str(e)}, status=400)
+        return Response({"start_date": start.isoformat(), "end_date": end.isoformat(), **report})
 
 
 class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
+    pagination_class = NotificationKeysetPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -812,9 +759,10 @@ class CurrentUserView(APIView):
         return Response(serializer.data)
 
 
-class CarrierViewSet(viewsets.ModelViewSet):
+class CarrierViewSet(SparseFieldsViewSetMixin, viewsets.ModelViewSet):
     queryset = Carrier.objects.all()
     serializer_class = CarrierSerializer
+    pagination_class = KeysetPagination
     permission_classes = [IsAuthenticated, IsAdminOrManager]
     filter_backends = [DjangoFilterBackend, SearchFilter]
     search_fields = ["company_name", "working_directions", "location", "manager_name", "director_name"]
@@ -841,7 +789,11 @@ class CarrierViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         logger.info("Вызов метода list")
-        queryset = self.get_queryset()
+        queryset = self.sparse_queryset(self.get_queryset())
+        # Список перевозчиков отдается целиком; постранично - только по запросу с ?cursor=
+        if self.paginator.keyset_requested(request):
+            page = self.paginate_queryset(queryset)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         logger.info(f"Количество записей в queryset: {queryset.count()}")
         serializer = self.get_serializer(queryset, many=True)
         logger.info(f"Данные для отправки: {serializer.data}")
@@ -850,35 +802,13 @@ class CarrierViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=["get"])
     def export_excel(self, request):
         try:
-            carriers = self.get_queryset()
-            data = []
-            for carrier in carriers:
-                data.append(
-                    {
-                        "ID": carrier.id,
-                        "Наименование компании": carrier.company_name,
-                        "Направления работы": carrier.working_directions,
-                        "Местоположение": carrier.location,
-                        "Парк": carrier.fleet,
-                        "Комментарии": carrier.comments,
-                        "Известные тарифы": carrier.known_rates,
-                        "Количество ТС": carrier.vehicle_number,
-                        "Дата создания": carrier.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                        "Дата обновления": carrier.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    }
-                )
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                df.to_excel(writer, index=False, sheet_name="Перевозчики")
-
-            output.seek(0)
-            response = HttpResponse(
-                output.getvalue(), content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            keys = select_columns(
+                CARRIER_EXPORT_COLUMNS, request.query_params.get("columns"), list(CARRIER_EXPORT_COLUMNS)
             )
-            response["Content-Disposition"] = "attachment; filename=carriers.xlsx"
-            return response
+            carriers = self.get_queryset()
+            return xlsx_response(carriers, CARRIER_EXPORT_COLUMNS, keys, "Перевозчики", "carriers.xlsx")
+        except DRFValidationError:
+            raise
         except Exception as e:
             logger.error(f"Ошибка при экспорте перевозчиков в Excel: {str(e)}")
             return Response({"error": str(e)}, status=500)
@@ -889,89 +819,23 @@ class CarrierViewSet(viewsets.ModelViewSet):
             return Response({"error": "Файл не найден"}, status=400)
 
         file = request.FILES["file"]
-        if not file.name.endswith(".xlsx"):
-            return Response({"error": "Поддерживаются только файлы .xlsx"}, status=400)
-
-        try:
-            df = pd.read_excel(file)
-
-            # Логируем содержимое файла
-            logger.info(f"Содержимое файла {file.name}:")
-            logger.info(f"Колонки: {df.columns.tolist()}")
-            logger.info(f"Первые 5 строк:\n{df.head().to_string()}")
-
-            # Маппинг колонок Excel в поля модели
-            column_mapping = {
-                "Наименование ": "company_name",
-                "Направления": "working_directions",
-                "Расположение/Местоположение": "location",
-                "Парк": "fleet",
-                "Контактная информация": "contact_info",
-                "Менеджер": "manager_name",
-                "comments": "comments",
-                "Известные тарифы": "known_rates",
-            }
-
-            # Логируем маппинг
-            logger.info(f"Маппинг колонок: {column_mapping}")
-
-            # Переименовываем колонки
-            df = df.rename(columns=column_mapping)
-
-            # Логируем переименованные колонки
-            logger.info(f"Переименованные колонки: {df.columns.tolist()}")
-
-            # Обрабатываем каждую строку
-            for idx, row in df.iterrows():
-                # Логируем данные строки
-                logger.info(f"Обработка строки {idx + 2}:")
-                logger.info(f"Данные: {row.to_dict()}")
-
-                # Создаем или обновляем перевозчика
-                carrier_data = {
-                    "company_name": row.get("company_name", ""),
-                    "working_directions": row.get("working_directions", ""),
-                    "location": row.get("location", ""),
-                    "fleet": row.get("fleet", ""),
-                    "comments": row.get("comments", ""),
-                    "known_rates": row.get("known_rates", ""),
-                }
-
-                # Очищаем данные от NaN
-                carrier_data = {k: v if pd.notna(v) else "" for k, v in carrier_data.items()}
+        error = validate_upload(ImportJob.Kinds.CARRIERS, file)
+        if error:
+            return Response({"error": error}, status=400)
 
-                # Логируем данные для создания перевозчика
-                logger.info(f"Данные для создания перевозчика: {carrier_data}")
+        on_duplicate = request.data.get("on_duplicate", ImportJob.OnDuplicate.SKIP)
+        if on_duplicate not in ImportJob.OnDuplicate.values:
+            return Response({"error": f"on_duplicate: допустимо {', '.join(ImportJob.OnDuplicate.values)}"}, status=400)
 
-                # Создаем перевозчика и привязываем к текущему пользователю, чтобы он был виден в его списке
-                carrier = Carrier.objects.create(**carrier_data, created_by=request.user)
+        # Файл только сохраняется, импорт выполняет воркер import_worker; ход - GET /imports/<id>/
+        job = enqueue_import(request.user, ImportJob.Kinds.CARRIERS, file, on_duplicate)
+        return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
 
-                # Обрабатываем контактную информацию
-                contact_info = row.get("contact_info", "")
-                manager_name = row.get("manager_name", "")
-
-                if pd.notna(contact_info):
-                    # Парсим контактную информацию
-                    name, phone, email = extract_contact_info(contact_info)
-
-                    # Если есть имя менеджера, используем его
-                    if pd.notna(manager_name):
-                        name = manager_name
-
-                    if name or phone or email:
-                        CarrierContact.objects.create(
-                            carrier=carrier,
-                            name=name or "",
-                            phone=phone or "",
-                            email=email or "",
-                            contact_type="manager",
-                        )
-
-            return Response({"message": "Импорт успешно завершен"})
-
-        except Exception as e:
-            logger.error(f"Ошибка при импорте: {str(e)}")
-            return Response({"error": str(e)}, status=400)
+    @action(detail=False, methods=["get"], permission_classes=[IsAdmin])
+    def possible_duplicates(self, request):
+        """Группы перевозчиков, похожих на одну компанию: совпадают коды, контакты или наименования."""
+        groups = DuplicateIndex.build(CARRIER_IMPORT).possible_duplicates()
+        return Response({"count": len(groups), "results": groups})
 
 
 class UserSettingsViewSet(viewsets.ModelViewSet):
@@ -1066,6 +930,11 @@ class UserProfileEmailSettingsView(generics.RetrieveUpdateAPIView):
         profile, created = UserProfile.objects.get_or_create(user=self.request.user)
         return profile
 
+    def perform_update(self, serializer):
+        profile = serializer.save()
+        # Новые пароли/серверы должны применяться сразу, а не по истечении TTL кэша
+        invalidate_mail_caches(profile.user)
+
 
 def _get_error_response(error_info: Optional[Tuple[str, str]]) -> Response:
     """Формирует Response с нужным статусом на основе типа ошибки."""
@@ -1100,6 +969,9 @@ class EmailMessageListView(APIView):
             mailbox = request.GET.get("mailbox", "INBOX")
             limit = int(request.GET.get("limit", 25))
             offset = int(request.GET.get("offset", 0))
+            ordering = request.GET.get("ordering", DEFAULT_ORDERING)
+            # refresh=1 - принудительно сходить на сервер, даже если кэш папки свежий
+            refresh = request.GET.get("refresh") in ("1", "true")
 
             # Получаем email пользователя
             user_email = request.user.email
@@ -1111,7 +983,7 @@ class EmailMessageListView(APIView):
             logger.info(
                 f"Вызов fetch_emails для {user_email} с параметрами: mailbox={mailbox}, limit={limit}, offset={offset}"
             )
-            result = fetch_emails(user_email, mailbox, limit, offset)
+            result = fetch_emails(user_email, mailbox, limit, offset, ordering=ordering, refresh=refresh)
 
             # Если результат содержит ошибку
             if isinstance(result, tuple) and len(result) == 2:
@@ -1129,8 +1001,7 @@ class EmailMessageListView(APIView):
                 logger.debug(f"- Subject: {first_email.get('subject')}")
                 logger.debug(f"- From: {first_email.get('from')}")
                 logger.debug(f"- Date: {first_email.get('date')}")
-                logger.debug(f"- Body length: {len(first_email.get('body', ''))}")
-                logger.debug(f"- Is HTML: {first_email.get('is_html')}")
+                logger.debug(f"- Size: {first_email.get('size')}")
                 logger.debug(f"- Mailbox: {first_email.get('mailbox')}")
 
             # Если результат успешный
@@ -1141,6 +1012,65 @@ class EmailMessageListView(APIView):
             return Response({"error": "Внутренняя ошибка сервера"}, status=500)
 
 
+class EmailMailboxListView(APIView):
+    """Список папок пользователя (с признаками SPECIAL-USE) для боковой панели почты."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        refresh = request.GET.get("refresh") in ("1", "true")
+        mailboxes, error_info = list_mailboxes(request.user, refresh=refresh)
+        if error_info:
+            return _get_error_response(error_info)
+        return Response({"mailboxes": mailboxes})
+
+
+class EmailMessageSearchView(APIView):
+    """Поиск по локальному индексу синхронизированных писем (без обращения к почтовому серверу)."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = request.GET.get("q", "").strip()
+        if not query:
+            return Response({"error": "Параметр 'q' обязателен."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.GET.get("limit", 25))
+            offset = int(request.GET.get("offset", 0))
+        except ValueError:
+            return Response({"error": "Некорректные параметры пагинации."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = search_messages(
+            request.user.profile, query, mailbox=request.GET.get("mailbox"), limit=limit, offset=offset
+        )
+        return Response(result)
+
+
+class EmailMessageDetailView(APIView):
+    """Полное содержимое письма по UID (тело загружается только при открытии письма)."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, uid):
+        mailbox = request.GET.get("mailbox", "INBOX")
+        logger.info(f"API GET /email/messages/{uid}/ вызван для {request.user.email}, mailbox: {mailbox}")
+        message, error_info = fetch_email_message(request.user, uid, mailbox)
+        if error_info:
+            return _get_error_response(error_info)
+        return Response(message)
+
+
+INVALID_DOCUMENTS_MESSAGE = "Некорректные ID документов"
+
+
+def _parse_document_ids(values) -> Optional[list]:
+    """ID документов для вложений из запроса; None - среди них есть не целые положительные числа."""
+    try:
+        return serializers.ListField(child=serializers.IntegerField(min_value=1)).run_validation(values)
+    except DRFValidationError:
+        return None
+
+
 class EmailMessageSendView(APIView):
     """Представление для отправки письма от имени текущего пользователя."""
 
@@ -1151,24 +1081,151 @@ class EmailMessageSendView(APIView):
         to_email = request.data.get("to")
         subject = request.data.get("subject")
         content = request.data.get("content")
-        documents = request.data.getlist("documents[]")  # Получаем список ID документов
+        documents = _parse_document_ids(request.data.getlist("documents[]"))  # Получаем список ID документов
 
         if not all([to_email, subject, content]):
             return Response(
                 {"error": "Поля 'to', 'subject', 'content' обязательны."}, status=status.HTTP_400_BAD_REQUEST
             )
+        if documents is None:
+            return Response({"error": INVALID_DOCUMENTS_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Настройки проверяем сразу, чтобы не ставить в очередь заведомо неотправляемое письмо
+        _, error_info = _get_user_credentials(user)
+        if error_info:
+            return _get_error_response(error_info)
 
-        logger.info(f"Попытка отправки письма от {user.email} к {to_email} с {len(documents)} документами")
+        logger.info(f"Постановка в очередь письма от {user.email} к {to_email} с {len(documents)} документами")
+        outgoing = enqueue_email(user, to=to_email, subject=subject, body=content, documents=documents)
+        return Response(
+            {"id": outgoing.id, "status": outgoing.status, "message": "Письмо поставлено в очередь на отправку."},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        # Возвращаем прямой синхронный вызов
-        success, error_info = send_email(user, to=to_email, subject=subject, body=content, documents=documents)
 
-        # Возвращаем старую логику ответа
-        if success:
-            return Response({"message": "Письмо успешно отправлено."}, status=status.HTTP_200_OK)
+def _parse_recipients(value) -> list:
+    """Список получателей из JSON списка или строки через запятую/точку с запятой, без повторов."""
+    if isinstance(value, str):
+        value = value.replace(";", ",").split(",")
+    recipients = []
+    for item in value or []:
+        address = str(item).strip()
+        if address and address not in recipients:
+            recipients.append(address)
+    return recipients
+
+
+class EmailBulkSendView(APIView):
+    """Рассылка одного письма (с документами) списку получателей через очередь исходящих.
+
+    Письма отправителя уходят последовательно через одну SMTP сессию (см. outbox).
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        user = request.user
+        if hasattr(request.data, "getlist"):
+            recipients = _parse_recipients(request.data.getlist("recipients[]") or request.data.get("recipients"))
+            documents = request.data.getlist("documents[]")
         else:
+            recipients = _parse_recipients(request.data.get("recipients"))
+            documents = request.data.get("documents") or []
+        documents = _parse_document_ids(documents)
+        subject = request.data.get("subject")
+        content = request.data.get("content")
+
+        if not all([recipients, subject, content]):
+            return Response(
+                {"error": "Поля 'recipients', 'subject', 'content' обязательны."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if documents is None:
+            return Response({"error": INVALID_DOCUMENTS_MESSAGE}, status=status.HTTP_400_BAD_REQUEST)
+        if len(recipients) > settings.OUTBOX_BULK_MAX_RECIPIENTS:
+            return Response(
+                {"error": f"Слишком много получателей (максимум {settings.OUTBOX_BULK_MAX_RECIPIENTS})."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        invalid = []
+        for address in recipients:
+            try:
+                validate_email(address)
+            except ValidationError:
+                invalid.append(address)
+        if invalid:
+            return Response(
+                {"error": "Некорректные адреса получателей.", "invalid": invalid}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        _, error_info = _get_user_credentials(user)
+        if error_info:
             return _get_error_response(error_info)
 
+        logger.info(f"Рассылка от {user.email}: {len(recipients)} получателей, {len(documents)} документов")
+        batch_id, outgoing = enqueue_bulk(user, recipients, subject=subject, body=content, documents=documents)
+        return Response(
+            {
+                "batch_id": batch_id,
+                "ids": [item.id for item in outgoing],
+                "count": len(outgoing),
+                "message": "Рассылка поставлена в очередь на отправку.",
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class EmailOutboxBatchStatusView(APIView):
+    """Сводка по рассылке: сколько писем в каждом статусе."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, batch_id):
+        queryset = OutgoingEmail.objects.filter(batch_id=batch_id, user=request.user)
+        counts = dict(queryset.values_list("status").annotate(count=Count("id")).order_by())
+        if not counts:
+            return Response({"error": "Рассылка не найдена."}, status=status.HTTP_404_NOT_FOUND)
+        failed = queryset.filter(status=OutgoingEmail.Statuses.FAILED).values("id", "to_email", "last_error")
+        return Response(
+            {
+                "batch_id": batch_id,
+                "total": sum(counts.values()),
+                "statuses": {choice: counts.get(choice, 0) for choice in OutgoingEmail.Statuses.values},
+                "failed": list(failed),
+            }
+        )
+
+
+class ImportJobStatusView(APIView):
+    """Ход фонового импорта файла: обработано строк, ошибки и оставшееся время."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk, user=request.user)
+        return Response(job_status(job))
+
+
+class EmailOutboxStatusView(APIView):
+    """Статус доставки письма из очереди исходящих."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        outgoing = get_object_or_404(OutgoingEmail, pk=pk, user=request.user)
+        return Response(
+            {
+                "id": outgoing.id,
+                "to": outgoing.to_email,
+                "subject": outgoing.subject,
+                "status": outgoing.status,
+                "attempts": outgoing.attempts,
+                "last_error": outgoing.last_error,
+                "created_at": outgoing.created_at,
+                "next_attempt_at": outgoing.next_attempt_at,
+                "sent_at": outgoing.sent_at,
+            }
+        )
+
 
 class EmailActionView(APIView):
     """Представление для выполнения действий над письмами (пометка, удаление)."""
@@ -1180,30 +1237,53 @@ class EmailActionView(APIView):
         action = request.data.get("action")
         email_ids = request.data.get("email_ids")
         mailbox = request.data.get("mailbox", "INBOX")
+        # select_all - "все письма по фильтру": клиент передает фильтр списка и исключения, а не каждый UID
+        select_all = request.data.get("select_all") in (True, "true", "1", 1)
 
-        if not action or not email_ids or not isinstance(email_ids, list):
+        if not action or not (select_all or (email_ids and isinstance(email_ids, list))):
             return Response(
-                {"error": "Параметры 'action' и 'email_ids' (список) обязательны."}, status=status.HTTP_400_BAD_REQUEST
+                {"error": "Параметры 'action' и 'email_ids' (список) или 'select_all' обязательны."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        exclude_ids = request.data.get("exclude_ids") or []
+        if not all(str(uid).isdigit() for uid in (exclude_ids if select_all else email_ids)):
+            return Response({"error": "Некорректные идентификаторы писем."}, status=status.HTTP_400_BAD_REQUEST)
+        if select_all:
+            filters = request.data.get("filter") or {}
+            if not isinstance(filters, dict) or not isinstance(filters.get("q") or "", str):
+                return Response(
+                    {"error": 'Параметр \'filter\' должен быть объектом вида {"q": строка, "is_read": bool}.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            is_read = filters.get("is_read")
+            email_ids = select_uids(
+                user.profile,
+                mailbox,
+                query=filters.get("q"),
+                is_read=is_read if isinstance(is_read, bool) else None,
+                exclude=exclude_ids,
+            )
+            if not email_ids:
+                return Response({"message": "Нет писем, подходящих под фильтр.", "count": 0})
 
         # Возвращаем переменные для результата
         success = False
         error_info = None
 
         if action == "mark_read":
-            logger.info(f"Попытка пометить {email_ids} как прочитанные для {user.email}")
+            logger.info(f"Попытка пометить {len(email_ids)} писем как прочитанные для {user.email}")
             # Возвращаем прямой вызов
             success, error_info = set_email_flags(
                 user, email_ids=email_ids, flags=["\\Seen"], mailbox=mailbox, add=True
             )
         elif action == "mark_unread":
-            logger.info(f"Попытка пометить {email_ids} как непрочитанные для {user.email}")
+            logger.info(f"Попытка пометить {len(email_ids)} писем как непрочитанные для {user.email}")
             # Возвращаем прямой вызов
             success, error_info = set_email_flags(
                 user, email_ids=email_ids, flags=["\\Seen"], mailbox=mailbox, add=False
             )
         elif action == "delete":
-            logger.info(f"Попытка удалить {email_ids} для {user.email}")
+            logger.info(f"Попытка удалить {len(email_ids)} писем для {user.email}")
             # Возвращаем прямой вызов
             success, error_info = delete_email(user, email_ids=email_ids, mailbox=mailbox)
         else:
@@ -1211,11 +1291,23 @@ class EmailActionView(APIView):
 
         # Возвращаем старую логику ответа
         if success:
-            return Response({"message": f"Действие '{action}' успешно выполнено."}, status=status.HTTP_200_OK)
+            return Response(
+                {"message": f"Действие '{action}' успешно выполнено.", "count": len(email_ids)},
+                status=status.HTTP_200_OK,
+            )
         else:
             return _get_error_response(error_info)
 
 
+class EmailPoolStatsView(APIView):
+    """Счетчики пулов IMAP и SMTP сессий (попадания/промахи) для текущего воркера."""
+
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response({"imap": get_imap_pool_stats(), "smtp": get_smtp_pool_stats()})
+
+
 class TableHighlightViewSet(viewsets.ModelViewSet):
     serializer_class = TableHighlightSerializer
     permission_classes = [IsAuthenticated]
@@ -294,3 +294,75 @@ EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
 EMAIL_USE_TLS = os.environ.get("EMAIL_USE_TLS", "True").lower() == "true"
 EMAIL_ENCRYPTION_KEY = os.environ.get("EMAIL_ENCRYPTION_KEY", "jaj9qouzOs-ACsia3xikjwEvv9es_3lzoKF6Csei8-4=")
+
+# Пул IMAP сессий (свой в каждом воркере)
+IMAP_POOL_MAX_SESSIONS = int(os.environ.get("IMAP_POOL_MAX_SESSIONS", 4))
+IMAP_POOL_IDLE_TIMEOUT = int(os.environ.get("IMAP_POOL_IDLE_TIMEOUT", 300))
+IMAP_POOL_ACQUIRE_TIMEOUT = int(os.environ.get("IMAP_POOL_ACQUIRE_TIMEOUT", 10))
+
+# Пул SMTP сессий: почтовые серверы ограничивают число одновременных соединений с одного ящика
+SMTP_POOL_MAX_SESSIONS = int(os.environ.get("SMTP_POOL_MAX_SESSIONS", 2))
+SMTP_POOL_IDLE_TIMEOUT = int(os.environ.get("SMTP_POOL_IDLE_TIMEOUT", 60))
+SMTP_POOL_ACQUIRE_TIMEOUT = int(os.environ.get("SMTP_POOL_ACQUIRE_TIMEOUT", 30))
+# Исходящее письмо собирается во временный файл: до этого размера в памяти, дальше на диске
+MAIL_SPOOL_MAX_MEMORY = int(os.environ.get("MAIL_SPOOL_MAX_MEMORY", 1024 * 1024))
+
+# Кэши в памяти процесса: расшифрованные учетные данные почты и список папок пользователя (секунды, 0 - без кэша)
+MAIL_CREDENTIALS_CACHE_TTL = int(os.environ.get("MAIL_CREDENTIALS_CACHE_TTL", 60))
+MAIL_MAILBOX_CACHE_TTL = int(os.environ.get("MAIL_MAILBOX_CACHE_TTL", 600))
+
+# Локальный кэш заголовков писем: не чаще раза в N секунд ходим на IMAP сервер за изменениями
+MAIL_SYNC_MIN_INTERVAL = int(os.environ.get("MAIL_SYNC_MIN_INTERVAL", 60))
+MAIL_SYNC_FETCH_CHUNK = int(os.environ.get("MAIL_SYNC_FETCH_CHUNK", 500))
+# Через сколько секунд захват синхронизации папки считается брошенным (процесс упал)
+MAIL_SYNC_CLAIM_TIMEOUT = int(os.environ.get("MAIL_SYNC_CLAIM_TIMEOUT", 600))
+
+# Поиск по почте: сколько байт тела письма индексировать и сколько тел догружает воркер IDLE после каждой синхронизации
+MAIL_SEARCH_BODY_BYTES = int(os.environ.get("MAIL_SEARCH_BODY_BYTES", 32768))
+MAIL_SEARCH_BODY_BATCH = int(os.environ.get("MAIL_SEARCH_BODY_BATCH", 50))
+
+# Очередь исходящих писем (воркер outbox_worker)
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 6))
+OUTBOX_RETRY_BASE_DELAY = int(os.environ.get("OUTBOX_RETRY_BASE_DELAY", 30))  # секунды, удваивается с каждой попыткой
+OUTBOX_RETRY_MAX_DELAY = int(os.environ.get("OUTBOX_RETRY_MAX_DELAY", 3600))
+OUTBOX_CLAIM_TIMEOUT = int(os.environ.get("OUTBOX_CLAIM_TIMEOUT", 600))  # зависшие "sending" возвращаются в очередь
+OUTBOX_BULK_MAX_RECIPIENTS = int(os.environ.get("OUTBOX_BULK_MAX_RECIPIENTS", 500))  # лимит получателей одной рассылки
+
+# Keyset пагинация (?cursor=): сколько секунд кэшировать общее число строк для ?count=1
+PAGINATION_COUNT_CACHE_TTL = int(os.environ.get("PAGINATION_COUNT_CACHE_TTL", 300))
+
+# Выгрузки в файлы: сколько строк читать из БД за раз
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 2000))
+EXPORT_SPOOL_MAX_MEMORY = int(os.environ.get("EXPORT_SPOOL_MAX_MEMORY", 5 * 1024 * 1024))  # дальше Excel файл на диске
+
+# Импорт клиентов и перевозчиков из Excel: сколько записей вставлять одним INSERT
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+
+# Фоновый импорт файлов (воркер import_worker): строк на одну транзакцию и контрольную точку,
+# через сколько секунд без обновлений задачу забирает другой воркер, сколько ошибок и предупреждений хранить
+IMPORT_JOB_CHUNK_ROWS = int(os.environ.get("IMPORT_JOB_CHUNK_ROWS", 1000))
+IMPORT_JOB_CLAIM_TIMEOUT = int(os.environ.get("IMPORT_JOB_CLAIM_TIMEOUT", 600))
+IMPORT_JOB_MAX_MESSAGES = int(os.environ.get("IMPORT_JOB_MAX_MESSAGES", 1000))
+
+# Поиск дубликатов клиентов и перевозчиков: порог похожести наименований (0..1, difflib ratio)
+DUPLICATE_NAME_SIMILARITY = float(os.environ.get("DUPLICATE_NAME_SIMILARITY", 0.9))
+
+# Финансовый отчет в одной валюте: валюта отчета по умолчанию (и заказов без валюты),
+# валюта, к которой заданы курсы ExchangeRate, и сколько дней курс остается действующим
+FINANCE_DEFAULT_CURRENCY = os.environ.get("FINANCE_DEFAULT_CURRENCY", "RUB")
+FX_REFERENCE_CURRENCY = os.environ.get("FX_REFERENCE_CURRENCY", "BYN")
+FX_RATE_MAX_AGE_DAYS = int(os.environ.get("FX_RATE_MAX_AGE_DAYS", 31))
+
+# Кэши: "finance" - отчеты и счетчики версий их данных (api/finance_cache.py). Кэш должен быть общим
+# для всех процессов gunicorn и воркеров, поэтому по умолчанию файловый; locmem подходит для одного процесса
+# (runserver, тесты). Отчеты с сегодняшним днем живут FINANCE_REPORT_CACHE_TTL секунд, прошлые - без срока
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "finance": {
+        "BACKEND": os.environ.get("FINANCE_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.environ.get("FINANCE_CACHE_LOCATION", "/var/tmp/logistic_crm/finance_cache"),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("FINANCE_CACHE_MAX_ENTRIES", 10000))},
+    },
+}
+FINANCE_REPORT_CACHE_TTL = int(os.environ.get("FINANCE_REPORT_CACHE_TTL", 60))
@@ -0,0 +1,108 @@
+import email
+import os
+from email import policy
+from types import SimpleNamespace
+from unittest import mock
+
+from api.email_service import (
+    LIST_FETCH_ITEMS,
+    EmailError,
+    _build_email_summary,
+    _parse_mailbox_list,
+    _resolve_mailbox_name,
+    _spool_message,
+    fetch_emails,
+    invalidate_mail_caches,
+)
+from api.models import CustomUser
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from imapclient.response_parser import parse_fetch_response
+
+HEADERS = b"Subject: =?utf-8?b?0JfQsNC60LDQtw==?=\r\nFrom: client@example.com\r\nDate: Mon, 02 Jun 2025 10:15:00 +0300\r\n\r\n"
+
+
+class EmailSummaryTest(SimpleTestCase):
+    def test_builds_summary_from_header_only_fetch(self):
+        fetch_data = [
+            (
+                b'1 (UID 42 FLAGS (\\Seen) INTERNALDATE "02-Jun-2025 10:15:01 +0300" RFC822.SIZE 5120 '
+                b"BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)] {%d}" % len(HEADERS),
+                HEADERS,
+            ),
+            b")",
+        ]
+        parsed = parse_fetch_response(fetch_data, normalise_times=False, uid_is_key=True)
+
+        summary = _build_email_summary(42, parsed[42])
+
+        self.assertEqual(summary["id"], "42")
+        self.assertEqual(summary["subject"], "Заказ")
+        self.assertEqual(summary["from"], "client@example.com")
+        self.assertEqual(summary["date"], "2025-06-02T10:15:00+03:00")
+        self.assertTrue(summary["is_read"])
+        self.assertEqual(summary["size"], 5120)
+        self.assertNotIn("body", summary)
+        self.assertIn("BODY.PEEK[HEADER.FIELDS", LIST_FETCH_ITEMS)
+
+
+@override_settings(MAIL_SPOOL_MAX_MEMORY=1024)
+class SpooledMessageTest(SimpleTestCase):
+    def test_attachment_is_streamed_into_spool(self):
+        payload = os.urandom(200 * 1024 + 7)
+        document = SimpleNamespace(id=3, name="Счет.pdf", file=ContentFile(payload))
+        credentials = {"smtp_user": "manager@example.com"}
+
+        with mock.patch("api.email_service._get_document", return_value=document):
+            spool = _spool_message(credentials, "client@example.com", "Счет", "<p>Добрый день</p>", [3])
+        self.assertTrue(spool._rolled)  # письмо больше лимита - ушло на диск
+
+        spool.seek(0)
+        message = email.message_from_binary_file(spool, policy=policy.default)
+        html, attachment = message.iter_parts()
+        self.assertEqual(message["Subject"], "Счет")
+        self.assertIn("Добрый день", html.get_content())
+        self.assertEqual(attachment.get_filename(), "Счет.pdf")
+        self.assertEqual(attachment.get_content(), payload)
+
+
+class MailboxTreeTest(SimpleTestCase):
+    def test_special_use_and_hierarchy(self):
+        data = [
+            b'(\\HasChildren) "." "INBOX"',
+            b'(\\HasNoChildren \\Sent) "." "INBOX.Sent"',
+            b'(\\HasNoChildren) "." "INBOX.Orders"',
+            b'(\\HasChildren \\Noselect) "/" "[Gmail]"',
+            b'(\\HasNoChildren \\Trash) "/" "[Gmail]/&BBoEPgRABDcEOAQ9BDA-"',
+        ]
+        mailboxes = _parse_mailbox_list(data, "manager@example.com")
+
+        self.assertEqual(
+            [(box["name"], box["display_name"], box["special_use"], box["parent"]) for box in mailboxes],
+            [
+                ("INBOX", "INBOX", None, None),
+                ("[Gmail]/&BBoEPgRABDcEOAQ9BDA-", "[Gmail]/Корзина", "\\trash", None),
+                ("INBOX.Orders", "Orders", None, "INBOX"),
+                ("INBOX.Sent", "Sent", "\\sent", "INBOX"),
+            ],
+        )
+        self.assertEqual(_resolve_mailbox_name(mailboxes, "Sent"), "INBOX.Sent")
+        self.assertEqual(_resolve_mailbox_name(mailboxes, "INBOX.Trash"), "[Gmail]/&BBoEPgRABDcEOAQ9BDA-")
+        self.assertEqual(_resolve_mailbox_name(mailboxes, "Orders"), "INBOX.Orders")
+        self.assertIsNone(_resolve_mailbox_name(mailboxes, "Archive"))
+
+
+class FetchEmailsCredentialsTest(TestCase):
+    def test_list_uses_cached_credentials(self):
+        user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        user.profile.email_integration_enabled = True
+        user.profile.save()
+        self.addCleanup(invalidate_mail_caches, user)
+        credentials = {"imap_host": "imap.example.com", "imap_user": "manager", "imap_password": "secret"}
+
+        with mock.patch("api.email_service._load_user_credentials", return_value=(credentials, None)) as load:
+            with mock.patch("api.email_service.imap_pool.acquire", return_value=(None, ("connection", "down"))):
+                for _ in range(2):
+                    with self.assertRaises(EmailError):
+                        fetch_emails(user.email)
+        load.assert_called_once()
@@ -0,0 +1,80 @@
+from io import BytesIO
+
+from api.models import Client, CustomUser
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from openpyxl import load_workbook
+from rest_framework.test import APIClient
+
+
+class ExcelExportTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="admin@example.com", username="admin", password="x", role="admin"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def read_sheet(self, response):
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+
+    def test_clients_export(self):
+        Client.objects.create(company_name="ООО Ромашка", unp="123456789", created_by=self.user)
+        rows = self.read_sheet(self.api.get("/api/clients/export_excel/", {"columns": "company_name,unp"}))
+        self.assertEqual(rows, [["Наименование компании", "УНП"], ["ООО Ромашка", "123456789"]])
+
+        rows = self.read_sheet(self.api.get("/api/clients/export_excel/"))
+        self.assertEqual(rows[0][0], "ID")
+        self.assertEqual(len(rows[0]), 11)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_rows_are_read_in_bounded_keyset_chunks(self):
+        for number in range(3):
+            Client.objects.create(company_name=f"Клиент {number}")
+        with CaptureQueriesContext(connection) as queries:
+            rows = self.read_sheet(self.api.get("/api/clients/export_excel/", {"columns": "company_name"}))
+        self.assertEqual(rows[1:], [["Клиент 2"], ["Клиент 1"], ["Клиент 0"]])
+        chunks = [query["sql"] for query in queries.captured_queries if '"api_client"."company_name"' in query["sql"]]
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(all("LIMIT 2" in sql for sql in chunks))
+
+    @override_settings(CACHES={"finance": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_finance_report_export(self):
+        response = self.api.get(
+            "/api/finance/report/", {"start_date": "2025-03-10", "end_date": "2025-03-11", "export": "xlsx"}
+        )
+        rows = self.read_sheet(response)
+        self.assertEqual(rows, [["Дата", "Заказов", "Выручка (RUB)", "Средний чек (RUB)", "Прибыль (RUB)"]])
+
+    def test_orders_export_uses_list_filters(self):
+        client = Client.objects.create(company_name="ООО Ромашка")
+        self.user.order_set.create(client=client, contract_number="D-1", status="new")
+        self.user.order_set.create(contract_number="D-2", status="completed")
+        rows = self.read_sheet(
+            self.api.get("/api/orders/export_orders_excel/", {"status": "new", "columns": "contract_number,client"})
+        )
+        self.assertEqual(rows, [["Contract Number", "Client"], ["D-1", "ООО Ромашка"]])
+
+
+class CsvExportTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="admin@example.com", username="admin", password="x", role="admin"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_rows_are_read_in_bounded_keyset_chunks(self):
+        for number in range(5):
+            self.user.order_set.create(contract_number=f"D-{number}")
+        response = self.api.get("/api/orders/export_orders_csv/", {"columns": "contract_number"})
+        with CaptureQueriesContext(connection) as queries:
+            lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(lines, ["Contract Number", "D-4", "D-3", "D-2", "D-1", "D-0"])
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(all("LIMIT 2" in query["sql"] for query in queries.captured_queries))
@@ -0,0 +1,225 @@
+import io
+from datetime import datetime
+from decimal import Decimal
+
+from api.finance_cache import finance_cache
+from api.fx import load_rates_file
+from api.models import Client, CustomUser, DailyFinanceRollup, ExchangeRate, Order
+from api.rollups import rebuild_rollup
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "finance": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "finance-tests"},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FinanceReportTest(TestCase):
+    def setUp(self):
+        finance_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            email="manager@example.com", username="manager", password="x", role="manager"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_order(self, day, price, client_rate=None, carrier_rate=None, **fields):
+        order = Order.objects.create(
+            created_by=self.user, total_price=price, client_rate=client_rate, carrier_rate=carrier_rate, **fields
+        )
+        created_at = timezone.make_aware(datetime.strptime(day, "%Y-%m-%d %H:%M"))
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        return order
+
+    def test_current_and_previous_period_in_one_query(self):
+        # Предыдущий период для 10-11 марта - 8-9 марта
+        self.create_order("2025-03-08 09:00", Decimal("100"), carrier_rate=Decimal("60"))
+        self.create_order("2025-03-10 00:00", Decimal("150"), client_rate=Decimal("200"), carrier_rate=Decimal("120"))
+        self.create_order("2025-03-11 23:59", Decimal("50"))
+        self.create_order("2025-03-12 00:00", Decimal("999"))
+        # queryset.update в create_order обходит сигналы - итоги собираем заново
+        rebuild_rollup()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/finance/report/", {"start_date": "2025-03-10", "end_date": "2025-03-11"})
+        report = response.json()
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("OFFSET", queries.captured_queries[0]["sql"])
+
+        self.assertEqual((report["total_revenue"], report["total_orders"], report["profit"]), (200.0, 2, 130.0))
+        self.assertEqual((report["average_order_value"], report["revenue_trend"]), (100.0, 100.0))
+        self.assertEqual((report["orders_trend"], report["profit_trend"]), (100.0, 225.0))
+        self.assertEqual(
+            [(day["date"], day["orders"], day["profit"]) for day in report["daily_stats"]],
+            [("2025-03-10", 1, 80.0), ("2025-03-11", 1, 50.0)],
+        )
+
+    def test_report_in_chosen_currency(self):
+        rates = "Дата;Валюта;Курс\n01.03.2025;usd;3,0\n2025-03-01;RUB;0.03\n09.03.2025;EUR;3.5\nвчера;USD;1\n"
+        saved, errors = load_rates_file(io.BytesIO(rates.encode("utf-8")), "rates.csv")
+        self.assertEqual((saved, errors), (3, ["Строка 5: нужны дата, валюта и курс больше нуля"]))
+        self.assertEqual(ExchangeRate.objects.get(currency="USD").rate, Decimal("3"))
+
+        self.create_order(
+            "2025-03-10 12:00",
+            Decimal("100"),
+            carrier_rate=Decimal("50"),
+            payment_currency="USD",
+            carrier_currency="EUR",
+        )
+        self.create_order("2025-03-10 13:00", Decimal("500"))
+        rebuild_rollup()
+        period = {"start_date": "2025-03-10", "end_date": "2025-03-10"}
+
+        # Заказ без валюты - в FINANCE_DEFAULT_CURRENCY (RUB)
+        report = self.api.get("/api/finance/report/", {**period, "currency": "RUB"}).json()
+        self.assertEqual((report["currency"], report["total_revenue"], report["profit"]), ("RUB", 10500.0, 4666.67))
+        report = self.api.get("/api/finance/report/", {**period, "currency": "usd"}).json()
+        self.assertEqual((report["currency"], report["total_revenue"], report["profit"]), ("USD", 105.0, 46.67))
+        self.assertEqual(report["daily_stats"][0]["orders"], 2)
+
+        response = self.api.get("/api/finance/report/", {**period, "currency": "GBP"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("GBP на 2025-03-10", response.json()["error"])
+
+    def test_invalid_dates(self):
+        self.assertEqual(self.api.get("/api/finance/report/", {"start_date": "2025-03-10"}).status_code, 400)
+        response = self.api.get("/api/finance/report/", {"start_date": "10.03.2025", "end_date": "2025-03-11"})
+        self.assertEqual(response.status_code, 400)
+
+
+class DailyFinanceRollupTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+
+    def rollup_rows(self):
+        rows = DailyFinanceRollup.objects.order_by("date", "currency", "transport_type")
+        return list(
+            rows.values_list("date", "created_by", "currency", "transport_type", "orders_count", "revenue", "profit")
+        )
+
+    def test_signals_keep_rollup_equal_to_rebuild(self):
+        first = Order.objects.create(
+            created_by=self.user, total_price=Decimal("100"), carrier_rate=Decimal("40"), payment_currency="USD"
+        )
+        second = Order.objects.create(
+            created_by=self.user, total_price=Decimal("50"), client_rate=Decimal("70"), payment_currency="USD"
+        )
+        Order.objects.create(total_price=Decimal("10"), transport_type="auto")
+        first.payment_currency = "EUR"
+        first.carrier_rate = Decimal("30")
+        first.save()
+        second.delete()
+
+        incremental = self.rollup_rows()
+        rebuild_rollup()
+        self.assertEqual(incremental, self.rollup_rows())
+
+        today = timezone.localdate()
+        self.assertEqual(
+            incremental,
+            [
+                (today, None, "", "auto", 1, Decimal("10"), Decimal("10")),
+                (today, self.user.pk, "EUR", "", 1, Decimal("100"), Decimal("70")),
+            ],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FinanceReportCacheTest(TestCase):
+    def setUp(self):
+        finance_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            email="manager@example.com", username="manager", password="x", role="manager"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def report(self, start, end):
+        return self.api.get("/api/finance/report/", {"start_date": start, "end_date": end}).json()
+
+    def test_order_changes_invalidate_only_touched_days(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            march = Order.objects.create(created_by=self.user, total_price=Decimal("100"))
+            Order.objects.filter(pk=march.pk).update(created_at=timezone.make_aware(datetime(2025, 3, 10, 12)))
+            Order.objects.create(created_by=self.user, total_price=Decimal("10"))
+            rebuild_rollup()
+        today = timezone.localdate().isoformat()
+
+        self.assertEqual(self.report("2025-03-10", "2025-03-10")["total_revenue"], 100.0)
+        self.assertEqual(self.report(today, today)["total_revenue"], 10.0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.report("2025-03-10", "2025-03-10")["total_revenue"], 100.0)
+            self.report(today, today)
+        self.assertEqual(len(queries), 0)
+
+        # Новый заказ сегодня не трогает мартовский отчет
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(created_by=self.user, total_price=Decimal("5"))
+        with CaptureQueriesContext(connection) as queries:
+            self.report("2025-03-10", "2025-03-10")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(self.report(today, today)["total_revenue"], 15.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            march.refresh_from_db()
+            march.total_price = Decimal("300")
+            march.save()
+        self.assertEqual(self.report("2025-03-10", "2025-03-10")["total_revenue"], 300.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            march.delete()
+        self.assertEqual(self.report("2025-03-10", "2025-03-10")["total_revenue"], 0.0)
+
+
+class FinanceBreakdownTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="manager@example.com", username="manager", password="x", role="manager"
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.today = timezone.localdate().isoformat()
+
+    def breakdown(self, **params):
+        return self.api.get("/api/finance/breakdown/", {"start_date": self.today, "end_date": self.today, **params})
+
+    def test_top_groups_with_other_bucket(self):
+        big, middle, small = (Client.objects.create(company_name=name) for name in ("Большой", "Средний", "Малый"))
+        minsk_moscow = {"loading_address": "220030, г. Минск, ул. Ленина, 1", "unloading_address": "Россия, Москва"}
+        for client, price, carrier_rate in ((big, 1000, 800), (big, 500, 300), (middle, 400, 300), (small, 100, 50)):
+            Order.objects.create(
+                client=client,
+                total_price=Decimal(price),
+                carrier_rate=Decimal(carrier_rate),
+                transport_type="truck",
+                **minsk_moscow,
+            )
+        Order.objects.create(total_price=Decimal("50"))
+
+        report = self.breakdown(group_by="client", limit=2).json()
+        self.assertEqual(
+            [(item["key"], item["orders"], item["revenue"], item["margin"]) for item in report["items"]],
+            [(big.pk, 2, 1500.0, 26.67), (middle.pk, 1, 400.0, 25.0)],
+        )
+        self.assertEqual(report["items"][0]["label"], "Большой")
+        self.assertEqual(
+            report["other"], {"groups": 2, "orders": 2, "revenue": 150.0, "profit": 100.0, "margin": 66.67}
+        )
+        self.assertEqual(report["total"]["orders"], 5)
+
+        report = self.breakdown(group_by="route").json()
+        self.assertEqual(
+            [(item["label"], item["orders"]) for item in report["items"]], [("Минск → Москва", 4), ("Не указан", 1)]
+        )
+        report = self.breakdown(group_by="transport_type").json()
+        self.assertEqual(report["items"][0]["label"], "Грузовой автомобиль")
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.breakdown(group_by="manager").status_code, 400)
+        self.assertEqual(self.breakdown(limit="0").status_code, 400)
+        self.assertEqual(self.breakdown(limit="many").status_code, 400)
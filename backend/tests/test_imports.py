@@ -0,0 +1,270 @@
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+import pandas as pd
+from api.duplicates import NAME_WINDOW, DuplicateIndex, names_similar, normalize_company_name
+from api.import_jobs import claim_batch, run_job
+from api.importers import CARRIER_IMPORT, CLIENT_IMPORT, import_frame
+from api.models import Carrier, CarrierContact, Client, ClientContact, CustomUser, ImportJob
+from api.spreadsheets import SpreadsheetError, SpreadsheetReader
+from api.utils import normalize_phone, normalize_phone_series
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from openpyxl import Workbook
+from rest_framework.test import APIClient
+
+
+class NormalizePhoneSeriesTest(SimpleTestCase):
+    def test_matches_scalar_version(self):
+        phones = ["+375 (29) 123-45-67", "80291234567", "291234567", "8 (017) 123 45 67", "9123456789", "123", ""]
+        expected = [normalize_phone(phone) for phone in phones]
+        self.assertEqual(normalize_phone_series(pd.Series(phones)).tolist(), expected)
+
+    def test_numbers_from_excel_and_empty_cells(self):
+        result = normalize_phone_series(pd.Series([375291234567.0, None], dtype=object)).tolist()
+        self.assertEqual(result, ["+375291234567", None])
+
+
+class SpreadsheetReaderTest(SimpleTestCase):
+    def test_xlsx_batches_keep_types_and_row_numbers(self):
+        workbook = Workbook()
+        workbook.active.append(["Наименование", "УНП", None])
+        for row in (["Альфа", 190000001], [None, None], ["Бета", "190000002"], ["Гамма", None]):
+            workbook.active.append(row)
+        content = BytesIO()
+        workbook.save(content)
+
+        with SpreadsheetReader(content, "clients.xlsx") as reader:
+            self.assertEqual(reader.header, ["Наименование", "УНП"])
+            batches = list(reader.iter_batches(2))
+            self.assertEqual([batch.end for batch in batches], [2, 4])
+            self.assertEqual(list(batches[0].frame.index), [2])
+            self.assertEqual(batches[0].frame.at[2, "УНП"], 190000001)
+            resumed = list(reader.iter_batches(10, skip=3))
+            self.assertEqual(list(resumed[0].frame["Наименование"]), ["Гамма"])
+
+    def test_csv_in_cp1251_with_semicolons(self):
+        content = BytesIO("Наименование;Парк\nАльфа;10 тягачей\n\nБета;\n".encode("cp1251"))
+        with SpreadsheetReader(content, "carriers.csv") as reader:
+            self.assertEqual(reader.count_rows(), 3)
+            (batch,) = list(reader.iter_batches(100))
+        self.assertEqual(
+            batch.frame.to_dict("index"),
+            {2: {"Наименование": "Альфа", "Парк": "10 тягачей"}, 4: {"Наименование": "Бета", "Парк": ""}},
+        )
+
+    def test_unsupported_file(self):
+        with self.assertRaises(SpreadsheetError):
+            SpreadsheetReader(BytesIO(b"data"), "clients.xls")
+        with self.assertRaises(SpreadsheetError):
+            SpreadsheetReader(BytesIO(b"not a zip"), "clients.xlsx")
+
+
+class ImportUploadValidationTest(TestCase):
+    def test_header_is_checked_before_enqueue(self):
+        api = APIClient()
+        user = CustomUser.objects.create_user(email="m@example.com", username="m", password="x", role="manager")
+        api.force_authenticate(user)
+        file = SimpleUploadedFile("carriers.csv", "Название;Парк\nАльфа;5\n".encode())
+        response = api.post("/api/carriers/import_excel/", {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "В файле нет колонки: Наименование")
+        self.assertFalse(ImportJob.objects.exists())
+
+
+class ImportFrameTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+
+    def test_carriers_with_contacts_and_row_report(self):
+        frame = pd.DataFrame(
+            {
+                "Наименование ": ["ТрансЛогистик", None, "БелАвто"],
+                "Парк": ["10 тягачей", "5", None],
+                "Контактная информация": ["Имя: Иван, Телефон: 8 029 123-45-67", "Петр", "Телефон: 12345"],
+                "Менеджер": [None, None, "Ольга"],
+            }
+        )
+        report = import_frame(CARRIER_IMPORT, frame, self.user).as_dict()
+
+        self.assertEqual((report["created"], report["skipped"]), (2, 1))
+        self.assertEqual(report["errors"], [{"row": 3, "message": "Не указано наименование компании"}])
+        self.assertEqual(report["warnings"], [{"row": 4, "message": "Телефон не распознан: 12345"}])
+        contacts = CarrierContact.objects.order_by("carrier__company_name").values_list(
+            "carrier__company_name", "name", "phone"
+        )
+        self.assertEqual(list(contacts), [("БелАвто", "Ольга", ""), ("ТрансЛогистик", "Иван", "+375291234567")])
+        self.assertEqual(Carrier.objects.get(company_name="БелАвто").fleet, "")
+
+    def test_contacts_linked_without_pks_from_bulk_insert(self):
+        Client.objects.create(company_name="Старый клиент")
+        frame = pd.DataFrame(
+            {
+                "Наименование компании": ["Ромашка", "Лютик", "Василек"],
+                "Контакты": ["Телефон: +375291112233", None, "Email: v@example.com"],
+            }
+        )
+        # Как на MySQL: многострочный INSERT не возвращает pk
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            report = import_frame(CLIENT_IMPORT, frame, self.user).as_dict()
+
+        self.assertEqual(report["created"], 3)
+        contacts = ClientContact.objects.order_by("client__company_name").values_list("client__company_name", "phone")
+        self.assertEqual(list(contacts), [("Василек", ""), ("Ромашка", "+375291112233")])
+
+    def test_clients_free_text_contacts(self):
+        frame = pd.DataFrame(
+            {"Наименование компании": ["ООО Ромашка"], "Контакты": ["Анна Смирнова +375291112233 anna@example.com"]}
+        )
+        import_frame(CLIENT_IMPORT, frame, self.user)
+        client = Client.objects.get()
+        self.assertEqual(client.created_by, self.user)
+        self.assertEqual(
+            list(client.contacts.values_list("name", "phone", "email")),
+            [("Анна Смирнова", "+375291112233", "anna@example.com")],
+        )
+
+
+class ImportJobTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        media_override = override_settings(MEDIA_ROOT=self.media, IMPORT_JOB_CHUNK_ROWS=2)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def upload(self, names):
+        workbook = Workbook()
+        workbook.active.append(["Наименование компании", "Контакты"])
+        for name in names:
+            workbook.active.append([name, "Иван"])
+        content = BytesIO()
+        workbook.save(content)
+        file = SimpleUploadedFile("clients.xlsx", content.getvalue())
+        return self.api.post("/api/clients/import_excel/", {"file": file}, format="multipart")
+
+    def test_upload_enqueues_and_worker_imports_in_chunks(self):
+        response = self.upload(["Альфа", None, "Бета", "Гамма", "Дельта"])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "queued")
+        self.assertFalse(Client.objects.exists())
+
+        (job,) = claim_batch(5)
+        self.assertEqual(claim_batch(5), [])
+        run_job(job)
+
+        status = self.api.get(f"/api/imports/{job.id}/").json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual((status["total_rows"], status["processed_rows"], status["progress"]), (5, 5, 100.0))
+        self.assertEqual((status["created"], status["skipped"]), (4, 1))
+        self.assertEqual(status["errors"], [{"row": 3, "message": "Не указано наименование компании"}])
+        self.assertEqual(Client.objects.count(), 4)
+
+        other = CustomUser.objects.create_user(email="other@example.com", username="other", password="x")
+        self.api.force_authenticate(other)
+        self.assertEqual(self.api.get(f"/api/imports/{job.id}/").status_code, 404)
+
+    def test_resume_from_checkpoint(self):
+        job_id = self.upload(["Альфа", "Бета", "Гамма"]).json()["id"]
+        # Первые две строки импортированы до падения воркера: задача зависла в running
+        ImportJob.objects.filter(id=job_id).update(
+            status=ImportJob.Statuses.RUNNING, processed_rows=2, created_count=2, claimed_at="2020-01-01T00:00Z"
+        )
+        (job,) = claim_batch(5)
+        run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.created_count), ("done", 3, 3))
+        self.assertEqual(list(Client.objects.values_list("company_name", flat=True)), ["Гамма"])
+
+
+class DuplicateIndexTest(SimpleTestCase):
+    def test_large_shared_prefix_block_is_compared_in_window(self):
+        index = DuplicateIndex()
+        count = 3000
+        for ref in range(count):
+            suffix = "".join(chr(ord("а") + int(digit, 16)) for digit in hashlib.md5(str(ref).encode()).hexdigest()[:8])
+            index.add(ref, f"Тра{suffix}")
+        index.add("typo", "Транслогистк")
+        index.add("original", "Транслогистик")
+
+        with mock.patch("api.duplicates.names_similar", wraps=names_similar) as compared:
+            groups = index.possible_duplicates()
+        self.assertLessEqual(compared.call_count, (count + 2) * NAME_WINDOW)
+        self.assertIn(["Транслогистик", "Транслогистк"], [sorted(group["names"]) for group in groups])
+        self.assertEqual(index.match("ООО Транслогистикк"), ("original", "похожее наименование"))
+
+
+class DuplicateDetectionTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="admin@example.com", username="admin", password="x", role="admin"
+        )
+        self.romashka = Client.objects.create(company_name='ООО "Ромашка"', unp="190000001")
+        self.vasilek = Client.objects.create(company_name="Василёк")
+        ClientContact.objects.create(client=self.vasilek, phone="+375291112233")
+
+    def test_normalize_company_name(self):
+        self.assertEqual(normalize_company_name(' ООО  "Ромашка-Трейд" '), "ромашка трейд")
+        self.assertEqual(normalize_company_name("ЧУП «Берёза»"), "береза")
+
+    def test_duplicates_are_skipped_in_one_pass(self):
+        frame = pd.DataFrame(
+            {
+                "Наименование компании": ["ромашка", "Новое имя", "Лютик", "Ромашкаа", "Береза", "ОДО Берёза"],
+                "УНП": [None, "190000001", None, None, None, None],
+                "Контакты": [None, None, "Телефон: +375 29 111-22-33", None, None, None],
+            }
+        )
+        report = import_frame(CLIENT_IMPORT, frame, self.user).as_dict()
+
+        self.assertEqual((report["created"], report["duplicates"]), (1, 5))
+        messages = {item["row"]: item["message"] for item in report["warnings"]}
+        self.assertEqual(messages[2], f'Уже есть: ООО "Ромашка" (#{self.romashka.pk}), совпадение: наименование')
+        self.assertTrue(messages[3].endswith("совпадение: УНП"))
+        self.assertTrue(messages[4].endswith("совпадение: телефон"))
+        self.assertTrue(messages[5].endswith("совпадение: похожее наименование"))
+        self.assertEqual(messages[7], "Повтор строки 6 (наименование)")
+        self.assertEqual(Client.objects.count(), 3)
+
+    def test_update_fills_existing_record(self):
+        frame = pd.DataFrame(
+            {
+                "Наименование компании": ["Ромашка"],
+                "Комментарии": ["Постоянный клиент"],
+                "Контакты": ["Имя: Ольга, Email: olga@example.com"],
+            }
+        )
+        report = import_frame(CLIENT_IMPORT, frame, self.user, on_duplicate="update").as_dict()
+
+        self.assertEqual((report["created"], report["updated"]), (0, 1))
+        self.romashka.refresh_from_db()
+        self.assertEqual((self.romashka.comments, self.romashka.unp), ("Постоянный клиент", "190000001"))
+        self.assertEqual(list(self.romashka.contacts.values_list("email", flat=True)), ["olga@example.com"])
+
+    def test_possible_duplicates_report(self):
+        Client.objects.create(company_name="Ромашкаа")
+        Client.objects.create(company_name="Лютик")
+        ClientContact.objects.create(client=Client.objects.get(company_name="Лютик"), phone="+375291112233")
+        api = APIClient()
+        api.force_authenticate(self.user)
+
+        groups = api.get("/api/clients/possible_duplicates/").json()["results"]
+        self.assertEqual(
+            sorted((group["names"], group["reasons"]) for group in groups),
+            [
+                (["Василёк", "Лютик"], ["телефон"]),
+                (['ООО "Ромашка"', "Ромашкаа"], ["похожее наименование"]),
+            ],
+        )
+
+        self.user.role = "manager"
+        self.user.save()
+        self.assertEqual(api.get("/api/clients/possible_duplicates/").status_code, 403)
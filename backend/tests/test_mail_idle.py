@@ -0,0 +1,148 @@
+import re
+import socketserver
+import threading
+
+from api.mail_idle import MailIdleWorker, new_mail_received
+from api.models import CachedEmailMessage, CustomUser, Notification
+from django.test import TestCase
+
+
+class StubIMAPHandler(socketserver.StreamRequestHandler):
+    """Очень упрощенный IMAP сервер: LOGIN, SELECT, UID SEARCH/FETCH, IDLE."""
+
+    def setup(self):
+        super().setup()
+        self.lock = threading.Lock()
+        self.idling = False
+
+    def send_line(self, data):
+        with self.lock:
+            self.wfile.write(data + b"\r\n")
+
+    def handle(self):
+        self.server.clients.append(self)
+        self.send_line(b"* OK [CAPABILITY IMAP4rev1 IDLE] stub ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode().rstrip("\r\n")
+            if line == "DONE":
+                self.idling = False
+                self.send_line(f"{self.idle_tag} OK IDLE terminated".encode())
+                continue
+            tag, command, *rest = line.split(" ", 2)
+            getattr(self, f"do_{command.lower()}", self.do_ok)(tag, rest[0] if rest else "")
+
+    def do_ok(self, tag, args):
+        self.send_line(f"{tag} OK done".encode())
+
+    def do_capability(self, tag, args):
+        self.send_line(b"* CAPABILITY IMAP4rev1 IDLE")
+        self.do_ok(tag, args)
+
+    def do_select(self, tag, args):
+        messages = self.server.messages
+        self.send_line(f"* {len(messages)} EXISTS".encode())
+        self.send_line(b"* OK [UIDVALIDITY 7] ok")
+        self.send_line(f"* OK [UIDNEXT {max(messages, default=0) + 1}] ok".encode())
+        self.send_line(f"{tag} OK [READ-WRITE] SELECT completed".encode())
+
+    def do_idle(self, tag, args):
+        self.idle_tag = tag
+        self.idling = True
+        self.send_line(b"+ idling")
+
+    def do_logout(self, tag, args):
+        self.send_line(b"* BYE bye")
+        self.do_ok(tag, args)
+
+    def do_uid(self, tag, args):
+        command, args = args.split(" ", 1)
+        uids = sorted(self.server.messages)
+        if command == "SEARCH":
+            match = re.match(r"UID (\d+):\*", args)
+            if match:
+                uids = [uid for uid in uids if uid >= int(match.group(1))] or uids[-1:]
+            self.send_line(("* SEARCH " + " ".join(map(str, uids))).encode())
+            return self.do_ok(tag, args)
+
+        uid_set, items = args.split(" ", 1)
+        if ":" in uid_set:
+            first, last = uid_set.split(":")
+            wanted = [uid for uid in uids if int(first) <= uid <= int(last)]
+        else:
+            wanted = [int(uid) for uid in uid_set.split(",")]
+        for seq, uid in enumerate(wanted, start=1):
+            subject = self.server.messages[uid]
+            if "HEADER.FIELDS" in items:
+                literal = f"Subject: {subject}\r\nFrom: client@example.com\r\n\r\n".encode()
+                prefix = f"* {seq} FETCH (UID {uid} FLAGS () RFC822.SIZE 100 BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)]"
+            elif "BODY.PEEK[]" in items:
+                literal = f"Subject: {subject}\r\n\r\nbody of {subject}".encode()
+                prefix = f"* {seq} FETCH (UID {uid} BODY[]<0>"
+            else:
+                self.send_line(f"* {seq} FETCH (UID {uid} FLAGS ())".encode())
+                continue
+            with self.lock:
+                self.wfile.write(f"{prefix} {{{len(literal)}}}\r\n".encode() + literal + b")\r\n")
+        self.do_ok(tag, args)
+
+
+class StubIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubIMAPHandler)
+        self.messages = {1: "First order"}
+        self.clients = []
+
+    def deliver(self, uid, subject):
+        self.messages[uid] = subject
+        for client in self.clients:
+            if client.idling:
+                client.send_line(f"* {len(self.messages)} EXISTS".encode())
+
+
+class MailIdleWorkerTest(TestCase):
+    def setUp(self):
+        self.server = StubIMAPServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        user.profile.email_integration_enabled = True
+        user.profile.save()
+        self.user = user
+        credentials = {
+            "imap_host": "127.0.0.1",
+            "imap_port": self.server.server_address[1],
+            "imap_user": "manager",
+            "imap_password": "secret",
+            "imap_use_ssl": False,
+        }
+        self.worker = MailIdleWorker(max_workers=0, credentials_for=lambda profile: (credentials, None))
+        self.addCleanup(self.worker.shutdown)
+
+    def test_new_mail_during_idle_is_synced_and_notified(self):
+        received = []
+        handler = lambda sender, **kwargs: received.append(kwargs["count"])  # noqa: E731
+        new_mail_received.connect(handler)
+        self.addCleanup(new_mail_received.disconnect, handler)
+
+        self.worker.run_once(0.05)  # первая синхронизация
+        self.worker.run_once(0.05)  # вход в IDLE
+        session = next(iter(self.worker.sessions.values()))
+        self.assertTrue(session.idling)
+        self.assertEqual(CachedEmailMessage.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.server.deliver(2, "Second order")
+        self.worker.run_once(2)
+
+        self.assertEqual(sorted(CachedEmailMessage.objects.values_list("uid", flat=True)), [1, 2])
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(received, [1])
+        self.assertFalse(session.idling)
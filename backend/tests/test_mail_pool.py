@@ -0,0 +1,65 @@
+from api.mail_pool import IMAPConnectionPool
+from django.test import SimpleTestCase
+
+CREDENTIALS = {"imap_host": "imap.example.com", "imap_port": 993, "imap_user": "user", "imap_password": "secret"}
+
+
+class FakeIMAP:
+    def __init__(self):
+        self.state = "AUTH"
+        self.alive = True
+        self.noops = 0
+
+    def noop(self):
+        self.noops += 1
+        return ("OK" if self.alive else "NO"), [b""]
+
+    def logout(self):
+        self.state = "LOGOUT"
+
+
+class IMAPConnectionPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.created = []
+
+        def connect(credentials):
+            conn = FakeIMAP()
+            self.created.append(conn)
+            return conn, None
+
+        self.pool = IMAPConnectionPool(
+            connect=connect, timeout_error_type="connection_error", max_sessions=2, acquire_timeout=0, check_interval=0
+        )
+
+    def test_reuses_released_session(self):
+        conn, error = self.pool.acquire(CREDENTIALS)
+        self.assertIsNone(error)
+        self.pool.release(CREDENTIALS, conn)
+
+        again, _ = self.pool.acquire(CREDENTIALS)
+        self.assertIs(again, conn)
+        self.assertEqual(conn.noops, 1)
+        stats = self.pool.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_dead_session_is_replaced(self):
+        conn, _ = self.pool.acquire(CREDENTIALS)
+        self.pool.release(CREDENTIALS, conn)
+        conn.alive = False
+
+        fresh, _ = self.pool.acquire(CREDENTIALS)
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(conn.state, "LOGOUT")
+        self.assertEqual(self.pool.stats()["reconnects"], 1)
+
+    def test_max_sessions_cap(self):
+        first, _ = self.pool.acquire(CREDENTIALS)
+        second, _ = self.pool.acquire(CREDENTIALS)
+        third, error = self.pool.acquire(CREDENTIALS)
+        self.assertIsNone(third)
+        self.assertEqual(error[0], "connection_error")
+
+        self.pool.release(CREDENTIALS, first, discard=True)
+        third, error = self.pool.acquire(CREDENTIALS)
+        self.assertIsNone(error)
+        self.assertEqual(len(self.created), 3)
@@ -0,0 +1,224 @@
+from datetime import timedelta
+from unittest import mock
+
+from api.mail_search import index_bodies, search_messages, select_uids
+from api.mail_sync import list_cached_messages, sync_mailbox, uid_sequence_sets, update_cached_flags
+from api.models import CustomUser, MailboxState
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+class FakeMailbox:
+    """Минимальная IMAP сессия с уже выбранной папкой: UID SEARCH/FETCH и ответы SELECT."""
+
+    def __init__(self, condstore=True):
+        self.condstore = condstore
+        self.uidvalidity = 1
+        self.modseq = 10
+        self.messages = {}  # uid -> {"flags": [...], "subject": str, "modseq": int}
+        self.commands = []
+
+    def add(self, uid, subject, flags=(), body="text"):
+        self.modseq += 1
+        self.messages[uid] = {"flags": list(flags), "subject": subject, "modseq": self.modseq, "body": body}
+
+    def set_flags(self, uid, flags):
+        self.modseq += 1
+        self.messages[uid].update(flags=list(flags), modseq=self.modseq)
+
+    def response(self, name):
+        values = {
+            "UIDVALIDITY": self.uidvalidity,
+            "UIDNEXT": max(self.messages, default=0) + 1,
+            "EXISTS": len(self.messages),
+            "HIGHESTMODSEQ": self.modseq if self.condstore else None,
+        }
+        value = values[name]
+        return name, [str(value).encode() if value is not None else None]
+
+    def uid(self, command, *args):
+        self.commands.append((command, args))
+        if command == "SEARCH":
+            criteria = args[1]
+            uids = sorted(self.messages)
+            if criteria.startswith("UID "):
+                start = int(criteria[4:].split(":")[0])
+                uids = [uid for uid in uids if uid >= start] or uids[-1:]
+            return "OK", [" ".join(map(str, uids)).encode()]
+
+        uid_set, items = args
+        if ":" in uid_set:
+            first, last = uid_set.split(":")
+            uids = [uid for uid in sorted(self.messages) if int(first) <= uid <= int(last)]
+        else:
+            uids = [int(uid) for uid in uid_set.split(",")]
+        if "CHANGEDSINCE" in items:
+            since = int(items.rsplit(" ", 1)[1].rstrip(")"))
+            uids = [uid for uid in uids if self.messages[uid]["modseq"] > since]
+
+        data = []
+        for seq, uid in enumerate(uids, start=1):
+            message = self.messages[uid]
+            flags = " ".join(message["flags"])
+            if "HEADER.FIELDS" in items:
+                headers = f"Subject: {message['subject']}\r\nFrom: a@example.com\r\n\r\n".encode()
+                data.append(
+                    (
+                        f"{seq} (UID {uid} FLAGS ({flags}) RFC822.SIZE 100 "
+                        f"BODY[HEADER.FIELDS (SUBJECT FROM TO DATE)] {{{len(headers)}}}".encode(),
+                        headers,
+                    )
+                )
+                data.append(b")")
+            elif "BODY.PEEK[]" in items:
+                raw = f"Subject: {message['subject']}\r\n\r\n{message['body']}".encode()
+                data.append((f"{seq} (UID {uid} BODY[]<0> {{{len(raw)}}}".encode(), raw))
+                data.append(b")")
+            else:
+                data.append(f"{seq} (UID {uid} FLAGS ({flags}))".encode())
+        return "OK", data
+
+
+class UidSequenceSetsTest(SimpleTestCase):
+    def test_collapses_ranges(self):
+        uids = [*range(1, 51), 72, *range(90, 121), "73"]
+        self.assertEqual(uid_sequence_sets(uids), ["1:50,72:73,90:120"])
+
+    def test_splits_long_sets(self):
+        max_length = 100
+        sets = uid_sequence_sets(range(1, 2000, 2), max_length=max_length)
+        self.assertTrue(all(len(uid_set) < max_length for uid_set in sets))
+        self.assertEqual(sum(len(uid_set.split(",")) for uid_set in sets), 1000)
+
+
+class MailSyncTest(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        self.profile = user.profile
+
+    def sync(self, mail):
+        return sync_mailbox(mail, self.profile, "INBOX", "INBOX", force=True)
+
+    def test_incremental_sync_fetches_only_new_uids(self):
+        mail = FakeMailbox()
+        mail.add(1, "first")
+        mail.add(2, "second", flags=["\\Seen"])
+        state = self.sync(mail)
+        self.assertEqual(state.highest_uid, 2)
+
+        mail.add(3, "third")
+        mail.commands.clear()
+        state = self.sync(mail)
+
+        header_fetches = [args[0] for command, args in mail.commands if command == "FETCH" and "HEADER" in args[1]]
+        self.assertEqual(header_fetches, ["3"])
+        page = list_cached_messages(state, limit=2, offset=0, ordering="-uid")
+        self.assertEqual([email["subject"] for email in page["emails"]], ["third", "second"])
+        self.assertEqual(page["total"], 3)
+
+    def test_flag_changes_and_expunge(self):
+        mail = FakeMailbox()
+        mail.add(1, "first")
+        mail.add(2, "second")
+        self.sync(mail)
+
+        mail.set_flags(1, ["\\Seen"])
+        del mail.messages[2]
+        mail.commands.clear()
+        state = self.sync(mail)
+
+        flag_fetches = [args[1] for command, args in mail.commands if command == "FETCH"]
+        self.assertIn("CHANGEDSINCE 12", flag_fetches[0])
+        self.assertEqual(list(state.messages.values_list("uid", "is_read")), [(1, True)])
+
+    def test_uidvalidity_change_resets_cache(self):
+        mail = FakeMailbox(condstore=False)
+        mail.add(5, "old")
+        self.sync(mail)
+
+        mail.uidvalidity = 2
+        mail.messages = {}
+        mail.add(1, "new")
+        state = self.sync(mail)
+        self.assertEqual(list(state.messages.values_list("uid", "subject")), [(1, "new")])
+
+    def test_concurrent_sync_is_skipped_and_stale_claim_taken_over(self):
+        mail = FakeMailbox()
+        mail.add(1, "first")
+        state = self.sync(mail)
+
+        mail.add(2, "second")
+        mail.commands.clear()
+        MailboxState.objects.filter(pk=state.pk).update(syncing_since=timezone.now())
+        state = self.sync(mail)
+        self.assertEqual(mail.commands, [])
+        self.assertEqual(state.highest_uid, 1)
+
+        MailboxState.objects.filter(pk=state.pk).update(syncing_since=timezone.now() - timedelta(hours=1))
+        state = self.sync(mail)
+        self.assertEqual(state.highest_uid, 2)
+        self.assertIsNone(MailboxState.objects.get(pk=state.pk).syncing_since)
+
+    def test_failed_sync_releases_claim(self):
+        mail = FakeMailbox()
+        mail.add(1, "first")
+        mail.uid = mock.Mock(return_value=("NO", [b""]))
+        with self.assertRaises(RuntimeError):
+            self.sync(mail)
+        self.assertIsNone(MailboxState.objects.get().syncing_since)
+
+    def test_search_index_ranks_subject_matches_higher(self):
+        mail = FakeMailbox()
+        mail.add(1, "Invoice for transport", body="Оплата по договору")
+        mail.add(2, "Question", body="Пришлите invoice за transportation груза")
+        mail.add(3, "Other", body="Ничего интересного")
+        state = self.sync(mail)
+        # Синхронизация индексирует только заголовки
+        self.assertEqual(search_messages(self.profile, "договору")["total"], 0)
+        index_bodies(mail, state)
+
+        result = search_messages(self.profile, "invoice transp")
+        self.assertEqual([email["id"] for email in result["emails"]], ["1", "2"])
+        self.assertEqual(search_messages(self.profile, "договору")["total"], 1)
+        self.assertEqual(search_messages(self.profile, "самолет")["total"], 0)
+        # Повтор слова в конце запроса не отменяет остальные слова
+        self.assertEqual(search_messages(self.profile, "invoice question invoice")["total"], 1)
+
+    def test_search_ranks_in_database_with_bounded_prefix(self):
+        mail = FakeMailbox()
+        for uid in range(1, 31):
+            mail.add(uid, f"Invoice transport{uid}")
+        self.sync(mail)
+
+        with self.assertNumQueries(5):
+            result = search_messages(self.profile, "invoice transport", limit=5, offset=5)
+        self.assertEqual(result["total"], 30)
+        self.assertEqual([email["id"] for email in result["emails"]], ["25", "24", "23", "22", "21"])
+        # Короткий префикс ищется как слово целиком
+        self.assertEqual(search_messages(self.profile, "invoice tr")["total"], 0)
+        self.assertEqual(select_uids(self.profile, "INBOX", query="transport1"), [1, *range(10, 20)])
+        # Префикс раскрывается в ограниченное число терминов
+        with mock.patch("api.mail_search.PREFIX_EXPANSION_LIMIT", 3):
+            self.assertEqual(select_uids(self.profile, "INBOX", query="transport"), [1, 10, 11])
+
+    def test_select_all_by_filter_and_cache_update(self):
+        mail = FakeMailbox()
+        for uid in range(1, 6):
+            mail.add(uid, f"Order {uid}")
+        mail.set_flags(2, ["\\Seen"])
+        self.sync(mail)
+
+        unread = select_uids(self.profile, "INBOX", is_read=False, exclude=["4"])
+        self.assertEqual(unread, [1, 3, 5])
+
+        update_cached_flags(self.profile, "INBOX", unread, ["\\Seen"], True)
+        self.assertEqual(select_uids(self.profile, "INBOX", is_read=False), [4])
+
+    def test_select_all_rejects_malformed_filter(self):
+        api = APIClient()
+        api.force_authenticate(self.profile.user)
+        for value in ("unread", ["q"], {"q": 5}):
+            data = {"action": "mark_read", "select_all": True, "filter": value}
+            response = api.post("/api/email/messages/action/", data, format="json")
+            self.assertEqual(response.status_code, 400)
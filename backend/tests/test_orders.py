@@ -0,0 +1,161 @@
+from datetime import timedelta
+from unittest import mock
+
+from api.management.commands.audit_query_plans import full_scans
+from api.models import Carrier, CarrierContact, Client, CustomUser, Notification, Order
+from api.serializers import OrderSerializer
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+class OrderListQueriesTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_orders(self, count):
+        for index in range(count):
+            client = Client.objects.create(company_name=f"Клиент {index}")
+            carrier = Carrier.objects.create(company_name=f"Перевозчик {index}")
+            CarrierContact.objects.create(carrier=carrier, name="Иван", email="ivan@example.com")
+            CarrierContact.objects.create(carrier=carrier, name="Петр", contact_type="director")
+            Order.objects.create(client=client, carrier=carrier, created_by=self.user)
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/orders/")
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.create_orders(1)
+        data, single = self.list_queries()
+        self.assertEqual(len(data["results"][0]["carrier_details"]["contacts"]), 2)
+
+        self.create_orders(9)
+        data, page = self.list_queries()
+        self.assertEqual(len(data["results"]), 10)
+        self.assertEqual(page, single)
+
+    def test_list_profile_limits_fields_and_columns(self):
+        self.create_orders(2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get("/api/orders/", {"profile": "list"})
+        row = response.json()["results"][0]
+        self.assertEqual(set(row), set(OrderSerializer.FIELD_PROFILES["list"]))
+        self.assertEqual(row["client"]["company_name"], "Клиент 1")
+        select = next(query["sql"] for query in queries.captured_queries if 'FROM "api_order"' in query["sql"])
+        self.assertNotIn('"api_order"."route"', select)
+        self.assertFalse(any("api_carriercontact" in query["sql"] for query in queries.captured_queries))
+
+    def test_fields_and_exclude(self):
+        self.create_orders(1)
+        row = self.api.get("/api/orders/", {"fields": "status,carrier_details"}).json()["results"][0]
+        self.assertEqual(set(row), {"id", "status", "carrier_details"})
+        self.assertEqual(len(row["carrier_details"]["contacts"]), 2)
+
+        row = self.api.get("/api/orders/", {"exclude": "carrier_details,created_by"}).json()["results"][0]
+        self.assertNotIn("carrier_details", row)
+        self.assertIn("contract_number", row)
+
+        self.assertEqual(self.api.get("/api/orders/", {"profile": "unknown"}).status_code, 400)
+
+    def test_duplicate_contract_number_is_rejected_by_unique_index(self):
+        self.assertEqual(self.api.post("/api/orders/", {"contract_number": "D-1"}).status_code, 201)
+        response = self.api.post("/api/orders/", {"contract_number": "D-1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Договор с таким номером уже существует")
+
+        self.assertEqual(self.api.post("/api/orders/", {"contract_number": ""}).status_code, 201)
+        self.assertEqual(self.api.post("/api/orders/", {"contract_number": ""}).status_code, 201)
+        self.assertEqual(Order.objects.filter(contract_number=None).count(), 2)
+
+    def test_other_integrity_errors_are_not_reported_as_duplicate_contract(self):
+        order = Order.objects.create(created_by=self.user, contract_number="D-2")
+        with mock.patch.object(Order, "save", side_effect=IntegrityError("FOREIGN KEY constraint failed")):
+            response = self.api.post("/api/orders/", {"contract_number": "D-3"})
+            self.assertEqual(response.status_code, 400)
+            self.assertNotEqual(response.json()["error"], "Договор с таким номером уже существует")
+            with self.assertRaises(IntegrityError):
+                self.api.patch(f"/api/orders/{order.pk}/", {"contract_number": "D-4"})
+
+        Order.objects.create(created_by=self.user, contract_number="D-5")
+        response = self.api.patch(f"/api/orders/{order.pk}/", {"contract_number": "D-5"})
+        self.assertEqual(response.json()["error"], "Договор с таким номером уже существует")
+
+    def test_csv_export_streams_filtered_rows(self):
+        self.create_orders(2)
+        Order.objects.create(created_by=self.user, status="completed", contract_number="D-7")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(
+                "/api/orders/export_orders_csv/", {"status": "completed", "columns": "contract_number,client"}
+            )
+            content = b"".join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), ["Contract Number,Client", "D-7,"])
+        self.assertEqual(len(queries), 1)
+
+        response = self.api.get("/api/orders/export_orders_csv/", {"columns": "password"})
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        self.api = APIClient()
+        self.api.force_authenticate(user)
+        now = timezone.now()
+        for index in range(5):
+            order = Order.objects.create(created_by=user)
+            # Попарно одинаковое время создания: внутри пары порядок держится на id
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=index // 2))
+        self.expected = list(Order.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+
+    def walk(self, url, params, link):
+        pages = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.api.get(url, params).json()
+            self.assertFalse(any("OFFSET" in query["sql"] for query in queries.captured_queries))
+            pages.append(data)
+            url, params = data[link], None
+        return pages
+
+    def test_forward_and_backward(self):
+        pages = self.walk("/api/orders/", {"cursor": "", "page_size": 2, "count": 1}, "next")
+        self.assertEqual([row["id"] for page in pages for row in page["results"]], self.expected)
+        self.assertEqual([page["count"] for page in pages], [5, 5, 5])
+        self.assertIsNone(pages[0]["previous"])
+
+        back = self.walk(pages[-1]["previous"], None, "previous")
+        self.assertEqual([row["id"] for page in reversed(back) for row in page["results"]], self.expected[:4])
+
+    def test_default_and_invalid_cursor(self):
+        self.assertEqual(self.api.get("/api/orders/").json()["count"], 5)
+        self.assertEqual(self.api.get("/api/orders/", {"cursor": "broken"}).status_code, 404)
+        for value in ("0", "false"):
+            self.assertNotIn("count", self.api.get("/api/orders/", {"cursor": "", "count": value}).json())
+        self.assertEqual(self.api.get("/api/orders/", {"cursor": "", "count": "true"}).json()["count"], 5)
+
+    def test_notifications_page_by_sent_at(self):
+        user = CustomUser.objects.get()
+        for index in range(3):
+            Notification.objects.create(user=user, message=f"Уведомление {index}")
+        data = self.api.get("/api/notifications/", {"cursor": "", "page_size": 2}).json()
+        self.assertEqual(len(data["results"]), 2)
+        self.assertEqual(len(self.api.get(data["next"]).json()["results"]), 1)
+
+
+class QueryPlanAuditTest(SimpleTestCase):
+    def test_full_scans_in_mysql_sqlite_and_postgresql_plans(self):
+        mysql = (
+            "1 SIMPLE api_order None ALL None None None None 1200 10.0 Using where; Using filesort\n"
+            "1 SIMPLE api_client None ref api_client_created_by_id api_client_created_by_id 9 const 3 100.0 None"
+        )
+        self.assertEqual(full_scans(mysql), [mysql.splitlines()[0]])
+        self.assertEqual(len(full_scans("1 SIMPLE api_order ALL NULL NULL NULL NULL 1200 Using where")), 1)
+        self.assertEqual(len(full_scans("SCAN api_order\nSEARCH api_client USING INDEX idx (created_by_id=?)")), 1)
+        self.assertEqual(len(full_scans("Seq Scan on api_order  (cost=0.00..35.50 rows=10 width=4)")), 1)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from unittest import mock
+
+from api.models import CustomUser, OutgoingEmail
+from api.outbox import claim_batch, deliver, enqueue_bulk, enqueue_email, process_outbox
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+
+class SerialExecutor:
+    map = staticmethod(map)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BASE_DELAY=30, OUTBOX_CLAIM_TIMEOUT=600)
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="manager@example.com", username="manager", password="x")
+        self.outgoing = enqueue_email(self.user, "client@example.com", "Счет", "<p>Добрый день</p>", ["3"])
+
+    def test_claim_is_exclusive(self):
+        self.assertEqual([item.id for item in claim_batch(10)], [self.outgoing.id])
+        self.assertEqual(claim_batch(10), [])
+
+        self.outgoing.refresh_from_db()
+        self.assertEqual((self.outgoing.status, self.outgoing.attempts), (OutgoingEmail.Statuses.SENDING, 1))
+
+    def test_stale_claim_is_taken_again(self):
+        claim_batch(10)
+        OutgoingEmail.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim_batch(10)), 1)
+
+    @mock.patch("api.outbox.send_email", return_value=(False, ("connection_error", "timeout")))
+    def test_retry_with_backoff_then_fail(self, send_email):
+        (outgoing,) = claim_batch(10)
+        self.assertFalse(deliver(outgoing))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, OutgoingEmail.Statuses.QUEUED)
+        self.assertGreater(outgoing.next_attempt_at, timezone.now() + timedelta(seconds=20))
+        send_email.assert_called_once_with(
+            self.user,
+            to="client@example.com",
+            subject="Счет",
+            body="<p>Добрый день</p>",
+            documents=[3],
+            attachment_cache=None,
+        )
+
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+        (outgoing,) = claim_batch(10)
+        deliver(outgoing)
+        outgoing.refresh_from_db()
+        self.assertEqual((outgoing.status, outgoing.attempts), (OutgoingEmail.Statuses.FAILED, 2))
+        self.assertEqual(outgoing.last_error, "timeout")
+
+    @mock.patch("api.outbox.send_email", return_value=(True, None))
+    def test_successful_delivery(self, send_email):
+        (outgoing,) = claim_batch(10)
+        self.assertTrue(deliver(outgoing))
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, OutgoingEmail.Statuses.SENT)
+        self.assertIsNotNone(outgoing.sent_at)
+
+    @mock.patch("api.outbox.send_email", return_value=(True, None))
+    def test_bulk_batch_is_sent_per_sender_with_shared_attachments(self, send_email):
+        batch_id, outgoing = enqueue_bulk(self.user, ["a@example.com", "b@example.com"], "Заявка", "<p>Текст</p>", [5])
+        self.assertEqual(len(outgoing), 2)
+
+        self.assertEqual(process_outbox(SerialExecutor(), batch_size=10), 3)
+        recipients = [call.kwargs["to"] for call in send_email.call_args_list]
+        self.assertEqual(recipients, ["client@example.com", "a@example.com", "b@example.com"])
+        caches = {id(call.kwargs["attachment_cache"]) for call in send_email.call_args_list}
+        self.assertEqual(len(caches), 1)
+        self.assertEqual(OutgoingEmail.objects.filter(batch_id=batch_id, status=OutgoingEmail.Statuses.SENT).count(), 2)
+
+    def test_invalid_document_ids_are_rejected(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        message = {"to": "client@example.com", "subject": "Счет", "content": "Текст", "documents[]": ["3", "abc"]}
+        response = api.post("/api/email/messages/send/", message)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "Некорректные ID документов")
+
+        bulk = {"recipients": ["a@example.com"], "subject": "Заявка", "content": "Текст", "documents": "5"}
+        self.assertEqual(api.post("/api/email/messages/bulk-send/", bulk, format="json").status_code, 400)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
@@ -108,6 +108,20 @@ export const documentsApi = {
   download: (id) => api.get(`/documents/${id}/?download=true`, { responseType: 'blob' }),
 };
 
+export const importsApi = {
+  getStatus: (id) => api.get(`/imports/${id}/`),
+  // Импорт выполняется на сервере в фоне: опрашиваем статус задачи, пока она не завершится
+  waitForCompletion: async (id, interval = 2000) => {
+    for (;;) {
+      const { data } = await api.get(`/imports/${id}/`);
+      if (data.status === 'done' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+  },
+};
+
 export const siteRequestsApi = {
   getAll: () => api.get('site-requests/requests/'),
   process: (id) => api.post(`site-requests/requests/${id}/process/`),
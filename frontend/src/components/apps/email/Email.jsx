@@ -14,12 +14,30 @@ import { styled } from '@mui/material/styles';
 import MarkunreadIcon from '@mui/icons-material/Markunread';
 import { useEmail } from '../../../contexts/EmailContext';
 
-const mailboxes = [
+const DEFAULT_MAILBOXES = [
   { name: 'INBOX', label: 'Входящие', icon: <InboxIcon fontSize="small" /> },
   { name: 'INBOX.Sent', label: 'Отправленные', icon: <SendIcon fontSize="small" /> }, 
   { name: 'INBOX.Trash', label: 'Корзина', icon: <DeleteSweepIcon fontSize="small" /> },
 ];
 
+// Папки специального назначения (SPECIAL-USE) показываем с привычными подписями и иконками
+const SPECIAL_USE_MAILBOXES = {
+  '\\sent': { label: 'Отправленные', icon: <SendIcon fontSize="small" /> },
+  '\\trash': { label: 'Корзина', icon: <DeleteSweepIcon fontSize="small" /> },
+};
+
+const toSidebarMailbox = (mailbox) => {
+  if (mailbox.name === 'INBOX') {
+    return DEFAULT_MAILBOXES[0];
+  }
+  const special = SPECIAL_USE_MAILBOXES[mailbox.special_use];
+  return {
+    name: mailbox.name,
+    label: special ? special.label : mailbox.display_name,
+    icon: special ? special.icon : <MarkunreadIcon fontSize="small" />,
+  };
+};
+
 const StyledListItemText = styled(ListItemText)({
     '& .MuiListItemText-primary': {
         fontWeight: 'normal',
@@ -66,6 +84,7 @@ const Email = () => {
   const [selectedEmailIds, setSelectedEmailIds] = useState(new Set());
   const [actionLoading, setActionLoading] = useState(false);
   const [selectedMailbox, setSelectedMailbox] = useState('INBOX');
+  const [mailboxes, setMailboxes] = useState(DEFAULT_MAILBOXES);
   const [hoveredEmailId, setHoveredEmailId] = useState(null);
   const [currentOffset, setCurrentOffset] = useState(0);
   const [totalEmails, setTotalEmails] = useState(0);
@@ -74,6 +93,18 @@ const Email = () => {
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
   const listRef = useRef(null);
 
+  useEffect(() => {
+    // Список папок кэшируется на сервере, при ошибке остаются папки по умолчанию
+    api.get('/email/mailboxes/')
+      .then((response) => {
+        const list = response.data?.mailboxes;
+        if (Array.isArray(list) && list.length > 0) {
+          setMailboxes(list.map(toSidebarMailbox));
+        }
+      })
+      .catch((err) => console.warn('Не удалось загрузить список папок:', err));
+  }, []);
+
   useEffect(() => {
     if (selectedMailbox) {
       setLoading(true);
@@ -172,7 +203,7 @@ const Email = () => {
       const limitToFetch = 25;
       try {
           console.log(`Обновление писем: mailbox=${selectedMailbox}, limit=${limitToFetch}, offset=${offsetToFetch}`);
-          const response = await api.get(`/email/messages/?mailbox=${encodeURIComponent(selectedMailbox)}&limit=${limitToFetch}&offset=${offsetToFetch}`);
+          const response = await api.get(`/email/messages/?mailbox=${encodeURIComponent(selectedMailbox)}&limit=${limitToFetch}&offset=${offsetToFetch}&refresh=1`);
           const fetchedEmails = response.data.emails || [];
           const totalCount = response.data.total_count || 0;
           console.log(`Обновлено писем: ${fetchedEmails.length}, всего: ${totalCount}`);
@@ -13,6 +13,32 @@ import api from '../../../api';
 const EmailView = ({ email, onActionComplete, onCloseView, onReply, onReplyAll, onForward }) => {
   const [actionLoading, setActionLoading] = React.useState(false);
   const [actionError, setActionError] = React.useState('');
+  const [details, setDetails] = React.useState(null);
+  const [detailsLoading, setDetailsLoading] = React.useState(false);
+
+  // Список писем приходит без тела - загружаем его только при открытии письма
+  React.useEffect(() => {
+    setDetails(null);
+    if (!email || email.body !== undefined) {
+      return undefined;
+    }
+    let cancelled = false;
+    setDetailsLoading(true);
+    api.get(`/email/messages/${email.id}/`, { params: { mailbox: email.mailbox || 'INBOX' } })
+      .then((response) => {
+        if (!cancelled) setDetails(response.data);
+      })
+      .catch((err) => {
+        console.error('Ошибка при загрузке письма:', err);
+        if (!cancelled) setActionError(`Не удалось загрузить письмо. ${err.response?.data?.error || 'Попробуйте позже.'}`);
+      })
+      .finally(() => {
+        if (!cancelled) setDetailsLoading(false);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [email?.id, email?.mailbox]);
 
   // Если email не передан, ничего не рендерим
   if (!email) {
@@ -56,8 +82,9 @@ const EmailView = ({ email, onActionComplete, onCloseView, onReply, onReplyAll,
   };
 
   // Определяем содержимое письма
-  const bodyContent = email.body || '';
-  const isHtml = Boolean(email.is_html);
+  const message = details ? { ...email, ...details } : email;
+  const bodyContent = message.body || '';
+  const isHtml = Boolean(message.is_html);
 
   return (
     // Используем Box вместо Dialog
@@ -136,7 +163,11 @@ const EmailView = ({ email, onActionComplete, onCloseView, onReply, onReplyAll,
           </Box>
         )}
 
-        {bodyContent ? (
+        {detailsLoading ? (
+          <Box sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
+            <CircularProgress size={24} />
+          </Box>
+        ) : bodyContent ? (
           isHtml ? (
             <Box 
               sx={{ 
@@ -158,13 +189,13 @@ const EmailView = ({ email, onActionComplete, onCloseView, onReply, onReplyAll,
         )}
 
         {/* Вложения */} 
-        {email.attachments && email.attachments.length > 0 && (
+        {message.attachments && message.attachments.length > 0 && (
           <Box sx={{ mt: 3, pt: 2, borderTop: 1, borderColor: 'divider' }}>
             <Typography variant="subtitle1" gutterBottom>
-              Вложения ({email.attachments.length})
+              Вложения ({message.attachments.length})
             </Typography>
             <List dense>
-              {email.attachments.map((att, index) => (
+              {message.attachments.map((att, index) => (
                 <ListItem key={index} disableGutters>
                   <ListItemIcon sx={{ minWidth: 'auto', mr: 1 }}>
                     <AttachmentIcon fontSize="small" />
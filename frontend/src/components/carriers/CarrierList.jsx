@@ -153,8 +153,8 @@ const CarrierList = ({ carriers, onDelete, onAdd, onExport, onImport, onApplyFil
   const handleFileChange = (event) => {
     const file = event.target.files[0];
     if (!file) return;
-    if (!file.name.endsWith('.xlsx') && !file.name.endsWith('.xls')) {
-      setImportError('Пожалуйста, выберите файл Excel (.xlsx или .xls)');
+    if (!file.name.endsWith('.xlsx') && !file.name.endsWith('.csv')) {
+      setImportError('Пожалуйста, выберите файл Excel (.xlsx) или CSV (.csv)');
       return;
     }
     setImportError(null);
@@ -316,7 +316,7 @@ const CarrierList = ({ carriers, onDelete, onAdd, onExport, onImport, onApplyFil
             type="file"
             ref={fileInputRef}
             onChange={handleFileChange}
-            accept=".xlsx,.xls"
+            accept=".xlsx,.csv"
             style={{ display: 'none' }}
           />
           <IconButton
@@ -195,8 +195,8 @@ const ClientList = ({ onDelete, onAdd, onExport, onImport, onApplyFilters, loadi
   const handleFileChange = (event) => {
     const file = event.target.files[0];
     if (!file) return;
-    if (!file.name.endsWith('.xlsx') && !file.name.endsWith('.xls')) {
-      setImportError('Пожалуйста, выберите файл Excel (.xlsx или .xls)');
+    if (!file.name.endsWith('.xlsx') && !file.name.endsWith('.csv')) {
+      setImportError('Пожалуйста, выберите файл Excel (.xlsx) или CSV (.csv)');
       return;
     }
     setImportError(null);
@@ -231,7 +231,7 @@ const ClientList = ({ onDelete, onAdd, onExport, onImport, onApplyFilters, loadi
             type="file"
             ref={fileInputRef}
             onChange={handleFileChange}
-            accept=".xlsx,.xls"
+            accept=".xlsx,.csv"
             style={{ display: 'none' }}
           />
           <IconButton
@@ -16,6 +16,7 @@ import {
   Card,
   CardContent,
   CircularProgress,
+  MenuItem,
 } from '@mui/material';
 import {
   TrendingUp as TrendingUpIcon,
@@ -25,6 +26,13 @@ import {
 } from '@mui/icons-material';
 import api from '../../api/api';
 
+const BREAKDOWN_GROUPS = [
+  { value: 'client', label: 'Клиент' },
+  { value: 'carrier', label: 'Перевозчик' },
+  { value: 'transport_type', label: 'Тип транспорта' },
+  { value: 'route', label: 'Маршрут' },
+];
+
 const FinancialReport = () => {
   const [startDate, setStartDate] = useState('');
   const [endDate, setEndDate] = useState('');
@@ -32,6 +40,8 @@ const FinancialReport = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
+  const [groupBy, setGroupBy] = useState('client');
+  const [breakdown, setBreakdown] = useState(null);
 
   const validateDate = (date) => {
     return date && !isNaN(Date.parse(date));
@@ -65,14 +75,50 @@ const FinancialReport = () => {
         },
       });
       setReport(response.data);
+      await loadBreakdown(groupBy);
       setSuccess('Отчет успешно сгенерирован');
     } catch (error) {
-      setError(error.response?.data?.message || 'Произошла ошибка при генерации отчета');
+      setError(
+        error.response?.data?.error ||
+          error.response?.data?.message ||
+          'Произошла ошибка при генерации отчета'
+      );
     } finally {
       setLoading(false);
     }
   };
 
+  const loadBreakdown = async (group) => {
+    const response = await api.get('finance/breakdown/', {
+      params: {
+        start_date: startDate,
+        end_date: endDate,
+        group_by: group,
+      },
+    });
+    setBreakdown(response.data);
+  };
+
+  const handleGroupByChange = async (event) => {
+    const group = event.target.value;
+    setGroupBy(group);
+    try {
+      await loadBreakdown(group);
+    } catch (error) {
+      setError(error.response?.data?.error || 'Не удалось загрузить разбивку');
+    }
+  };
+
+  const BreakdownRow = ({ label, row }) => (
+    <TableRow>
+      <TableCell>{label}</TableCell>
+      <TableCell align="right">{row.orders}</TableCell>
+      <TableCell align="right">{row.revenue.toLocaleString()}</TableCell>
+      <TableCell align="right">{row.profit.toLocaleString()}</TableCell>
+      <TableCell align="right">{row.margin}%</TableCell>
+    </TableRow>
+  );
+
   const StatCard = ({ title, value, icon, trend }) => (
     <Card>
       <CardContent>
@@ -218,6 +264,52 @@ const FinancialReport = () => {
               </TableBody>
             </Table>
           </TableContainer>
+
+          {breakdown && (
+            <Paper sx={{ p: 2, mt: 3 }}>
+              <Box sx={{ display: 'flex', alignItems: 'center', justifyContent: 'space-between', mb: 2 }}>
+                <Typography variant="h6">Маржинальность ({breakdown.currency})</Typography>
+                <TextField
+                  select
+                  size="small"
+                  label="Группировка"
+                  value={groupBy}
+                  onChange={handleGroupByChange}
+                  sx={{ minWidth: 200 }}
+                >
+                  {BREAKDOWN_GROUPS.map((group) => (
+                    <MenuItem key={group.value} value={group.value}>
+                      {group.label}
+                    </MenuItem>
+                  ))}
+                </TextField>
+              </Box>
+              <TableContainer>
+                <Table size="small">
+                  <TableHead>
+                    <TableRow>
+                      <TableCell>
+                        {BREAKDOWN_GROUPS.find((group) => group.value === breakdown.group_by)?.label}
+                      </TableCell>
+                      <TableCell align="right">Заказов</TableCell>
+                      <TableCell align="right">Выручка</TableCell>
+                      <TableCell align="right">Прибыль</TableCell>
+                      <TableCell align="right">Маржа</TableCell>
+                    </TableRow>
+                  </TableHead>
+                  <TableBody>
+                    {breakdown.items.map((item) => (
+                      <BreakdownRow key={item.key ?? 'none'} label={item.label} row={item} />
+                    ))}
+                    {breakdown.other && (
+                      <BreakdownRow label={`Прочие (${breakdown.other.groups})`} row={breakdown.other} />
+                    )}
+                    <BreakdownRow label={<strong>Итого</strong>} row={breakdown.total} />
+                  </TableBody>
+                </Table>
+              </TableContainer>
+            </Paper>
+          )}
         </>
       )}
     </Box>
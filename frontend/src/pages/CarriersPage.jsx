@@ -22,7 +22,7 @@ import api from '../api/api';
 import CarrierForm from '../components/carriers/CarrierForm';
 import DataTable from '../components/common/DataTable';
 import CarrierCard from '../components/carriers/CarrierCard';
-import { carriersApi } from '../api/api';
+import { carriersApi, importsApi } from '../api/api';
 import CarrierList from '../components/carriers/CarrierList';
 
 const CarriersPage = () => {
@@ -102,8 +102,14 @@ const CarriersPage = () => {
 
   const handleImport = async (file) => {
     try {
-      await carriersApi.importExcel(file);
-      setSuccess('Данные успешно импортированы');
+      const { data } = await carriersApi.importExcel(file);
+      setSuccess('Файл загружен, импорт выполняется...');
+      const job = await importsApi.waitForCompletion(data.id);
+      if (job.status === 'failed') {
+        setError(`Ошибка при импорте данных: ${job.last_error}`);
+        return;
+      }
+      setSuccess(`Импорт завершен: создано ${job.created}, дубликатов ${job.duplicates}, пропущено ${job.skipped}`);
       fetchCarriers();
     } catch (err) {
       setError('Ошибка при импорте данных');
@@ -14,7 +14,7 @@ import {
 import { Add as AddIcon } from '@mui/icons-material';
 import api from '../api/api';
 import ClientList from '../components/clients/ClientList';
-import { clientsApi } from '../api/api';
+import { clientsApi, importsApi } from '../api/api';
 
 const ClientsPage = () => {
   const [clients, setClients] = useState([]);
@@ -83,8 +83,14 @@ const ClientsPage = () => {
 
   const handleImport = async (file) => {
     try {
-      await clientsApi.importExcel(file);
-      setSuccess('Данные успешно импортированы');
+      const { data } = await clientsApi.importExcel(file);
+      setSuccess('Файл загружен, импорт выполняется...');
+      const job = await importsApi.waitForCompletion(data.id);
+      if (job.status === 'failed') {
+        setError(`Ошибка при импорте данных: ${job.last_error}`);
+        return;
+      }
+      setSuccess(`Импорт завершен: создано ${job.created}, дубликатов ${job.duplicates}, пропущено ${job.skipped}`);
       fetchClients();
     } catch (err) {
       setError('Ошибка при импорте данных');
@@ -110,7 +110,8 @@ const OrdersPage = () => {
   const fetchOrders = useCallback(async () => {
     try {
       setLoading(true);
-      const response = await api.get('/orders/');
+      // Таблице нужны только ее колонки, полная карточка загружается при просмотре
+      const response = await api.get('/orders/', { params: { profile: 'list' } });
       if (Array.isArray(response.data)) {
         setOrders(response.data);
       } else if (response.data && Array.isArray(response.data.results)) {
@@ -454,13 +455,13 @@ const OrdersPage = () => {
     ]
   };
 
-  const handleViewDetails = (orderId) => {
-    const orderToShow = orders.find(order => order.id === orderId);
-    if (orderToShow) {
-      setSelectedOrderForCard(orderToShow);
+  const handleViewDetails = async (orderId) => {
+    try {
+      const response = await api.get(`/orders/${orderId}/`);
+      setSelectedOrderForCard(response.data);
       setIsOrderCardOpen(true);
-    } else {
-      console.error('Заказ для просмотра не найден:', orderId);
+    } catch (error) {
+      console.error('Заказ для просмотра не найден:', orderId, error);
       setError('Не удалось найти заказ для просмотра.')
     }
   };